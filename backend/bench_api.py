@@ -0,0 +1,371 @@
+"""
+Load test of the real app, in-process, against a seeded database, plus
+micro-benchmarks of elo and the image pipeline.
+
+    DATABASE_URL=sqlite:///bench.db python bench_api.py --users 2000 --requests 500
+    python bench_api.py --json before.json
+    python bench_api.py --json after.json --baseline before.json
+
+Seeds bench_user_* users, stores, a follow graph, items and comparisons on
+the first run against a database (use a fresh DATABASE_URL to change the
+scale). For every endpoint it reports p50/p99 latency, throughput and SQL
+statements per request; --json writes one object to diff between runs.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+import httpx
+from sqlalchemy import insert, select
+from main import app, image_pipeline, geocode_worker
+import models
+import migrate
+import elo
+import geo
+import images
+import passwords
+import scores
+import stores
+import timeline
+import tokens
+from db import SessionLocal, engine, count_queries
+
+PASSWORD = "bench"
+
+
+class NullUploader:
+    """Accepts every upload without storing it, so POST /items measures the app and not the network."""
+
+    def upload(self, data: bytes, public_id: str, ext: str = "jpg") -> str:
+        return f"bench://{public_id}.{ext}"
+
+
+def log(*args):
+    # Progress goes to stderr, so `--json -` output stays parseable
+    print(*args, file=sys.stderr)
+
+
+# --- Seeding ---
+def seed(users: int, n_stores: int, follows: int, items: int, comparisons: int, seed_value: int = 0):
+    """Create the synthetic data set unless it is already there. Returns (user_ids, store_names)."""
+    db = SessionLocal()
+    try:
+        existing = db.execute(
+            select(models.User.id).where(models.User.username.like("bench_user_%")).order_by(models.User.id)
+        ).scalars().all()
+        if existing:
+            log(f"Using the {len(existing)} existing bench users")
+            names = db.execute(
+                select(models.Store.name).where(models.Store.name.like("Bench Store %"))
+            ).scalars().all()
+            return existing, names
+
+        rng = random.Random(seed_value)
+        start = time.perf_counter()
+        # One argon2 hash shared by every user; /auth then measures verification
+        password_hash = passwords.pwd_context().hash(PASSWORD)
+        user_ids = db.execute(
+            insert(models.User).returning(models.User.id),
+            [{"username": f"bench_user_{i}", "password_hash": password_hash} for i in range(users)],
+        ).scalars().all()
+
+        store_types = [t.value for t in models.StoreType]
+        names = [f"Bench Store {i}" for i in range(n_stores)]
+        store_ids, _ = stores.get_or_create_many(db, [(name, rng.choice(store_types)) for name in names])
+        store_ids = sorted(store_ids.values())
+
+        edges = set()
+        for follower in user_ids:
+            picked = [u for u in rng.sample(user_ids, min(follows + 1, len(user_ids))) if u != follower]
+            edges.update((follower, followed) for followed in picked[:follows])
+        if edges:
+            db.execute(
+                insert(models.follows), [{"follower_id": a, "followed_id": b} for a, b in sorted(edges)]
+            )
+
+        now = datetime.now(timezone.utc)
+        rows = []
+        for user_id in user_ids:
+            for _ in range(items):
+                lat, lon = 51.5 + rng.uniform(-0.2, 0.2), -0.12 + rng.uniform(-0.3, 0.3)
+                rows.append({
+                    "user_id": user_id,
+                    "store_id": rng.choice(store_ids),
+                    "image_path": "bench://seed.jpg",
+                    "image_status": images.READY,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "geohash": geo.encode(lat, lon),
+                    "rating": rng.randint(1, 5),
+                    "created_at": now - timedelta(seconds=rng.uniform(0, 30 * 86400)),
+                })
+        for offset in range(0, len(rows), 5000):
+            db.execute(insert(models.Item), rows[offset:offset + 5000])
+        timeline.rebuild(db)
+
+        events = []
+        for user_id in user_ids:
+            for _ in range(comparisons):
+                winner, loser = rng.sample(store_ids, 2)
+                events.append({"user_id": user_id, "winner_store_id": winner, "loser_store_id": loser})
+        for offset in range(0, len(events), 5000):
+            db.execute(insert(models.Comparison), events[offset:offset + 5000])
+        scores.recompute(db)
+        db.commit()
+        log(f"Seeded {users} users, {n_stores} stores, {len(edges)} follows, {len(rows)} items and "
+            f"{len(events)} comparisons in {time.perf_counter() - start:.1f}s")
+        return user_ids, names
+    finally:
+        db.close()
+
+
+# --- Load test ---
+def percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+def sample_jpeg(width: int = 1200, height: int = 900) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (180, 60, 40)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def scenarios(user_ids, store_names, rng: random.Random):
+    """{name: fn(i) -> (method, url, request kwargs)} for the endpoints under test."""
+    store_ids = {}
+    db = SessionLocal()
+    try:
+        store_ids = dict(db.execute(select(models.Store.name, models.Store.id)).all())
+    finally:
+        db.close()
+    store_list = [store_ids[name] for name in store_names]
+    headers = {
+        user_id: {"Authorization": f"Bearer {tokens.issue_token(user_id, f'bench_user_{i}')}"}
+        for i, user_id in enumerate(user_ids)
+    }
+    photo = sample_jpeg()
+
+    def feed(i):
+        return "GET", "/items", {"params": {"limit": 20}}
+
+    def friends_feed(i):
+        return "GET", "/items/friends", {"params": {"limit": 20}, "headers": headers[rng.choice(user_ids)]}
+
+    def compare(i):
+        winner, loser = rng.sample(store_list, 2)
+        return "POST", "/compare_store", {"json": {
+            "user_id": rng.choice(user_ids), "winner_store_id": winner, "loser_store_id": loser,
+        }}
+
+    def rankings(i):
+        return "GET", "/store_rankings", {"params": {"user_id": rng.choice(user_ids)}}
+
+    def auth(i):
+        index = rng.randrange(len(user_ids))
+        return "POST", "/auth", {"json": {"username": f"bench_user_{index}", "password": PASSWORD}}
+
+    def create_item(i):
+        # Trailing bytes give every upload its own content hash, so none is deduplicated
+        return "POST", "/items", {
+            "data": {
+                "user_id": rng.choice(user_ids),
+                "store_name": rng.choice(store_names),
+                "store_type": "high_street_chain",
+                "rating": 4,
+            },
+            "files": {"image": ("bench.jpg", photo + i.to_bytes(8, "big"), "image/jpeg")},
+        }
+
+    return {
+        "GET /items": feed,
+        "GET /items/friends": friends_feed,
+        "POST /compare_store": compare,
+        "GET /store_rankings": rankings,
+        "POST /auth": auth,
+        "POST /items": create_item,
+    }
+
+
+async def load(client, make_request, requests: int, concurrency: int, warmup: int):
+    """Run `requests` requests, `concurrency` at a time. Returns the summary dict."""
+    for i in range(warmup):
+        method, url, kwargs = make_request(i)
+        await client.request(method, url, **kwargs)
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        method, url, kwargs = make_request(warmup + i)
+        async with limit:
+            # Each task has its own context, so the count is this request's alone
+            with count_queries() as queries:
+                start = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, queries[0]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(elapsed for status, elapsed, _ in results if status < 400)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": requests,
+        "errors": requests - len(latencies),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "queries_per_request": round(statistics.fmean(q for _, _, q in results), 2),
+    }
+
+
+async def run_load(args, user_ids, store_names):
+    rng = random.Random(args.seed)
+    selected = scenarios(user_ids, store_names, rng)
+    if args.only:
+        selected = {name: fn for name, fn in selected.items() if any(o in name for o in args.only)}
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, make_request in selected.items():
+            # argon2 is deliberately slow; a full run of logins would dominate the suite
+            requests = min(args.requests, args.auth_requests) if name == "POST /auth" else args.requests
+            results[name] = await load(client, make_request, requests, args.concurrency, args.warmup)
+            log(f"{name:<22} done")
+    return results
+
+
+# --- Micro-benchmarks ---
+def micro_benchmarks(image_runs: int):
+    results = {}
+
+    number = 200_000
+    seconds = min(timeit.repeat(lambda: elo.calculate_elo(1250.0, 1180.0), number=number, repeat=5))
+    results["elo.calculate_elo"] = {"ns_per_call": round(seconds / number * 1e9, 1)}
+
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    n, users, n_stores = 200_000, 2_000, 50
+    user = rng.integers(0, users, n)
+    winner = rng.integers(0, n_stores, n)
+    loser = (winner + rng.integers(1, n_stores, n)) % n_stores
+    start = time.perf_counter()
+    elo.replay(user, user * n_stores + winner, user * n_stores + loser, users * n_stores)
+    results["elo.replay"] = {
+        "comparisons": n, "seconds": round(time.perf_counter() - start, 4),
+    }
+
+    # A phone-sized photo, as the pipeline sees most uploads
+    photo = sample_jpeg(4000, 3000)
+    for name, fn in [
+        ("images.is_image", lambda: images.is_image(photo)),
+        ("images.process_image", lambda: images.process_image(photo)),
+        ("images.process_image (webp)", lambda: images.process_image(photo, webp=True)),
+    ]:
+        timings = []
+        for _ in range(image_runs):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "runs": image_runs,
+            "median_ms": round(statistics.median(timings) * 1000, 2),
+            "min_ms": round(min(timings) * 1000, 2),
+        }
+    return results
+
+
+# --- Report ---
+def compare_to(summary: dict, baseline: dict):
+    """Print each latency/throughput figure next to the baseline run's, with the change in %."""
+    for section in ("endpoints", "micro"):
+        for name, now in summary.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            for key, value in now.items():
+                old = before.get(key)
+                if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old and key != "requests":
+                    change = (value - old) / old * 100
+                    print(f"{name:<28} {key:<20} {old:>10} -> {value:<10} ({change:+.1f}%)")
+
+
+def print_report(summary: dict):
+    print(f"{'endpoint':<22} {'req':>6} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, r in summary["endpoints"].items():
+        print(f"{name:<22} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>8} "
+              f"{r['p50_ms']:>8} {r['p99_ms']:>8} {r['queries_per_request']:>8}")
+    for name, r in summary["micro"].items():
+        print(f"{name:<28} " + ", ".join(f"{k} {v}" for k, v in r.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    scale = parser.add_argument_group("seed data (first run only)")
+    scale.add_argument("--users", type=int, default=500)
+    scale.add_argument("--stores", type=int, default=50)
+    scale.add_argument("--follows", type=int, default=20, help="users each user follows")
+    scale.add_argument("--items", type=int, default=10, help="items per user")
+    scale.add_argument("--comparisons", type=int, default=20, help="comparisons per user")
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per endpoint")
+    parser.add_argument("--auth-requests", type=int, default=50, help="cap for POST /auth")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="endpoints to run, matched by substring (e.g. /items)")
+    parser.add_argument("--image-runs", type=int, default=5)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", nargs="?", const="-", metavar="FILE", help="write the results as JSON ('-': stdout)")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    migrate.upgrade()
+    user_ids, store_names = seed(args.users, args.stores, args.follows, args.items, args.comparisons, args.seed)
+    image_pipeline.uploader = NullUploader()
+    try:
+        endpoints = asyncio.run(run_load(args, user_ids, store_names))
+    finally:
+        image_pipeline.shutdown()
+        geocode_worker.shutdown()
+        passwords.hasher.shutdown()
+
+    summary = {
+        "database": engine.dialect.name,
+        "scale": {k: getattr(args, k) for k in ("users", "stores", "follows", "items", "comparisons")},
+        "seeded_users": len(user_ids),
+        "concurrency": args.concurrency,
+        "endpoints": endpoints,
+        "micro": {} if args.skip_micro else micro_benchmarks(args.image_runs),
+    }
+    if args.json == "-":
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_to(summary, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Login throughput under concurrent load, with feed latency measured alongside.
+
+    IMAGE_UPLOADER=local python bench_auth.py --logins 200 --concurrency 32
+
+Runs the app in-process against DATABASE_URL (default ./app.db) and creates
+bench_login_* users on first run.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from main import app
+import migrate
+import passwords
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    response = await coro
+    return response.status_code, time.perf_counter() - start
+
+
+async def run(logins: int, concurrency: int, users: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Make sure the users exist so the timed phase measures verification
+        for i in range(users):
+            await client.post("/auth", json={"username": f"bench_login_{i}", "password": "bench"})
+
+        limit = asyncio.Semaphore(concurrency)
+        feed_latencies = []
+
+        async def login(i):
+            async with limit:
+                return await timed(
+                    client.post("/auth", json={"username": f"bench_login_{i % users}", "password": "bench"})
+                )
+
+        async def poll_feed(stop):
+            while not stop.is_set():
+                _, elapsed = await timed(client.get("/items", params={"limit": 20}))
+                feed_latencies.append(elapsed)
+
+        stop = asyncio.Event()
+        poller = asyncio.create_task(poll_feed(stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(login(i) for i in range(logins)))
+        wall = time.perf_counter() - start
+        stop.set()
+        await poller
+
+    ok = [elapsed for status, elapsed in results if status == 200]
+    ok.sort()
+    feed_latencies.sort()
+    print(f"logins: {len(ok)}/{logins} ok in {wall:.2f}s -> {len(ok) / wall:.1f}/s "
+          f"(p50 {ok[len(ok) // 2] * 1000:.0f}ms, p99 {ok[int(len(ok) * 0.99) - 1] * 1000:.0f}ms)")
+    if feed_latencies:
+        print(f"/items while logging in: {len(feed_latencies)} requests, "
+              f"p50 {feed_latencies[len(feed_latencies) // 2] * 1000:.1f}ms, max {feed_latencies[-1] * 1000:.1f}ms")
+    print("hasher:", passwords.hasher.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    migrate.upgrade()
+    asyncio.run(run(args.logins, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Replay benchmark for elo.replay against the scalar elo.calculate_elo loop.
+
+    python bench_elo.py --comparisons 2000000 --users 20000 --stores 50
+
+Also times one user's replay (`scores.py --user-id`), where the scalar loop
+is the baseline to beat.
+"""
+import argparse
+import time
+import numpy as np
+import elo
+
+
+def synthetic_events(comparisons: int, users: int, stores: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    user = rng.integers(0, users, comparisons)
+    winner = rng.integers(0, stores, comparisons)
+    # Shift losers by 1..stores-1 so a store never plays itself
+    loser = (winner + rng.integers(1, stores, comparisons)) % stores
+    # Slot = (user, store) pair
+    return user, user * stores + winner, user * stores + loser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comparisons", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--scalar-sample", type=int, default=200_000, help="events timed through calculate_elo")
+    parser.add_argument("--single-user", type=int, default=100_000, help="comparisons in the one-user replay")
+    args = parser.parse_args()
+
+    users, winners, losers = synthetic_events(args.comparisons, args.users, args.stores)
+    n_slots = args.users * args.stores
+
+    start = time.perf_counter()
+    elo.replay(users, winners, losers, n_slots)
+    vectorized = time.perf_counter() - start
+    print(f"replay (constant K): {args.comparisons:,} comparisons in {vectorized:.2f}s "
+          f"({args.comparisons / vectorized:,.0f}/s)")
+
+    start = time.perf_counter()
+    elo.replay(users, winners, losers, n_slots, k_schedule=elo.decaying_k())
+    decaying = time.perf_counter() - start
+    print(f"replay (decaying K): {args.comparisons:,} comparisons in {decaying:.2f}s")
+
+    sample = min(args.scalar_sample, args.comparisons)
+    ratings = [elo.DEFAULT_RATING] * n_slots
+    start = time.perf_counter()
+    for w, l in zip(winners[:sample].tolist(), losers[:sample].tolist()):
+        ratings[w], ratings[l] = elo.calculate_elo(ratings[w], ratings[l])
+    scalar = time.perf_counter() - start
+    print(f"calculate_elo loop:  {sample:,} comparisons in {scalar:.2f}s ({sample / scalar:,.0f}/s)")
+
+    users, winners, losers = synthetic_events(args.single_user, 1, args.stores)
+    start = time.perf_counter()
+    elo.replay(users, winners, losers, args.stores)
+    single = time.perf_counter() - start
+    ratings = [elo.DEFAULT_RATING] * args.stores
+    start = time.perf_counter()
+    for w, l in zip(winners.tolist(), losers.tolist()):
+        ratings[w], ratings[l] = elo.calculate_elo(ratings[w], ratings[l])
+    single_scalar = time.perf_counter() - start
+    print(f"one user, {args.single_user:,} comparisons: replay {single:.2f}s, "
+          f"calculate_elo loop {single_scalar:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Cold-start cost of the API: `import main` and create_app() in a fresh
+interpreter (what every worker spawn pays), plus the slowest imports.
+
+    python bench_startup.py --runs 10 --top 15
+
+Also reports which heavy optional libraries got imported; after startup
+they should all be absent (they are loaded on first use).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["PIL", "geopy", "cloudinary", "passlib", "argon2", "numpy", "redis"]
+
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "create_app_seconds": created - imported,
+    "heavy_loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe():
+    """One fresh interpreter: (timings dict, [(cumulative_us, module)] of direct imports)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        # main is depth 1; its own imports are depth 2
+        if depth <= 2:
+            modules.append((int(cumulative), name.strip()))
+    return timings, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of text")
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    imports = [t["import_seconds"] for t, _ in results]
+    creates = [t["create_app_seconds"] for t, _ in results]
+    # Slowest modules from the median run
+    _, modules = sorted(results, key=lambda r: r[0]["import_seconds"])[len(results) // 2]
+    slowest = sorted(modules, reverse=True)[: args.top]
+
+    summary = {
+        "runs": args.runs,
+        "import_seconds": {"median": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "create_app_seconds": {"median": statistics.median(creates), "min": min(creates), "max": max(creates)},
+        "heavy_loaded": results[-1][0]["heavy_loaded"],
+        "slowest_imports_ms": {name: round(us / 1000, 2) for us, name in slowest},
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"import main: median {summary['import_seconds']['median'] * 1000:.1f} ms "
+          f"(min {min(imports) * 1000:.1f}, max {max(imports) * 1000:.1f}) over {args.runs} runs")
+    print(f"create_app(): median {summary['create_app_seconds']['median'] * 1000:.1f} ms")
+    print("heavy libraries loaded at startup:", ", ".join(summary["heavy_loaded"]) or "none")
+    print("slowest imports (cumulative ms):")
+    for name, ms in summary["slowest_imports_ms"].items():
+        print(f"  {ms:8.2f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
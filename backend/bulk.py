@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+import models
+import schemas
+import stores
+import timeline
+import geo
+import geocoding
+import images
+
+# Bulk export/import of items, stores and Elo scores. Exports read through a
+# server-side cursor in batches so memory stays flat however large the table;
+# imports insert in batches with one multi-row INSERT per table.
+BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+FORMATS = ("ndjson", "csv")
+
+_item = models.Item.__table__
+_store = models.Store.__table__
+_score = models.UserStoreScore.__table__
+
+EXPORTS = {
+    "items": select(
+        _item.c.id, _item.c.user_id, _item.c.store_id,
+        _store.c.name.label("store_name"), _store.c.store_type,
+        _item.c.image_path, _item.c.image_variants, _item.c.location_text,
+        _item.c.latitude, _item.c.longitude, _item.c.materials_text,
+        _item.c.rating, _item.c.notes, _item.c.created_at,
+    ).select_from(_item.join(_store, _store.c.id == _item.c.store_id)).order_by(_item.c.id),
+    "stores": select(_store.c.id, _store.c.name, _store.c.store_type).order_by(_store.c.id),
+    "scores": select(_score.c.user_id, _score.c.store_id, _score.c.score).order_by(
+        _score.c.user_id, _score.c.store_id
+    ),
+}
+
+
+def export_rows(connection, kind: str, user_id: int = None, batch_size: int = BATCH_SIZE):
+    """Yield lists of row dicts for one export, `batch_size` rows at a time."""
+    stmt = EXPORTS[kind]
+    if user_id is not None and kind != "stores":
+        stmt = stmt.where((_item.c.user_id if kind == "items" else _score.c.user_id) == user_id)
+    result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, models.StoreType):
+        return value.value
+    return value
+
+
+def to_ndjson(batches):
+    for batch in batches:
+        yield "".join(json.dumps({k: _plain(v) for k, v in row.items()}) + "\n" for row in batch)
+
+
+def to_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for batch in batches:
+        for row in batch:
+            writer.writerow({
+                k: json.dumps(v) if isinstance(v, (dict, list)) else _plain(v) for k, v in row.items()
+            })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header-only output when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def columns(kind: str):
+    return [c.name for c in EXPORTS[kind].selected_columns]
+
+
+def write_parquet(batches, path: str):
+    """Write an export to a Parquet file (needs pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for batch in batches:
+            table = pa.Table.from_pylist([
+                {k: json.dumps(v) if isinstance(v, dict) else _plain(v) for k, v in row.items()} for row in batch
+            ])
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# --- Import ---
+def read_records(lines, fmt: str):
+    """(line_number, dict) for each record in an NDJSON or CSV text stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # Empty CSV cells mean "not set"
+            yield reader.line_num, {k: (v if v != "" else None) for k, v in record.items()}
+    else:
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, e
+
+
+def import_items(db: Session, records, user_id: int = None, batch_size: int = BATCH_SIZE):
+    """
+    Insert items from read_records(). Every item goes to `user_id` when given,
+    otherwise to each record's own user_id. Stores are matched on their
+    normalized name and created as needed. Commits after every batch.
+    Returns a schemas.ImportResult; invalid records are skipped and listed.
+    """
+    result = schemas.ImportResult(imported=0, stores_created=0, errors=[])
+    batch = []
+    for number, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(str(record))
+            item = schemas.ItemImport.model_validate(record)
+            if user_id is not None:
+                item.user_id = user_id
+            if item.user_id is None:
+                raise ValueError("user_id is required")
+            batch.append(item)
+        except (ValidationError, ValueError) as e:
+            if len(result.errors) < MAX_IMPORT_ERRORS:
+                result.errors.append({"line": number, "error": str(e)})
+            continue
+
+        if len(batch) == batch_size:
+            _import_batch(db, batch, result)
+            batch = []
+    if batch:
+        _import_batch(db, batch, result)
+    return result
+
+
+def _utc(value: datetime) -> datetime:
+    # Timestamps are stored as UTC; naive ones are taken to be UTC already
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _import_batch(db: Session, batch, result):
+    user_ids = {item.user_id for item in batch}
+    known_users = set(db.execute(select(models.User.id).where(models.User.id.in_(user_ids))).scalars())
+
+    valid = [item for item in batch if item.user_id in known_users]
+    if len(result.errors) < MAX_IMPORT_ERRORS:
+        for user in sorted(user_ids - known_users):
+            result.errors.append({"user_id": user, "error": "Unknown user; their records were skipped"})
+    if not valid:
+        return
+
+    store_ids, created = stores.get_or_create_many(db, [(i.store_name, i.store_type.value) for i in valid])
+    now = datetime.now(timezone.utc)
+    rows = []
+    for item in valid:
+        has_coords = item.latitude is not None and item.longitude is not None
+        rows.append({
+            "user_id": item.user_id,
+            "store_id": store_ids[models.normalize_store_name(item.store_name)],
+            "image_path": item.image_path,
+            "image_variants": item.image_variants,
+            # Imported images are already hosted; nothing to process
+            "image_status": images.READY if item.image_path else images.FAILED,
+            "location_text": item.location_text,
+            "latitude": item.latitude,
+            "longitude": item.longitude,
+            "geohash": geo.encode(item.latitude, item.longitude) if has_coords else None,
+            "geocode_status": geocoding.PENDING if item.location_text and not has_coords else None,
+            "materials_text": item.materials_text,
+            "rating": item.rating,
+            "notes": item.notes,
+            "created_at": _utc(item.created_at) if item.created_at else now,
+        })
+
+    item_ids = db.execute(insert(_item).returning(_item.c.id), rows).scalars().all()
+    timeline.fan_out_many(db, item_ids)
+    db.commit()
+    result.imported += len(item_ids)
+    result.stores_created += created
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from db import SessionLocal, read_engine
+    import migrate
+
+    parser = argparse.ArgumentParser(description="Bulk export/import of closet data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="write items, stores or scores")
+    export_cmd.add_argument("kind", choices=sorted(EXPORTS))
+    export_cmd.add_argument("--format", choices=FORMATS + ("parquet",), default="ndjson")
+    export_cmd.add_argument("--user-id", type=int, help="only this user's items/scores")
+    export_cmd.add_argument("-o", "--output", help="file to write (default: stdout; required for parquet)")
+
+    import_cmd = commands.add_parser("import", help="read items")
+    import_cmd.add_argument("input", help="NDJSON or CSV file, '-' for stdin")
+    import_cmd.add_argument("--format", choices=FORMATS, default="ndjson")
+    import_cmd.add_argument("--user-id", type=int, help="assign every item to this user")
+    args = parser.parse_args()
+
+    migrate.upgrade()
+    if args.command == "export":
+        with read_engine.connect() as connection:
+            batches = export_rows(connection, args.kind, args.user_id)
+            if args.format == "parquet":
+                if not args.output:
+                    parser.error("--output is required for parquet")
+                try:
+                    write_parquet(batches, args.output)
+                except ImportError:
+                    parser.error("parquet export needs pyarrow (pip install pyarrow)")
+            else:
+                chunks = to_csv(batches, columns(args.kind)) if args.format == "csv" else to_ndjson(batches)
+                out = open(args.output, "w", newline="") if args.output else sys.stdout
+                try:
+                    for chunk in chunks:
+                        out.write(chunk)
+                finally:
+                    if args.output:
+                        out.close()
+    else:
+        source = sys.stdin if args.input == "-" else open(args.input, newline="")
+        session = SessionLocal()
+        try:
+            print(import_items(session, read_records(source, args.format), args.user_id).model_dump_json(indent=2))
+        finally:
+            session.close()
+            source.close()
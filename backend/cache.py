@@ -0,0 +1,275 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import models
+
+# Read-through caches for lookups that almost never change: username -> id,
+# store name -> id, the store list and each user's follow graph. Write
+# endpoints invalidate the affected keys after committing; the TTL bounds how
+# long a value can stay stale if an invalidation is missed (e.g. a reader
+# re-populating a key it loaded just before the write).
+MISSING = object()
+
+
+class MemoryStore:
+    """Per-process LRU with per-entry expiry."""
+
+    def __init__(self, name: str, maxsize: int):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class RedisStore:
+    """
+    Shared store, so every worker sees the same values and invalidations.
+    Values are JSON; size bounds are left to the server's maxmemory policy.
+    Redis errors count as misses so a cache outage never fails a request.
+    """
+
+    def __init__(self, name: str, client, prefix: str = "fc"):
+        self.client = client
+        self.prefix = f"{prefix}:{name}:"
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + str(key))
+        except Exception as e:
+            print("Cache read failed:", e)
+            return MISSING
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl: float):
+        try:
+            self.client.set(self.prefix + str(key), json.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            print("Cache write failed:", e)
+
+    def delete(self, keys):
+        try:
+            self.client.delete(*[self.prefix + str(key) for key in keys])
+        except Exception as e:
+            print("Cache invalidation failed:", e)
+
+    def clear(self):
+        try:
+            stale = list(self.client.scan_iter(match=self.prefix + "*"))
+            if stale:
+                self.client.delete(*stale)
+        except Exception as e:
+            print("Cache invalidation failed:", e)
+
+    def size(self):
+        return None
+
+
+def store_factory_from_env():
+    """CACHE_BACKEND=redis shares caches through CACHE_REDIS_URL; anything else keeps them in-process."""
+    if os.environ.get("CACHE_BACKEND", "memory") == "redis":
+        import redis
+
+        client = redis.Redis.from_url(os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+        return lambda name, maxsize: RedisStore(name, client)
+    return MemoryStore
+
+
+class Cache:
+    """A named cache over a store, with hit/miss counters. Values must be JSON-serializable."""
+
+    def __init__(self, name: str, ttl: float, maxsize: int, store_factory=MemoryStore):
+        self.name = name
+        self.ttl = ttl
+        self.store = store_factory(name, maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """Cached value for `key`, calling loader() on a miss. None results are not cached."""
+        value = self.store.get(key)
+        with self._lock:
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = loader()
+        if value is not None:
+            self.store.set(key, value, self.ttl)
+        return value
+
+    def set(self, key, value):
+        self.store.set(key, value, self.ttl)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.invalidations += 1
+        self.store.delete(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += 1
+        self.store.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "evictions": self.store.evictions,
+            "size": self.store.size(),
+        }
+
+
+_store_factory = store_factory_from_env()
+_ttl = float(os.environ.get("CACHE_TTL_SECONDS", 300))
+_maxsize = int(os.environ.get("CACHE_MAXSIZE", 10000))
+# Follows change at any time, and without Redis an invalidation only reaches
+# the worker that made the change: keep the other workers' copies short-lived
+_follow_ttl = float(os.environ.get(
+    "CACHE_FOLLOW_TTL_SECONDS", _ttl if _store_factory is not MemoryStore else 5
+))
+
+user_ids = Cache("user_ids", _ttl, _maxsize, _store_factory)
+store_ids = Cache("store_ids", _ttl, _maxsize, _store_factory)
+store_list = Cache("store_list", _ttl, 1, _store_factory)
+following = Cache("following", _follow_ttl, _maxsize, _store_factory)
+followers = Cache("followers", _follow_ttl, _maxsize, _store_factory)
+# Resource versions and rendered responses for conditional GETs (see http_cache.py)
+versions = Cache("versions", _ttl, _maxsize, _store_factory)
+responses = Cache("responses", _ttl, int(os.environ.get("RESPONSE_CACHE_MAXSIZE", 1000)), _store_factory)
+
+CACHES = [user_ids, store_ids, store_list, following, followers, versions, responses]
+
+
+def stats() -> dict:
+    return {c.name: c.stats() for c in CACHES}
+
+
+# --- Lookups ---
+def user_id(db: Session, username: str):
+    """Id of the user with this username, or None."""
+    return user_ids.get_or_load(
+        username,
+        lambda: db.execute(select(models.User.id).where(models.User.username == username)).scalar(),
+    )
+
+
+def store_id(db: Session, name: str):
+    """Id of the store with this name (case-insensitive), or None."""
+    key = models.normalize_store_name(name)
+    return store_ids.get_or_load(
+        key,
+        lambda: db.execute(select(models.Store.id).where(models.Store.name_key == key)).scalar(),
+    )
+
+
+def all_stores(db: Session):
+    """Every store as {id, name, store_type} dicts."""
+    return store_list.get_or_load(
+        "all",
+        lambda: [
+            {"id": s.id, "name": s.name, "store_type": s.store_type.value if s.store_type else None}
+            for s in db.query(models.Store).order_by(models.Store.id)
+        ],
+    )
+
+
+def following_ids(db: Session, user_id: int) -> frozenset:
+    """Ids of the users `user_id` follows. May be briefly stale: don't base writes on it."""
+    ids = following.get_or_load(
+        user_id,
+        lambda: sorted(db.execute(
+            select(models.follows.c.followed_id).where(models.follows.c.follower_id == user_id)
+        ).scalars()),
+    )
+    return frozenset(ids)
+
+
+def follower_ids(db: Session, user_id: int) -> frozenset:
+    """Ids of the users following `user_id`."""
+    ids = followers.get_or_load(
+        user_id,
+        lambda: sorted(db.execute(
+            select(models.follows.c.follower_id).where(models.follows.c.followed_id == user_id)
+        ).scalars()),
+    )
+    return frozenset(ids)
+
+
+# --- Resource versions ---
+# Nanosecond timestamps of the last write, so they also give Last-Modified.
+# A version that expired or was never set starts again at "now": responses
+# get a new ETag, which costs a full response but is never stale.
+_last_version = 0
+_version_lock = threading.Lock()
+
+
+def _new_version() -> int:
+    global _last_version
+    with _version_lock:
+        _last_version = max(time.time_ns(), _last_version + 1)
+        return _last_version
+
+
+def version(resource: str) -> int:
+    return versions.get_or_load(resource, _new_version)
+
+
+def bump(*resources: str):
+    """Mark resources as changed. Call after the write commits."""
+    for resource in resources:
+        versions.set(resource, _new_version())
+
+
+# --- Invalidation hooks (call after the write commits) ---
+def store_added(new_id: int, name: str):
+    store_ids.set(models.normalize_store_name(name), new_id)
+    store_list.clear()
+    bump("stores")
+
+
+def follow_changed(follower_id: int, followed_id: int):
+    following.invalidate(follower_id)
+    followers.invalidate(followed_id)
+    bump(f"following:{follower_id}", f"followers:{followed_id}")
@@ -1,28 +1,272 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import metrics
 
 # 1. Try to get the Cloud Database URL
 # 2. If not found, fall back to local SQLite (for when you develop on laptop)
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for the GET endpoints
+REPLICA_DATABASE_URL = os.getenv("DATABASE_REPLICA_URL")
 
-if SQLALCHEMY_DATABASE_URL:
+def _normalize_url(url: str) -> str:
     # Fix for Render: It starts with "postgres://", but SQLAlchemy needs "postgresql://"
-    if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-        SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes") if value else default
 
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+if SQLALCHEMY_DATABASE_URL:
+    SQLALCHEMY_DATABASE_URL = _normalize_url(SQLALCHEMY_DATABASE_URL)
 else:
     # Local fallback
     SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
-    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 
+# --- Pool metrics ---
+class PoolStats:
+    """Checkout counters for one engine's pool, used to size workers and pools."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited: float):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+class _TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    # Time spent waiting for a free connection (includes opening new ones)
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+_engines = {}
+
+def pool_metrics() -> dict:
+    """Current size/usage and cumulative checkout wait of every engine's pool."""
+    metrics = {}
+    for name, sync_engine in _engines.items():
+        pool = sync_engine.pool
+        stats = pool.stats
+        metrics[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": stats.checkouts,
+            "wait_seconds_total": round(stats.wait_seconds, 6),
+            "wait_seconds_max": round(stats.max_wait_seconds, 6),
+        }
+    return metrics
+
+# --- Statement instrumentation ---
+# Per-request SQL counters: (statements, seconds) lists, one per active
+# count_queries() block. They are shared by reference, so statements run in
+# the threadpool still count towards the request that set them.
+_query_counter = ContextVar("query_counter", default=())
+
+def _instrument(sync_engine, name: str):
+    def before(conn, cursor, statement, parameters, context, executemany):
+        for counter in _query_counter.get():
+            counter[0] += 1
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        for counter in _query_counter.get():
+            counter[1] += elapsed
+        metrics.record_statement(name, statement, parameters, elapsed)
+
+    def failed(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+    event.listen(sync_engine, "before_cursor_execute", before)
+    event.listen(sync_engine, "after_cursor_execute", after)
+    event.listen(sync_engine, "handle_error", failed)
+
+@contextmanager
+def count_queries():
+    """
+    Count the SQL statements executed inside the block and their total time:
+    `with count_queries() as n: ...; n[0], n[1]`. Blocks can be nested.
+    """
+    counter = [0, 0.0]
+    token = _query_counter.set(_query_counter.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+# --- Engine factory ---
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if _env_bool("SQLITE_WAL", True):
+        # Readers no longer block the writer (and vice versa)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.close()
+
+def create_db_engine(url: str, name: str, is_async: bool = False):
+    """
+    Engine with pool settings read from the environment:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE (seconds),
+    DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS (PostgreSQL only).
+    SQLite connections get WAL/synchronous/busy_timeout pragmas on connect.
+    """
+    is_sqlite = url.startswith("sqlite")
+    options = {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", not is_sqlite),
+    }
+
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+    if is_sqlite:
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+    elif statement_timeout and url.startswith("postgresql"):
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+
+    if is_async:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        new_engine = create_async_engine(url, **options)
+        sync_engine = new_engine.sync_engine
+    else:
+        new_engine = sync_engine = create_engine(url, **options)
+
+    if is_sqlite:
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
+    _instrument(sync_engine, name)
+    _engines[name] = sync_engine
+    return new_engine
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+if REPLICA_DATABASE_URL:
+    REPLICA_DATABASE_URL = _normalize_url(REPLICA_DATABASE_URL)
+    read_engine = create_db_engine(REPLICA_DATABASE_URL, "replica")
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+else:
+    read_engine = engine
+    ReadSessionLocal = SessionLocal
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Session for read-only endpoints; uses the replica when one is configured."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Optional async stack (DB_ASYNC=1): the same database through asyncpg/aiosqlite,
+# so sync and async endpoints can be benchmarked against each other.
+ASYNC_DB = os.getenv("DB_ASYNC") == "1"
+
+def _async_url(url: str) -> str:
+    return (
+        url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        .replace("sqlite://", "sqlite+aiosqlite://", 1)
+    )
+
+ASYNC_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+
+if ASYNC_DB:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = create_db_engine(ASYNC_DATABASE_URL, "async_primary", is_async=True)
+    # Responses are serialized after the session is done, outside its greenlet,
+    # so committed objects must stay loaded
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if REPLICA_DATABASE_URL:
+        async_read_engine = create_db_engine(_async_url(REPLICA_DATABASE_URL), "async_replica", is_async=True)
+        AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+    else:
+        async_read_engine = async_engine
+        AsyncReadSessionLocal = AsyncSessionLocal
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+def insert_ignore(db: Session, table, rows, returning):
+    """
+    INSERT rows, skipping any whose key already exists, without racing other
+    writers. Returns the `returning` column values of the rows actually inserted.
+    """
+    if not rows:
+        return []
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # No portable upsert: insert row by row, each in its own savepoint
+        inserted = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert().values(row))
+                inserted.append(tuple(row[c] for c in returning))
+            except IntegrityError:
+                pass
+        return inserted
+
+    stmt = insert(table).values(rows).on_conflict_do_nothing().returning(*[table.c[c] for c in returning])
+    return [tuple(r) for r in db.execute(stmt)]
@@ -13,3 +13,88 @@ def calculate_elo(winner_rating: float, loser_rating: float, k_factor: int = 32)
     new_loser_rating = loser_rating + k_factor * (0 - (1 - expected_winner))
 
     return round(new_winner_rating, 2), round(new_loser_rating, 2)
+
+
+# --- Batch replay ---
+DEFAULT_RATING = 1200.0
+
+def constant_k(k_factor: float = 32):
+    """K schedule: the same K for every comparison (what calculate_elo uses)."""
+    return lambda games: k_factor
+
+def decaying_k(k_start: float = 40.0, k_floor: float = 16.0, half_life: float = 20.0):
+    """K schedule: K halves towards k_floor every `half_life` comparisons a store has had."""
+    return lambda games: k_floor + (k_start - k_floor) * 0.5 ** (games / half_life)
+
+# Below this many events per vectorized step, replay() loops over events instead
+VECTOR_MIN_BATCH = 64
+
+def _replay_loop(winners, losers, ratings, games, k_schedule):
+    """replay() one event at a time, on Python floats."""
+    import numpy as np
+
+    r, g = ratings.tolist(), games.tolist()
+    for w, l in zip(winners.tolist(), losers.tolist()):
+        gain = 1 - 1 / (1 + 10 ** ((r[l] - r[w]) / 400))
+        r[w], r[l] = r[w] + k_schedule(g[w]) * gain, r[l] - k_schedule(g[l]) * gain
+        g[w] += 1
+        g[l] += 1
+    return np.array(r, dtype=np.float64), np.array(g, dtype=np.int64)
+
+def replay(users, winners, losers, n_slots: int, k_schedule=None, initial: float = DEFAULT_RATING):
+    """
+    Replays comparison events in full precision with NumPy.
+
+    `users`, `winners` and `losers` are parallel integer arrays in chronological
+    order; winners/losers index a rating slot that belongs to exactly one user
+    (i.e. one slot per (user, store) pair). `k_schedule` maps an array of games
+    already played by each slot to its K factor.
+
+    Histories of different users are independent, so the i-th comparison of
+    every user is applied in one vectorized step. With few users per step
+    (e.g. one user's history) a plain loop is faster and is used instead.
+    Returns (ratings, games).
+    """
+    import numpy as np
+
+    users = np.asarray(users, dtype=np.int64)
+    winners = np.asarray(winners, dtype=np.int64)
+    losers = np.asarray(losers, dtype=np.int64)
+    k_schedule = k_schedule or constant_k()
+
+    ratings = np.full(n_slots, initial, dtype=np.float64)
+    games = np.zeros(n_slots, dtype=np.int64)
+    n = len(users)
+    if n == 0:
+        return ratings, games
+
+    # One vectorized step per event of the longest history; each step costs
+    # about as much as VECTOR_MIN_BATCH events applied one at a time
+    steps = np.unique(users, return_counts=True)[1].max()
+    if n < steps * VECTOR_MIN_BATCH:
+        return _replay_loop(winners, losers, ratings, games, k_schedule)
+
+    # Position of every event within its own user's history
+    by_user = np.argsort(users, kind="stable")
+    sorted_users = users[by_user]
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, n]))
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_user] = np.arange(n) - group_start
+
+    # Events sharing a rank belong to different users, so no slot repeats within a step
+    order = np.argsort(rank, kind="stable")
+    sorted_rank = rank[order]
+    bounds = np.r_[0, np.flatnonzero(sorted_rank[1:] != sorted_rank[:-1]) + 1, n]
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        idx = order[start:stop]
+        w, l = winners[idx], losers[idx]
+        # Same formula as calculate_elo, without rounding between steps
+        gain = 1 - 1 / (1 + 10 ** ((ratings[l] - ratings[w]) / 400))
+        ratings[w] += k_schedule(games[w]) * gain
+        ratings[l] -= k_schedule(games[l]) * gain
+        games[w] += 1
+        games[l] += 1
+
+    return ratings, games
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Real-time push over server-sent events. Write endpoints publish an event to
+# the users it concerns after their transaction commits; every open
+# /events stream for those users gets it. Events carry increasing ids and
+# the hub keeps the most recent ones, so a client reconnecting with the last
+# id it saw (EventSource sends it as Last-Event-ID) gets only what it missed.
+# When that is no longer known it gets a "reset" event and refetches instead.
+#
+# The broker carries events between processes: MemoryBroker for a single
+# worker, RedisBroker (EVENTS_BROKER=redis) so that an event published by
+# one worker reaches streams held open by the others.
+BACKLOG = int(os.environ.get("EVENTS_BACKLOG", 1000))
+QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 100))
+HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", 15))
+# Streams end after this long and the client reconnects where it left off.
+# Keeps a graceful shutdown (which waits for open responses) short and
+# spreads long-lived connections across workers.
+MAX_STREAM_SECONDS = float(os.environ.get("EVENTS_MAX_STREAM_SECONDS", 300))
+RETRY_MS = 3000
+
+
+# Brokers number events as they publish them, in one atomic step, so every
+# hub receives them in id order: a client resuming after id N can never
+# have missed a lower id that was delivered later.
+class MemoryBroker:
+    """Single process: published events go straight back to this process's hub."""
+
+    def __init__(self):
+        self._deliver = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        # Seeded from the clock so ids keep increasing across restarts
+        self._last_id = max(time.time_ns() // 1000, self._last_id + 1)
+        return self._last_id
+
+    def next_id(self) -> int:
+        with self._lock:
+            return self._next_id()
+
+    def publish(self, event: dict):
+        """Number `event` and deliver it, with no other publish in between."""
+        with self._lock:
+            event["id"] = self._next_id()
+            if self._deliver is not None:
+                self._deliver(event)
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def close(self):
+        self._deliver = None
+
+
+class RedisBroker:
+    """
+    Fans events out to every worker through a Redis pub/sub channel. Ids come
+    from one Redis counter so all workers agree on them. A Redis outage loses
+    the events published meanwhile; clients see a "reset" when they reconnect.
+    """
+
+    # INCR and PUBLISH in one script: Redis runs scripts one at a time, so
+    # messages go out in id order whichever worker published them
+    PUBLISH_SCRIPT = """
+    local id = redis.call('INCR', KEYS[1])
+    redis.call('PUBLISH', ARGV[1], id .. ' ' .. ARGV[2])
+    return id
+    """
+
+    def __init__(self, client, channel: str = "fc:events"):
+        self.client = client
+        self.channel = channel
+        self._publish = client.register_script(self.PUBLISH_SCRIPT)
+        self._pubsub = None
+        self._thread = None
+
+    def next_id(self) -> int:
+        return int(self.client.incr(self.channel + ":seq"))
+
+    def publish(self, event: dict):
+        try:
+            self._publish(keys=[self.channel + ":seq"], args=[self.channel, json.dumps(event)])
+        except Exception as e:
+            print("Event publish failed:", e)
+
+    @staticmethod
+    def _decode(data) -> dict:
+        event_id, _, body = (data.decode() if isinstance(data, bytes) else data).partition(" ")
+        return {**json.loads(body), "id": int(event_id)}
+
+    def start(self, deliver):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: lambda message: deliver(self._decode(message["data"]))})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread.join()
+            self._pubsub.close()
+            self._thread = self._pubsub = None
+
+
+def broker_from_env():
+    """EVENTS_BROKER=redis shares events through EVENTS_REDIS_URL (default CACHE_REDIS_URL); anything else stays in-process."""
+    if os.environ.get("EVENTS_BROKER", "memory") == "redis":
+        import redis
+
+        url = os.environ.get("EVENTS_REDIS_URL") or os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        return RedisBroker(redis.Redis.from_url(url))
+    return MemoryBroker()
+
+
+class Subscription:
+    """One open stream: its user and a bounded queue filled from the broker's thread."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event: dict):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind is disconnected; it resumes from its last id
+            self.overflowed = True
+
+
+class Hub:
+    """Routes broker events to the subscriptions of the users they are addressed to."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._subscriptions = {}
+        self._backlog = deque()
+        # Ids at or below this may have been missed (before start or evicted)
+        self._floor = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Outside our lock: publish() takes the broker's lock, then ours
+        first_id = self.broker.next_id()
+        with self._lock:
+            self._floor = self._last_id = first_id
+        self.broker.start(self._deliver)
+
+    def close(self):
+        self.broker.close()
+
+    def publish(self, user_ids, event_type: str, data: dict):
+        """Send `data` to each of `user_ids`. Call after the write commits."""
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        with self._lock:
+            self.published += 1
+        self.broker.publish({"type": event_type, "users": user_ids, "data": data})
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            if self._floor is None:
+                return
+            self._backlog.append(event)
+            while len(self._backlog) > BACKLOG:
+                self._floor = max(self._floor, self._backlog.popleft()["id"])
+            self._last_id = max(self._last_id, event["id"])
+            targets = [sub for user_id in event["users"] for sub in self._subscriptions.get(user_id, ())]
+        dropped = 0
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub.put, event)
+            except RuntimeError:
+                # Its event loop is gone
+                dropped += 1
+        with self._lock:
+            self.delivered += len(targets) - dropped
+            self.dropped += dropped
+
+    def subscribe(self, user_id: int, after: int = None):
+        """
+        Register a stream. Returns it with the events to replay first: those
+        after `after`, or None when some of them can no longer be known.
+        """
+        sub = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(sub)
+            # Under the lock, so nothing is both replayed and queued
+            if after is None:
+                return sub, []
+            if self._floor is None or after < self._floor:
+                return sub, None
+            replay = [e for e in self._backlog if e["id"] > after and user_id in e["users"]]
+            return sub, sorted(replay, key=lambda e: e["id"])
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subscriptions.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscriptions[sub.user_id]
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._last_id
+
+    async def stream(self, user_id: int, after: int = None):
+        """Yield a user's events as SSE, replaying from `after`, with heartbeats while idle."""
+        sub, replay = self.subscribe(user_id, after)
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if replay is None:
+                yield format_event({"id": self.last_id(), "type": "reset", "data": {}})
+                replay = []
+            for event in replay:
+                yield format_event(event)
+            while not sub.overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), min(HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connections": sum(len(subs) for subs in self._subscriptions.values()),
+                "users": len(self._subscriptions),
+                "backlog": len(self._backlog),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
+
+
+def format_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+hub = Hub(broker_from_env())
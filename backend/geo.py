@@ -0,0 +1,129 @@
+import math
+
+# Geohash cells for the "items near me" query. Item.geohash is indexed, and
+# every cell is a prefix range of it, so a search only reads the few cells
+# around the point instead of every item with coordinates.
+GEOHASH_PRECISION = 9  # ~5 m x 5 m cells
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 200.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    value, bits, use_lon = 0, 0, True
+    while len(chars) < precision:
+        bounds, coordinate = (lon_range, lon) if use_lon else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if coordinate >= mid:
+            value = value * 2 + 1
+            bounds[0] = mid
+        else:
+            value = value * 2
+            bounds[1] = mid
+        use_lon = not use_lon
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            value, bits = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int):
+    """(height, width) in degrees of a geohash cell."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """(min_lat, max_lat, min_lon, max_lon) containing every point within radius_km."""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)
+    # Longitude degrees shrink towards the poles; use the widest latitude in the box
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 89.9:
+        return min_lat, max_lat, -180.0, 180.0
+    d_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest))))
+    # Boxes crossing the antimeridian are clipped to it
+    return min_lat, max_lat, max(lon - d_lon, -180.0), min(lon + d_lon, 180.0)
+
+
+def covering_cells(min_lat: float, max_lat: float, min_lon: float, max_lon: float, max_cells: int = 9):
+    """
+    Geohash prefixes whose cells together cover the box: the finest precision
+    needing at most `max_cells` cells. [""] (everything) for very large boxes.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(
+            int((min_lat + 90) // height), min(int((max_lat + 90) // height), int(180 / height) - 1) + 1
+        )
+        cols = range(
+            int((min_lon + 180) // width), min(int((max_lon + 180) // width), int(360 / width) - 1) + 1
+        )
+        if len(rows) * len(cols) <= max_cells:
+            return [
+                encode(-90 + (row + 0.5) * height, -180 + (col + 0.5) * width, precision)
+                for row in rows
+                for col in cols
+            ]
+    return [""]
+
+
+def nearest(ids, lats, lons, lat: float, lon: float, radius_km: float, limit: int):
+    """
+    Refine bounding-box candidates with a vectorized haversine.
+    Returns [(id, distance_km)] within radius_km, nearest first, at most `limit`.
+    """
+    import numpy as np
+
+    if not len(ids):
+        return []
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    inside = np.flatnonzero(distances <= radius_km)
+    order = inside[np.argsort(distances[inside], kind="stable")[:limit]]
+    ids = np.asarray(ids)
+    return [(int(ids[i]), float(distances[i])) for i in order]
+
+
+def backfill(db) -> int:
+    """
+    Fill Item.geohash for items that got coordinates before the column
+    existed. Takes a Session or Connection; does not commit. Returns the count.
+    """
+    from sqlalchemy import select, update, bindparam
+    import models
+
+    table = models.Item.__table__
+    rows = db.execute(
+        select(table.c.id, table.c.latitude, table.c.longitude).where(
+            table.c.latitude.isnot(None), table.c.longitude.isnot(None), table.c.geohash.is_(None)
+        )
+    ).all()
+    if rows:
+        db.execute(
+            update(table).where(table.c.id == bindparam("item_id")).values(geohash=bindparam("cell")),
+            [{"item_id": i, "cell": encode(lat, lon)} for i, lat, lon in rows],
+        )
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+    import migrate
+
+    migrate.upgrade()
+    session = SessionLocal()
+    try:
+        count = backfill(session)
+        session.commit()
+        print(f"Geohashed {count} items")
+    finally:
+        session.close()
@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+import cache
+import models
+
+# Item.geocode_status values
+PENDING = "pending"
+DONE = "done"
+NOT_FOUND = "not_found"
+
+
+def query_key(store_name: str, location_text: str) -> str:
+    """GeocodeCache key: both parts case-folded with whitespace collapsed."""
+    return f"{models.normalize_store_name(store_name)}|{models.normalize_store_name(location_text)}"
+
+
+# --- Geocoders ---
+# Anything with geocode(query) -> (lat, lon) or None. Raising means "try again later".
+class NominatimGeocoder:
+    def __init__(self, user_agent: str = "wardrobe_app_v1", timeout: float = 10):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self._client = None
+
+    def geocode(self, query: str):
+        # Only the worker thread calls this, so no locking around the lazy client
+        if self._client is None:
+            from geopy.geocoders import Nominatim
+
+            self._client = Nominatim(user_agent=self.user_agent, timeout=self.timeout)
+        location = self._client.geocode(query)
+        return (location.latitude, location.longitude) if location else None
+
+
+class StaticGeocoder:
+    """Answers from a fixed {query: [lat, lon]} mapping. Offline stand-in for dev and tests."""
+
+    def __init__(self, places: dict):
+        self.places = {models.normalize_store_name(q): tuple(coords) for q, coords in places.items()}
+
+    def geocode(self, query: str):
+        return self.places.get(models.normalize_store_name(query))
+
+
+def geocoder_from_env():
+    """GEOCODER=static reads GEOCODER_PLACES_FILE (JSON); anything else uses Nominatim."""
+    if os.environ.get("GEOCODER", "nominatim") == "static":
+        path = os.environ.get("GEOCODER_PLACES_FILE")
+        places = {}
+        if path:
+            with open(path) as f:
+                places = json.load(f)
+        return StaticGeocoder(places)
+    return NominatimGeocoder(os.environ.get("GEOCODER_USER_AGENT", "wardrobe_app_v1"))
+
+
+# --- Cache ---
+def cached_coordinates(db: Session, store_name: str, location_text: str):
+    """(hit, coords): hit is False when this place has never been looked up."""
+    entry = db.get(models.GeocodeCache, query_key(store_name, location_text))
+    if entry is None:
+        return False, None
+    if entry.latitude is None:
+        return True, None
+    return True, (entry.latitude, entry.longitude)
+
+
+class GeocodeWorker:
+    """
+    Fills in coordinates for items posted with only location_text. A single
+    background thread looks places up at most once per `min_interval`
+    seconds (Nominatim allows 1 request/s), answers repeats from GeocodeCache,
+    and sweeps for pending items every `poll_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        geocoder,
+        session_factory,
+        min_interval: float = None,
+        batch_size: int = 50,
+        poll_interval: float = None,
+    ):
+        self.geocoder = geocoder
+        self.session_factory = session_factory
+        self.min_interval = min_interval if min_interval is not None else float(
+            os.environ.get("GEOCODE_MIN_INTERVAL", 1.0)
+        )
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval or float(os.environ.get("GEOCODE_POLL_SECONDS", 60))
+        self.lookups = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self._last_lookup = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        """Process pending items soon. Starts the thread on first use."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="geocoder", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                after_id = 0
+                while after_id is not None and not self._stop.is_set():
+                    after_id = self.run_once(after_id)
+            except Exception as e:
+                print("Geocoding batch failed:", e)
+            self._wake.wait(self.poll_interval)
+
+    def _lookup(self, query: str):
+        # Space out calls to the geocoder; cache hits never get here
+        wait = self._last_lookup + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        try:
+            return self.geocoder.geocode(query)
+        finally:
+            self._last_lookup = time.monotonic()
+            self.lookups += 1
+
+    def run_once(self, after_id: int = 0):
+        """
+        Geocode the next batch of pending items with id > after_id. Returns the
+        last id in the batch, or None once nothing is left.
+        """
+        db = self.session_factory()
+        try:
+            pending = (
+                db.query(models.Item)
+                .options(joinedload(models.Item.store))
+                .filter(models.Item.geocode_status == PENDING, models.Item.id > after_id)
+                .order_by(models.Item.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not pending:
+                return None
+            last_id = pending[-1].id
+            for item in pending:
+                if self._stop.is_set():
+                    break
+                key = query_key(item.store.name, item.location_text)
+                hit, coords = cached_coordinates(db, item.store.name, item.location_text)
+                if hit:
+                    self.cache_hits += 1
+                else:
+                    try:
+                        coords = self._lookup(f"{item.store.name} {item.location_text}")
+                    except Exception as e:
+                        # Left pending; retried on the next sweep
+                        self.errors += 1
+                        print(f"Geocoding failed for item {item.id}:", e)
+                        continue
+                    db.add(models.GeocodeCache(
+                        query_key=key,
+                        latitude=coords[0] if coords else None,
+                        longitude=coords[1] if coords else None,
+                    ))
+
+                if coords:
+                    item.latitude, item.longitude = coords
+                item.geocode_status = DONE if coords else NOT_FOUND
+                try:
+                    db.commit()
+                    cache.bump("items")
+                except IntegrityError:
+                    # Another process cached the same place first; picked up on the next sweep
+                    db.rollback()
+            return last_id
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {"lookups": self.lookups, "cache_hits": self.cache_hits, "errors": self.errors}
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+            # A later wake() starts a fresh thread
+            self._stop.clear()
+
+
+if __name__ == "__main__":
+    # Resolve every pending item now (e.g. after importing data), using the same cache
+    from db import SessionLocal
+    import migrate
+
+    migrate.upgrade()
+    worker = GeocodeWorker(geocoder_from_env(), SessionLocal)
+    after_id = 0
+    while after_id is not None:
+        after_id = worker.run_once(after_id)
+    print("Geocoding done", worker.stats())
@@ -0,0 +1,100 @@
+import functools
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+import cache
+
+# Conditional GET for read endpoints. Every cacheable resource ("items",
+# "stores", "following:42", ...) has a version in cache.versions that the
+# write paths bump after they commit. A response's weak ETag hashes the route,
+# its parameters and the versions of the resources it reads, so a client
+# revalidating with If-None-Match gets a 304 without the database being
+# touched. With RESPONSE_CACHE=1 the rendered body is also kept under its ETag.
+#
+# Versions must be shared by every worker: with the in-process cache a worker
+# never sees another's bump() and would answer 304 (or a cached body) for up
+# to CACHE_TTL_SECONDS after a write. So this is on by default only with
+# CACHE_BACKEND=redis; CONDITIONAL_GET=1 turns it on for a single-worker
+# deployment with the memory backend, CONDITIONAL_GET=0 turns it off.
+ENABLED = os.environ.get(
+    "CONDITIONAL_GET", "1" if os.environ.get("CACHE_BACKEND", "memory") == "redis" else "0"
+) == "1"
+RESPONSE_CACHE = ENABLED and os.environ.get("RESPONSE_CACHE") == "1"
+
+# Clients must revalidate every time; tokens make most of these per-user
+CACHE_CONTROL = "private, no-cache"
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def render_json(response_type, rows) -> bytes:
+    """Serialize ORM rows or dicts as `response_type`, the same way response_model would."""
+    adapter = _adapter(response_type)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def _etag(request: Request, vary, versions) -> str:
+    key = "|".join([
+        request.url.path,
+        "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items())),
+        ",".join(str(v) for v in vary),
+        ",".join(str(v) for v in versions),
+    ])
+    return 'W/"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+
+def _not_modified(request: Request, etag: str, modified_at: int) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: the W/ prefix is ignored on both sides
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return modified_at <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def respond(request: Request, resources, render, vary=()) -> Response:
+    """
+    Answer a GET from its resources' versions: 304 when the client's copy is
+    current, else the rendered body. `render()` returns (json bytes, extra
+    headers); `vary` lists anything besides the URL the body depends on
+    (e.g. the caller's id). When conditional GETs are off it just renders.
+    """
+    if not ENABLED:
+        body, extra = render()
+        return Response(content=body, media_type="application/json", headers=extra)
+
+    # Read before rendering: a write landing in between then only makes the
+    # body newer than its ETag, never older
+    versions = [cache.version(resource) for resource in resources]
+    etag = _etag(request, vary, versions)
+    modified_at = max(versions) // 1_000_000_000
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified_at, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, modified_at):
+        return Response(status_code=304, headers=headers)
+
+    if RESPONSE_CACHE:
+        entry = cache.responses.get_or_load(etag, lambda: _render_entry(render))
+        body, extra = entry["body"].encode(), entry["headers"]
+    else:
+        body, extra = render()
+    return Response(content=body, media_type="application/json", headers={**headers, **extra})
+
+
+def _render_entry(render) -> dict:
+    body, extra = render()
+    return {"body": body.decode(), "headers": extra}
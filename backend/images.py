@@ -0,0 +1,371 @@
+import hashlib
+import io
+import logging
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+import cache
+import metrics
+import models
+
+# Longest edge of each stored rendition, largest first
+VARIANTS = [("full", 800), ("card", 400), ("thumb", 160)]
+MAX_DIMENSION = VARIANTS[0][1]
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+# Item.image_status values
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the raw upload; keys ImageAsset and names the uploaded files."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_image(data: bytes) -> bool:
+    """Cheap header check: can Pillow identify this upload?"""
+    with metrics.span("image_header_check"):
+        from PIL import Image, UnidentifiedImageError
+
+        try:
+            Image.open(io.BytesIO(data))
+        except UnidentifiedImageError:
+            return False
+        return True
+
+
+def _encode(img, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def process_image(data: bytes, webp: bool = False, timings: dict = None):
+    """
+    Decode an upload once and render every variant from it. Runs in a worker process.
+    Returns a list of (variant_name, encoded_bytes, extension). If given,
+    `timings` gets the decode and resize/encode seconds.
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    # For JPEGs, let libjpeg downscale by a power of two while decoding instead
+    # of materializing a full-resolution phone photo (no-op for other formats)
+    img.draft("RGB", (MAX_DIMENSION, MAX_DIMENSION))
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    decoded = time.perf_counter()
+
+    rendered = []
+    for name, size in VARIANTS:
+        # Each variant is resized from the previous, smaller-than-original one
+        img = img.copy()
+        img.thumbnail((size, size))
+        rendered.append((name, _encode(img, "JPEG", JPEG_QUALITY), "jpg"))
+        if webp:
+            rendered.append((f"{name}_webp", _encode(img, "WEBP", WEBP_QUALITY), "webp"))
+    if timings is not None:
+        timings["image_decode"] = decoded - start
+        timings["image_encode"] = time.perf_counter() - decoded
+    return rendered
+
+
+def _process_timed(data: bytes, webp: bool):
+    # Worker processes can't record metrics for the app; send the timings back
+    timings = {}
+    return process_image(data, webp, timings), timings
+
+
+# --- Uploaders ---
+class CloudinaryUploader:
+    """Configured on first upload, so a missing key fails that upload rather than app startup."""
+
+    def __init__(self):
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def _configure(self):
+        import cloudinary
+
+        with self._lock:
+            if self._configured:
+                return
+            if not self.is_configured():
+                raise RuntimeError(
+                    "Cloudinary is not configured. Set CLOUDINARY_CLOUD_NAME, "
+                    "CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET."
+                )
+            cloudinary.config(
+                cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
+                api_key=os.environ.get("CLOUDINARY_API_KEY"),
+                api_secret=os.environ.get("CLOUDINARY_API_SECRET"),
+                secure=True,
+            )
+            self._configured = True
+
+    @staticmethod
+    def is_configured() -> bool:
+        return all([
+            os.environ.get("CLOUDINARY_CLOUD_NAME"),
+            os.environ.get("CLOUDINARY_API_KEY"),
+            os.environ.get("CLOUDINARY_API_SECRET"),
+        ])
+
+    def upload(self, data: bytes, public_id: str, ext: str = "jpg") -> str:
+        import cloudinary.uploader
+
+        self._configure()
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data),
+            folder="friendly-closet",
+            public_id=public_id,
+            format=ext,
+            resource_type="image",
+        )
+        return result.get("secure_url")
+
+
+class LocalUploader:
+    """Writes images to a local directory. Stands in for Cloudinary in dev and tests."""
+
+    def __init__(self, directory: str = "uploads"):
+        self.directory = directory
+
+    def upload(self, data: bytes, public_id: str, ext: str = "jpg") -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{public_id}.{ext}")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+def uploader_from_env():
+    """IMAGE_UPLOADER=local selects LocalUploader (UPLOAD_DIR); anything else uses Cloudinary."""
+    if os.environ.get("IMAGE_UPLOADER", "cloudinary") == "local":
+        return LocalUploader(os.environ.get("UPLOAD_DIR", "uploads"))
+    return CloudinaryUploader()
+
+
+# --- Background pipeline ---
+class ImagePipeline:
+    """
+    Moves image work off the request path. Pillow runs in a bounded process
+    pool, uploads run on a small thread pool with retries, and the item row
+    is updated from PENDING to READY (or FAILED) when every variant is uploaded.
+
+    Raw uploads are spooled to disk (IMAGE_SPOOL_DIR) until their item is
+    finished, so items still pending when the process stops are picked up
+    again by resume() on the next start.
+    """
+
+    def __init__(
+        self,
+        uploader,
+        session_factory,
+        process_workers: int = None,
+        upload_workers: int = None,
+        max_pending: int = None,
+        retries: int = None,
+        retry_backoff: float = 1.0,
+        webp: bool = None,
+        on_finish=None,
+        spool_dir: str = None,
+    ):
+        self.uploader = uploader
+        self.session_factory = session_factory
+        # Called as on_finish(db, item) once an item's row is READY or FAILED
+        self.on_finish = on_finish
+        self.process_workers = process_workers or int(os.environ.get("IMAGE_PROCESS_WORKERS", 2))
+        self.upload_workers = upload_workers or int(os.environ.get("IMAGE_UPLOAD_WORKERS", 4))
+        self.retries = retries if retries is not None else int(os.environ.get("IMAGE_UPLOAD_RETRIES", 3))
+        self.retry_backoff = retry_backoff
+        self.webp = webp if webp is not None else os.environ.get("IMAGE_WEBP") == "1"
+        # Not under the upload directory: that one is served to clients
+        self.spool_dir = spool_dir or os.environ.get("IMAGE_SPOOL_DIR", "image-spool")
+        # Callers block in submit() once this many jobs are queued (backpressure)
+        self._slots = threading.BoundedSemaphore(
+            max_pending or int(os.environ.get("IMAGE_MAX_PENDING", 64))
+        )
+        self._process_pool = None
+        self._upload_pool = None
+        self._resumer = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def _pools(self):
+        # Created lazily so importing the app never forks worker processes
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+                self._upload_pool = ThreadPoolExecutor(
+                    max_workers=self.upload_workers, thread_name_prefix="image-upload"
+                )
+            return self._process_pool, self._upload_pool
+
+    def submit(self, item_id: int, data: bytes, digest: str):
+        """Queue an item's raw upload. Returns a future that resolves once the row is updated."""
+        self._spool(item_id, data)
+        return self._queue(item_id, data, digest)
+
+    def _queue(self, item_id: int, data: bytes, digest: str):
+        self._slots.acquire()
+        try:
+            process_pool, upload_pool = self._pools()
+            future = upload_pool.submit(self._run, process_pool, item_id, data, digest)
+        except BaseException:
+            # Never queued, so no done callback will give the slot back
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _spool_path(self, item_id: int) -> str:
+        return os.path.join(self.spool_dir, str(item_id))
+
+    def _spool(self, item_id: int, data: bytes):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Written whole or not at all; resume() must never see a partial file
+        path = self._spool_path(item_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def resume(self):
+        """
+        Call at startup. Re-queues the items a previous run left PENDING from
+        their spooled uploads, in the background so startup never waits on
+        backpressure; items whose upload never reached the spool are FAILED.
+        """
+        spooled = {
+            int(name) for name in (os.listdir(self.spool_dir) if os.path.isdir(self.spool_dir) else ())
+            if name.isdigit()
+        }
+        db = self.session_factory()
+        try:
+            pending = [
+                item_id for (item_id,) in
+                db.query(models.Item.id).filter(models.Item.image_status == PENDING).order_by(models.Item.id)
+            ]
+            lost = [item_id for item_id in pending if item_id not in spooled]
+            if lost:
+                db.query(models.Item).filter(models.Item.id.in_(lost)).update(
+                    {models.Item.image_status: FAILED}, synchronize_session=False
+                )
+                db.commit()
+                cache.bump("items")
+                logging.warning("Images of %d pending items were never spooled; marked failed: %s", len(lost), lost)
+        finally:
+            db.close()
+
+        # Spooled but no longer pending: a process stopped between finishing the
+        # item and cleaning up. The spool is listed before the query, so a file
+        # another worker is still using always belongs to a pending item.
+        for item_id in spooled - set(pending):
+            try:
+                os.remove(self._spool_path(item_id))
+            except FileNotFoundError:
+                pass
+
+        queued = [item_id for item_id in pending if item_id in spooled]
+        if queued:
+            with self._lock:
+                self._stopping.clear()
+                self._resumer = threading.Thread(
+                    target=self._resubmit, args=(queued,), name="image-resume", daemon=True
+                )
+                self._resumer.start()
+
+    def _resubmit(self, item_ids):
+        for item_id in item_ids:
+            # The rest stay spooled for the next start
+            if self._stopping.is_set():
+                return
+            try:
+                with open(self._spool_path(item_id), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # Another worker process resumed and finished it first
+                continue
+            self._queue(item_id, data, content_hash(data))
+
+    def _run(self, process_pool, item_id: int, data: bytes, digest: str):
+        urls = None
+        try:
+            rendered, timings = process_pool.submit(_process_timed, data, self.webp).result()
+            for name, seconds in timings.items():
+                metrics.record_span(name, seconds)
+            # Files are content-addressed, so re-uploading the same image overwrites itself
+            public_id = digest[:32]
+            urls = {
+                name: self._upload_with_retries(encoded, f"{public_id}_{name}", ext)
+                for name, encoded, ext in rendered
+            }
+        except Exception:
+            logging.exception("Image processing failed for item %s", item_id)
+
+        self._finish(item_id, urls, digest)
+        try:
+            os.remove(self._spool_path(item_id))
+        except FileNotFoundError:
+            pass
+        return urls
+
+    def _upload_with_retries(self, data: bytes, public_id: str, ext: str) -> str:
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.span("image_upload"):
+                    return self.uploader.upload(data, public_id, ext)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def _finish(self, item_id: int, urls: dict, digest: str):
+        db = self.session_factory()
+        try:
+            item = db.get(models.Item, item_id)
+            if item is not None:
+                if urls:
+                    item.image_path = urls["full"]
+                    item.image_variants = urls
+                item.image_status = READY if urls else FAILED
+                db.commit()
+                cache.bump("items")
+                if self.on_finish is not None:
+                    try:
+                        self.on_finish(db, item)
+                    except Exception:
+                        logging.exception("Image completion hook failed for item %s", item_id)
+
+            if urls:
+                db.add(models.ImageAsset(content_hash=digest, image_path=urls["full"], image_variants=urls))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # The same image finished processing concurrently
+                    db.rollback()
+        finally:
+            db.close()
+
+    def shutdown(self, wait: bool = True):
+        # Stop resuming first, so nothing is submitted to the pools being shut down
+        self._stopping.set()
+        with self._lock:
+            resumer, self._resumer = self._resumer, None
+        if resumer is not None:
+            resumer.join()
+        # Waits outside the lock: queued jobs still running must not block on it
+        with self._lock:
+            process_pool, upload_pool = self._process_pool, self._upload_pool
+            self._process_pool = self._upload_pool = None
+        if upload_pool is not None:
+            upload_pool.shutdown(wait=wait)
+            process_pool.shutdown(wait=wait)
@@ -1,107 +1,254 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Header, Response, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, update, delete, and_, or_
 from typing import List, Optional
 import os
 import io
-from datetime import datetime
-from passlib.context import CryptContext
+import logging
+import tempfile
+import inspect
+import functools
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from db import engine, Base, get_db
+from db import (
+    read_engine, get_db, get_read_db, SessionLocal, ReadSessionLocal, count_queries, pool_metrics,
+    insert_ignore,
+    ASYNC_DB, get_async_db, get_async_read_db,
+)
 import models
 import schemas
-import elo
-from PIL import Image, ImageOps
-from geopy.geocoders import Nominatim
-import cloudinary
-import cloudinary.uploader
-
-# Initialize Geocoder
-geolocator = Nominatim(user_agent="wardrobe_app_v1")
-
-# Create Tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Wardrobe API")
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-
-cloudinary_configured = all([
-    os.environ.get("CLOUDINARY_CLOUD_NAME"),
-    os.environ.get("CLOUDINARY_API_KEY"),
-    os.environ.get("CLOUDINARY_API_SECRET"),
-])
-if not cloudinary_configured:
-    raise RuntimeError(
-        "Cloudinary is not configured. Set CLOUDINARY_CLOUD_NAME, "
-        "CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET."
-    )
-cloudinary.config(
-    cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.environ.get("CLOUDINARY_API_KEY"),
-    api_secret=os.environ.get("CLOUDINARY_API_SECRET"),
-    secure=True,
-)
+import timeline
+import scores
+import passwords
+import tokens
+import cache
+import stores
+import geo
+import geocoding
+import bulk
+import images
+import migrate
+import metrics
+import http_cache
+import events
+from pagination import keyset_page, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Importing this module must stay cheap and side-effect free: no database
+# access, no network clients, no worker threads. Those start in lifespan()
+# or on first use. The schema is managed by migrate.py.
+router = APIRouter()
+
+# New items and follow request changes are pushed to the users involved (see events.py)
+def push_item(db: Session, item: models.Item):
+    """Send an item to its poster's followers' /events streams. Call after commit."""
+    follower_ids = cache.follower_ids(db, item.user_id)
+    if follower_ids:
+        data = schemas.ItemOut.model_validate(item, from_attributes=True).model_dump(mode="json")
+        events.hub.publish(follower_ids, "item", data)
+
+# Image processing and upload happen in the background (see images.py);
+# followers get the item again once its image is ready
+uploader = images.uploader_from_env()
+image_pipeline = images.ImagePipeline(uploader, SessionLocal, on_finish=push_item)
+
+# Items posted with only location_text are geocoded in the background (see geocoding.py)
+geocode_worker = geocoding.GeocodeWorker(geocoding.geocoder_from_env(), SessionLocal)
+
+# Test mode: report how many SQL statements each request issued, so
+# endpoints can be checked for a fixed query count regardless of row count.
+async def add_query_count_header(request, call_next):
+    with count_queries() as counter:
+        response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter[0])
+    return response
+
+def async_endpoint(endpoint):
+    """
+    With DB_ASYNC=1, turns a sync `db: Session` endpoint into an `async def` one
+    that gets an AsyncSession and runs the same body through run_sync, on the
+    event loop instead of the threadpool. Otherwise returns the endpoint as is.
+    """
+    if not ASYNC_DB:
+        return endpoint
+
+    sig = inspect.signature(endpoint)
+    params = [
+        p.replace(default=Depends(
+            get_async_read_db if p.default.dependency is get_read_db else get_async_db
+        )) if p.name == "db" else p
+        for p in sig.parameters.values()
+    ]
 
-# Setup CORS for localhost frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    @functools.wraps(endpoint)
+    async def wrapper(**kwargs):
+        db = kwargs.pop("db")
+        return await db.run_sync(lambda session: endpoint(db=session, **kwargs))
+
+    wrapper.__signature__ = sig.replace(parameters=params)
+    return wrapper
 
 class UserCreate(BaseModel):
     username: str
     password: str
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Everything below plus request/SQL/span timings, in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def collect_component_stats():
+    """The /metrics/* JSON stats as Prometheus families (see metrics.register_collector)."""
+    pools = pool_metrics()
+    caches = cache.stats()
+    hasher = passwords.hasher.stats()
+    geocoder = geocode_worker.stats()
+    streams = events.hub.stats()
+
+    def per_engine(key):
+        return [((name,), stats[key]) for name, stats in pools.items()]
+
+    def per_cache(key):
+        return [((name,), stats[key]) for name, stats in caches.items()]
+
+    return [
+        ("db_pool_size", "gauge", "Pool size.", ("engine",), per_engine("size")),
+        ("db_pool_checked_out", "gauge", "Connections in use.", ("engine",), per_engine("checked_out")),
+        ("db_pool_overflow", "gauge", "Connections beyond pool_size.", ("engine",), per_engine("overflow")),
+        ("db_pool_checkouts_total", "counter", "Connection checkouts.", ("engine",), per_engine("checkouts")),
+        ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", ("engine",),
+         per_engine("wait_seconds_total")),
+        ("cache_hits_total", "counter", "Lookup cache hits.", ("cache",), per_cache("hits")),
+        ("cache_misses_total", "counter", "Lookup cache misses.", ("cache",), per_cache("misses")),
+        ("cache_evictions_total", "counter", "LRU evictions.", ("cache",), per_cache("evictions")),
+        ("password_hasher_running", "gauge", "Hashes in progress.", (), [((), hasher["running"])]),
+        ("password_hasher_queued", "gauge", "Hashes waiting for a worker.", (), [((), hasher["queued"])]),
+        ("password_hasher_rejected_total", "counter", "Logins refused with 503.", (), [((), hasher["rejected"])]),
+        ("geocoder_lookups_total", "counter", "Remote geocoding calls.", (), [((), geocoder["lookups"])]),
+        ("geocoder_errors_total", "counter", "Failed geocoding calls.", (), [((), geocoder["errors"])]),
+        ("events_connections", "gauge", "Open /events streams.", (), [((), streams["connections"])]),
+        ("events_published_total", "counter", "Events published by this worker.", (), [((), streams["published"])]),
+        ("events_delivered_total", "counter", "Events queued to streams.", (), [((), streams["delivered"])]),
+    ]
+
+metrics.register_collector(collect_component_stats)
+
+@router.get("/metrics/pool")
+def get_pool_metrics():
+    """Connection pool usage and checkout wait per engine, for sizing workers/pools."""
+    return pool_metrics()
+
+@router.get("/metrics/cache")
+def get_cache_metrics():
+    """Hit/miss/invalidation counters of the lookup caches."""
+    return cache.stats()
+
+@router.get("/metrics/geocoding")
+def get_geocoding_metrics():
+    """Background geocoder: remote lookups, cache hits and errors."""
+    return geocode_worker.stats()
+
+@router.get("/metrics/events")
+def get_events_metrics():
+    """Real-time push: open streams, backlog size and published/delivered event counts."""
+    return events.hub.stats()
+
+@router.get("/metrics/auth")
+def get_auth_metrics():
+    """Password hashing pool: running/queued hashes, rejections and busy time."""
+    return passwords.hasher.stats()
+
 # --- AUTH ---
-@app.post("/auth", response_model=schemas.UserOut)
-def login_or_create(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Try to find user
-    print(f"DEBUG: Password received is: '{user_data.password}'")
-    user = db.query(models.User).filter(models.User.username == user_data.username).first()
-
-    if not user:
-        # CREATE NEW USER
-        hashed_password = pwd_context.hash(user_data.password)
-        user = models.User(username=user_data.username, password_hash=hashed_password)
-        db.add(user)
-        try:
-            db.commit()
-            db.refresh(user)
-        except IntegrityError:
-            db.rollback()
-            raise HTTPException(status_code=400, detail="Username already taken")
-    else:
-        # VERIFY PASSWORD
-        if not pwd_context.verify(user_data.password, user.password_hash):
-             raise HTTPException(status_code=400, detail="Incorrect password")
+def find_user(db: Session, username: str):
+    return db.query(models.User).filter(models.User.username == username).first()
 
+def create_user(db: Session, username: str, password_hash: str):
+    user = models.User(username=username, password_hash=password_hash)
+    db.add(user)
+    try:
+        db.commit()
+        db.refresh(user)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Username already taken")
     return user
 
-# --- SOCIAL ---
-@app.post("/follow")
-def follow_user(req: schemas.FollowRequest, db: Session = Depends(get_db)):
-    follower = db.query(models.User).filter(models.User.username == req.follower_username).first()
-    target = db.query(models.User).filter(models.User.username == req.target_username).first()
+def update_password_hash(db: Session, user: models.User, password_hash: str):
+    user.password_hash = password_hash
+    db.commit()
+    db.refresh(user)
+
+@router.post("/auth", response_model=schemas.AuthOut)
+async def login_or_create(user_data: UserCreate, db: Session = Depends(get_db)):
+    # Queries run in the threadpool, argon2 on the dedicated hashing pool, so a
+    # burst of logins waits on the event loop instead of holding request threads
+    user = await run_in_threadpool(find_user, db, user_data.username)
+
+    try:
+        if not user:
+            # CREATE NEW USER
+            hashed_password = await passwords.hasher.hash(user_data.password)
+            user = await run_in_threadpool(create_user, db, user_data.username, hashed_password)
+        else:
+            # VERIFY PASSWORD
+            valid, new_hash = await passwords.hasher.verify_and_update(user_data.password, user.password_hash)
+            if not valid:
+                raise HTTPException(status_code=400, detail="Incorrect password")
+            if new_hash:
+                # Hashed with outdated argon2 parameters: upgrade it while we have the password
+                await run_in_threadpool(update_password_hash, db, user, new_hash)
+    except passwords.HasherBusy:
+        raise HTTPException(
+            status_code=503, detail="Too many logins in progress, please retry", headers={"Retry-After": "1"}
+        )
+
+    return schemas.AuthOut(
+        id=user.id,
+        username=user.username,
+        created_at=user.created_at,
+        token=tokens.issue_token(user.id, user.username),
+    )
 
-    if not follower or not target:
+# --- SOCIAL ---
+# The caller comes from their signed token (tokens.current_user), so these
+# endpoints work from ids and never look the caller up in the database.
+def user_id_by_username(db: Session, username: str) -> int:
+    user_id = cache.user_id(db, username)
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+@router.post("/follow")
+@async_endpoint
+def follow_user(
+    req: schemas.FollowTarget,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    db: Session = Depends(get_db),
+):
+    target_id = user_id_by_username(db, req.target_username)
 
-    if follower.id == target.id:
+    if target_id == me.id:
         raise HTTPException(status_code=400, detail="You cannot follow yourself")
 
-    if target in follower.following:
-        return {"message": f"Already following {target.username}"}
+    # From the table, not cache.following_ids: another worker's cache may be behind
+    already_following = (
+        db.query(models.follows.c.followed_id)
+        .filter(models.follows.c.follower_id == me.id, models.follows.c.followed_id == target_id)
+        .first()
+    )
+    if already_following:
+        return {"message": f"Already following {req.target_username}"}
 
     existing = (
         db.query(models.FollowRequest)
         .filter(
-            models.FollowRequest.requester_id == follower.id,
-            models.FollowRequest.target_id == target.id,
+            models.FollowRequest.requester_id == me.id,
+            models.FollowRequest.target_id == target_id,
             models.FollowRequest.status == "pending",
         )
         .first()
@@ -109,143 +256,202 @@ def follow_user(req: schemas.FollowRequest, db: Session = Depends(get_db)):
     if existing:
         return {"message": "Follow request already sent"}
 
-    request = models.FollowRequest(requester_id=follower.id, target_id=target.id, status="pending")
+    request = models.FollowRequest(requester_id=me.id, target_id=target_id, status="pending")
     db.add(request)
-    db.commit()
-    return {"message": f"Follow request sent to {target.username}"}
-
-@app.post("/unfollow")
-def unfollow_user(req: schemas.FollowRequest, db: Session = Depends(get_db)):
-    follower = db.query(models.User).filter(models.User.username == req.follower_username).first()
-    target = db.query(models.User).filter(models.User.username == req.target_username).first()
-
-    if not follower or not target:
-        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent /follow for the same pair won (one pending request per pair)
+        db.rollback()
+        return {"message": "Follow request already sent"}
+    push_follow_request(db, request.id)
+    return {"message": f"Follow request sent to {req.target_username}"}
+
+@router.post("/unfollow")
+@async_endpoint
+def unfollow_user(
+    req: schemas.FollowTarget,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    db: Session = Depends(get_db),
+):
+    target_id = user_id_by_username(db, req.target_username)
 
-    if target not in follower.following:
-        return {"message": f"Not following {target.username}"}
+    removed = db.execute(
+        delete(models.follows).where(
+            models.follows.c.follower_id == me.id, models.follows.c.followed_id == target_id
+        )
+    ).rowcount
+    if not removed:
+        return {"message": f"Not following {req.target_username}"}
 
-    follower.following.remove(target)
+    timeline.prune(db, me.id, target_id)
     db.commit()
-    return {"message": f"Unfollowed {target.username}"}
-
-@app.get("/follow_requests", response_model=List[schemas.FollowRequestOut])
-def get_follow_requests(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    cache.follow_changed(me.id, target_id)
+    return {"message": f"Unfollowed {req.target_username}"}
 
+def list_follow_requests(db: Session, column, user_id: int) -> List[schemas.FollowRequestOut]:
     requests = (
         db.query(models.FollowRequest)
+        .options(joinedload(models.FollowRequest.requester), joinedload(models.FollowRequest.target))
         .filter(
-            models.FollowRequest.target_id == user.id,
+            column == user_id,
             models.FollowRequest.status == "pending",
         )
         .order_by(models.FollowRequest.created_at.desc())
         .all()
     )
 
-    return [
-        schemas.FollowRequestOut(
-            id=r.id,
-            requester_username=r.requester.username,
-            target_username=r.target.username,
-            status=r.status,
-            created_at=r.created_at,
-        )
-        for r in requests
-    ]
+    return [follow_request_out(r) for r in requests]
 
-@app.get("/follow_requests/sent", response_model=List[schemas.FollowRequestOut])
-def get_sent_follow_requests(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def follow_request_out(r: models.FollowRequest) -> schemas.FollowRequestOut:
+    return schemas.FollowRequestOut(
+        id=r.id,
+        requester_username=r.requester.username,
+        target_username=r.target.username,
+        status=r.status,
+        created_at=r.created_at,
+    )
 
-    requests = (
+def push_follow_request(db: Session, request_id: int):
+    """Send a follow request's current state to both parties' /events streams. Call after commit."""
+    r = (
         db.query(models.FollowRequest)
-        .filter(
-            models.FollowRequest.requester_id == user.id,
-            models.FollowRequest.status == "pending",
-        )
-        .order_by(models.FollowRequest.created_at.desc())
-        .all()
+        .options(joinedload(models.FollowRequest.requester), joinedload(models.FollowRequest.target))
+        .filter(models.FollowRequest.id == request_id)
+        .one()
+    )
+    events.hub.publish(
+        [r.requester_id, r.target_id], "follow_request", follow_request_out(r).model_dump(mode="json")
     )
 
-    return [
-        schemas.FollowRequestOut(
-            id=r.id,
-            requester_username=r.requester.username,
-            target_username=r.target.username,
-            status=r.status,
-            created_at=r.created_at,
-        )
-        for r in requests
-    ]
+@router.get("/follow_requests", response_model=List[schemas.FollowRequestOut])
+@async_endpoint
+def get_follow_requests(me: tokens.TokenUser = Depends(tokens.current_user), db: Session = Depends(get_read_db)):
+    return list_follow_requests(db, models.FollowRequest.target_id, me.id)
+
+@router.get("/follow_requests/sent", response_model=List[schemas.FollowRequestOut])
+@async_endpoint
+def get_sent_follow_requests(me: tokens.TokenUser = Depends(tokens.current_user), db: Session = Depends(get_read_db)):
+    return list_follow_requests(db, models.FollowRequest.requester_id, me.id)
 
-@app.post("/follow_requests/{request_id}/accept")
-def accept_follow_request(request_id: int, username: str, db: Session = Depends(get_db)):
-    req = db.query(models.FollowRequest).filter(models.FollowRequest.id == request_id).first()
+def get_own_request(db: Session, request_id: int, owner_column: str, user_id: int) -> models.FollowRequest:
+    """The follow request, if `user_id` is its requester/target (per owner_column)."""
+    req = db.get(models.FollowRequest, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
 
-    if req.target.username != username:
+    if getattr(req, owner_column) != user_id:
         raise HTTPException(status_code=403, detail="Not allowed")
+    return req
 
-    if req.status != "pending":
+def transition_request(db: Session, req: models.FollowRequest, status: str) -> bool:
+    """
+    Move a pending request to `status`. False if it was already handled, also
+    by a concurrent accept/reject/cancel that read it as pending too. Does not commit.
+    """
+    return db.execute(
+        update(models.FollowRequest)
+        .where(models.FollowRequest.id == req.id, models.FollowRequest.status == "pending")
+        .values(status=status)
+    ).rowcount == 1
+
+@router.post("/follow_requests/{request_id}/accept")
+@async_endpoint
+def accept_follow_request(
+    request_id: int,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    db: Session = Depends(get_db),
+):
+    req = get_own_request(db, request_id, "target_id", me.id)
+    if not transition_request(db, req, "accepted"):
         return {"message": "Request already handled"}
 
-    req.requester.following.append(req.target)
-    req.status = "accepted"
+    added = insert_ignore(
+        db,
+        models.follows,
+        [{"follower_id": req.requester_id, "followed_id": req.target_id}],
+        ["follower_id"],
+    )
+    if added:
+        timeline.backfill(db, req.requester_id, req.target_id)
     db.commit()
+    if added:
+        cache.follow_changed(req.requester_id, req.target_id)
+    push_follow_request(db, request_id)
     return {"message": "Follow request accepted"}
 
-@app.post("/follow_requests/{request_id}/reject")
-def reject_follow_request(request_id: int, username: str, db: Session = Depends(get_db)):
-    req = db.query(models.FollowRequest).filter(models.FollowRequest.id == request_id).first()
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-
-    if req.target.username != username:
-        raise HTTPException(status_code=403, detail="Not allowed")
-
-    if req.status != "pending":
+@router.post("/follow_requests/{request_id}/reject")
+@async_endpoint
+def reject_follow_request(
+    request_id: int,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    db: Session = Depends(get_db),
+):
+    req = get_own_request(db, request_id, "target_id", me.id)
+    if not transition_request(db, req, "rejected"):
         return {"message": "Request already handled"}
-
-    req.status = "rejected"
     db.commit()
+    push_follow_request(db, request_id)
     return {"message": "Follow request rejected"}
 
-@app.post("/follow_requests/{request_id}/cancel")
-def cancel_follow_request(request_id: int, username: str, db: Session = Depends(get_db)):
-    req = db.query(models.FollowRequest).filter(models.FollowRequest.id == request_id).first()
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-
-    if req.requester.username != username:
-        raise HTTPException(status_code=403, detail="Not allowed")
-
-    if req.status != "pending":
+@router.post("/follow_requests/{request_id}/cancel")
+@async_endpoint
+def cancel_follow_request(
+    request_id: int,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    db: Session = Depends(get_db),
+):
+    req = get_own_request(db, request_id, "requester_id", me.id)
+    if not transition_request(db, req, "cancelled"):
         return {"message": "Request already handled"}
-
-    req.status = "cancelled"
     db.commit()
+    push_follow_request(db, request_id)
     return {"message": "Follow request cancelled"}
 
-@app.get("/users/{username}/following", response_model=List[schemas.UserOut])
-def get_following(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user: raise HTTPException(404, "User not found")
-    return user.following
+def users_by_id(db: Session, user_ids):
+    if not user_ids:
+        return []
+    return db.query(models.User).filter(models.User.id.in_(user_ids)).order_by(models.User.id).all()
+
+def following_of(db: Session, user_id: int):
+    return users_by_id(db, cache.following_ids(db, user_id))
+
+def followers_of(db: Session, user_id: int):
+    return users_by_id(db, cache.follower_ids(db, user_id))
 
-@app.get("/users/{username}/followers", response_model=List[schemas.UserOut])
-def get_followers(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user: raise HTTPException(404, "User not found")
-    return user.followers
+def user_list(request: Request, resource: str, load) -> Response:
+    return http_cache.respond(
+        request, [resource], lambda: (http_cache.render_json(List[schemas.UserOut], load()), {})
+    )
+
+@router.get("/me/following", response_model=List[schemas.UserOut])
+@async_endpoint
+def get_my_following(
+    request: Request, me: tokens.TokenUser = Depends(tokens.current_user), db: Session = Depends(get_read_db)
+):
+    return user_list(request, f"following:{me.id}", lambda: following_of(db, me.id))
+
+@router.get("/me/followers", response_model=List[schemas.UserOut])
+@async_endpoint
+def get_my_followers(
+    request: Request, me: tokens.TokenUser = Depends(tokens.current_user), db: Session = Depends(get_read_db)
+):
+    return user_list(request, f"followers:{me.id}", lambda: followers_of(db, me.id))
+
+@router.get("/users/{username}/following", response_model=List[schemas.UserOut])
+@async_endpoint
+def get_following(username: str, request: Request, db: Session = Depends(get_read_db)):
+    user_id = user_id_by_username(db, username)
+    return user_list(request, f"following:{user_id}", lambda: following_of(db, user_id))
+
+@router.get("/users/{username}/followers", response_model=List[schemas.UserOut])
+@async_endpoint
+def get_followers(username: str, request: Request, db: Session = Depends(get_read_db)):
+    user_id = user_id_by_username(db, username)
+    return user_list(request, f"followers:{user_id}", lambda: followers_of(db, user_id))
 
 # --- STORES ---
-@app.post("/stores", response_model=schemas.StoreOut)
+@router.post("/stores", response_model=schemas.StoreOut)
 def create_store(store: schemas.StoreCreate, db: Session = Depends(get_db)):
     db_store = models.Store(**store.model_dump())
     try:
@@ -256,11 +462,83 @@ def create_store(store: schemas.StoreCreate, db: Session = Depends(get_db)):
         db.rollback()
         # In a real app, handle duplicates gracefully
         raise HTTPException(400, "Store likely exists")
+    cache.store_added(db_store.id, db_store.name)
     return db_store
 
-@app.get("/stores", response_model=List[schemas.StoreOut])
-def get_stores(db: Session = Depends(get_db)):
-    return db.query(models.Store).all()
+@router.get("/stores", response_model=List[schemas.StoreOut])
+def get_stores(request: Request, db: Session = Depends(get_read_db)):
+    return http_cache.respond(
+        request, ["stores"], lambda: (http_cache.render_json(List[schemas.StoreOut], cache.all_stores(db)), {})
+    )
+
+@router.get("/stores/search", response_model=List[schemas.StoreOut])
+@async_endpoint
+def search_stores(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db),
+):
+    """Store name autocomplete: prefix matches first, then names containing the query."""
+    return stores.search(db, q, limit)
+
+# --- BULK EXPORT / IMPORT ---
+# Import bodies are spooled to disk past this size instead of held in memory
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+@router.get("/export/{kind}")
+def export_data(
+    kind: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user_id: Optional[int] = None,
+):
+    """Stream every item, store or score (kind: items | stores | scores) as NDJSON or CSV."""
+    if kind not in bulk.EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+
+    def generate():
+        with read_engine.connect() as connection:
+            batches = bulk.export_rows(connection, kind, user_id)
+            if format == "csv":
+                yield from bulk.to_csv(batches, bulk.columns(kind))
+            else:
+                yield from bulk.to_ndjson(batches)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'},
+    )
+
+@router.post("/import/items", response_model=schemas.ImportResult)
+async def import_items(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    me: tokens.TokenUser = Depends(tokens.current_user),
+):
+    """Add items to the caller's closet from an NDJSON or CSV body (schemas.ItemImport per record)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    def run():
+        db = SessionLocal()
+        try:
+            lines = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            return bulk.import_items(db, bulk.read_records(lines, format), me.id)
+        finally:
+            db.close()
+            spool.close()
+
+    result = await run_in_threadpool(run)
+    if result.stores_created:
+        cache.store_list.clear()
+        cache.bump("stores")
+    if result.imported:
+        cache.bump("items")
+        # Records with only location_text were left pending
+        geocode_worker.wake()
+    return result
 
 # --- ITEMS (With File Upload) ---
 # In backend/main.py
@@ -268,7 +546,7 @@ def get_stores(db: Session = Depends(get_db)):
 # 1. Make sure you have these imports at the top
 from fastapi import Form, File, UploadFile
 from typing import Optional
-@app.post("/items", response_model=schemas.ItemOut)
+@router.post("/items", response_model=schemas.ItemOut)
 def create_item(
     user_id: int = Form(...),
     store_name: str = Form(...),
@@ -285,153 +563,403 @@ def create_item(
 ):
     # 1. Handle Store
     clean_name = store_name.strip()
-    existing_store = (
-        db.query(models.Store)
-        .filter(func.lower(models.Store.name) == clean_name.lower())
-        .first()
-    )
+    store_id = cache.store_id(db, clean_name)
+    new_store = store_id is None
+    if new_store:
+        # Committed together with the item below
+        store_id, new_store = stores.get_or_create(db, clean_name, store_type)
 
-    if existing_store:
-        store_id = existing_store.id
-    else:
-        new_store = models.Store(name=clean_name, store_type=store_type)
-        db.add(new_store)
-        db.commit()
-        db.refresh(new_store)
-        store_id = new_store.id
-
-    # 2. Handle Image
-    img = Image.open(image.file)
-    img = ImageOps.exif_transpose(img)
-    img.thumbnail((800, 800))
-
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-
-    base = os.path.splitext(os.path.basename(image.filename))[0]
-    safe = "".join(c for c in base if c.isalnum() or c in ("-", "_"))[:40]
-    filename = f"{safe}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}.jpg"
-
-    buffer = io.BytesIO()
-    img.save(buffer, "JPEG", quality=80)
-    buffer.seek(0)
-    upload = cloudinary.uploader.upload(
-        buffer,
-        folder="friendly-closet",
-        public_id=os.path.splitext(filename)[0],
-        resource_type="image",
-    )
-    file_location = upload.get("secure_url")
+    # 2. Handle Image (decoding/upload run in the background)
+    raw_image = image.file.read()
+    content_hash = images.content_hash(raw_image)
+
+    # Same bytes uploaded before: reuse its renditions, no processing or upload
+    asset = db.get(models.ImageAsset, content_hash)
+    if not asset and not images.is_image(raw_image):
+        raise HTTPException(status_code=400, detail="Unsupported image file")
 
     # 3. COORDINATE LOGIC (Updated)
     final_lat = latitude
     final_lon = longitude
 
-    # Fallback: If frontend didn't send coords but sent text, try server-side geocoding
-    # Fallback: If frontend didn't send coords but sent text, try server-side geocoding
-    # if (final_lat is None or final_lon is None) and location_text:
-    #     try:
-    #         query = f"{clean_name} {location_text}"
-    #         loc = geolocator.geocode(query)
-
-    #         if loc is not None:
-    #             final_lat = loc.latitude
-    #             final_lon = loc.longitude
-
-    #     except Exception as e:
-    #         print("Server-side geocoding failed:", e)
-
+    # Fallback: If frontend didn't send coords but sent text, use a cached geocode
+    # or leave it to the background geocoder (never call the geocoder inline)
+    geocode_status = None
+    if (final_lat is None or final_lon is None) and location_text:
+        hit, coords = geocoding.cached_coordinates(db, clean_name, location_text)
+        if coords:
+            final_lat, final_lon = coords
+            geocode_status = geocoding.DONE
+        else:
+            geocode_status = geocoding.NOT_FOUND if hit else geocoding.PENDING
 
     # 4. Save Item
     new_item = models.Item(
         user_id=user_id,
         store_id=store_id,
-        image_path=file_location,
+        image_path=asset.image_path if asset else None,
+        image_variants=asset.image_variants if asset else None,
+        image_status=images.READY if asset else images.PENDING,
         location_text=location_text,
         latitude=final_lat,  # Use the decided lat
         longitude=final_lon, # Use the decided lon
+        geocode_status=geocode_status,
         materials_text=materials_text,
         rating=rating,
         notes=notes
     )
     db.add(new_item)
+    db.flush()
+    item_id = new_item.id
+    timeline.fan_out(db, item_id)
     db.commit()
+    if not asset:
+        # submit() can block on backpressure: do it while the session holds no
+        # pooled connection (between commit and its next query; new_item.id
+        # is expired by the commit, so reading it would check one out)
+        image_pipeline.submit(item_id, raw_image, content_hash)
     db.refresh(new_item)
-    return new_item
+    cache.bump("items")
+    if new_store:
+        cache.store_added(store_id, clean_name)
+    push_item(db, new_item)
 
-@app.get("/items", response_model=List[schemas.ItemOut])
-def get_feed(db: Session = Depends(get_db)):
-    return db.query(models.Item).order_by(models.Item.created_at.desc()).all()
+    if geocode_status == geocoding.PENDING:
+        geocode_worker.wake()
+    return new_item
 
-@app.get("/items/friends", response_model=List[schemas.ItemOut])
-def get_friends_feed(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def item_page(items, next_cursor):
+    return (
+        http_cache.render_json(List[schemas.ItemOut], items),
+        {"X-Next-Cursor": next_cursor} if next_cursor else {},
+    )
 
-    friend_ids = [u.id for u in user.following]
-    if not friend_ids:
+def feed_query(db: Session, user_id: Optional[int]):
+    query = db.query(models.Item).options(joinedload(models.Item.store))
+    if user_id is not None:
+        # Served in order by ix_items_user_created_at_id
+        query = query.filter(models.Item.user_id == user_id)
+    return query
+
+def stream_feed(cursor: Optional[str], batch_size: int, user_id: Optional[int] = None):
+    """Yield the feed as NDJSON, walking it page by page with its own session."""
+    # The request-scoped session is closed before a streaming body is sent
+    db = ReadSessionLocal()
+    try:
+        while True:
+            items, cursor = keyset_page(
+                feed_query(db, user_id),
+                models.Item.created_at,
+                models.Item.id,
+                cursor,
+                batch_size,
+            )
+            for item in items:
+                yield schemas.ItemOut.model_validate(item).model_dump_json() + "\n"
+            db.expunge_all()
+            if cursor is None:
+                break
+    finally:
+        db.close()
+
+@router.get("/items", response_model=List[schemas.ItemOut])
+@async_endpoint
+def get_feed(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Newest-first global feed (or one user's items, with user_id), one page at a time.
+    The cursor for the next page comes back in the X-Next-Cursor header.
+    With stream=true everything after `cursor` is sent as NDJSON, `limit` rows per batch.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if stream:
+        return StreamingResponse(stream_feed(cursor, limit, user_id), media_type="application/x-ndjson")
+
+    def render():
+        items, next_cursor = keyset_page(
+            feed_query(db, user_id),
+            models.Item.created_at,
+            models.Item.id,
+            cursor,
+            limit,
+        )
+        return item_page(items, next_cursor)
+
+    return http_cache.respond(request, ["items"], render)
+
+@router.get("/items/nearby", response_model=List[schemas.NearbyItemOut])
+@async_endpoint
+def get_nearby_items(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=geo.MAX_RADIUS_KM, description="kilometres"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Items within `radius` km of (lat, lon), nearest first."""
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius)
+    cells = geo.covering_cells(min_lat, max_lat, min_lon, max_lon)
+    # Index range scans over the covering geohash cells, trimmed to the box
+    candidates = (
+        db.query(models.Item.id, models.Item.latitude, models.Item.longitude)
+        .filter(
+            or_(*[and_(models.Item.geohash >= cell, models.Item.geohash < cell + "~") for cell in cells]),
+            models.Item.latitude.between(min_lat, max_lat),
+            models.Item.longitude.between(min_lon, max_lon),
+        )
+        .all()
+    )
+    ids, lats, lons = zip(*candidates) if candidates else ((), (), ())
+    nearest = geo.nearest(ids, lats, lons, lat, lon, radius, limit)
+    if not nearest:
         return []
 
-    return (
-        db.query(models.Item)
-        .filter(models.Item.user_id.in_(friend_ids))
-        .order_by(models.Item.created_at.desc())
-        .all()
+    by_id = {
+        item.id: item
+        for item in db.query(models.Item)
+        .options(joinedload(models.Item.store))
+        .filter(models.Item.id.in_([item_id for item_id, _ in nearest]))
+    }
+    return [
+        schemas.NearbyItemOut(
+            **schemas.ItemOut.model_validate(by_id[item_id]).model_dump(), distance_km=round(distance, 3)
+        )
+        for item_id, distance in nearest
+    ]
+
+@router.get("/items/friends", response_model=List[schemas.ItemOut])
+@async_endpoint
+def get_friends_feed(
+    request: Request,
+    me: tokens.TokenUser = Depends(tokens.current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Newest-first items from followed users, read from the materialized timeline."""
+    def render():
+        query = (
+            db.query(models.Item)
+            .options(joinedload(models.Item.store))
+            .join(models.TimelineEntry, models.TimelineEntry.item_id == models.Item.id)
+            .filter(models.TimelineEntry.user_id == me.id)
+        )
+        try:
+            items, next_cursor = keyset_page(
+                query, models.TimelineEntry.created_at, models.TimelineEntry.item_id, cursor, limit
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return item_page(items, next_cursor)
+
+    # The timeline changes when followed users post (items) or the follow set does
+    return http_cache.respond(request, ["items", f"following:{me.id}"], render, vary=(me.id,))
+
+# --- REAL-TIME ---
+@router.get("/events")
+async def stream_events(
+    me: tokens.TokenUser = Depends(tokens.stream_user),
+    cursor: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-sent events for the caller instead of polling /items/friends and
+    /follow_requests: `item` when someone they follow posts (again once its
+    image is ready) and `follow_request` when a request they sent or received
+    changes. A reconnect resumes after Last-Event-ID, or ?cursor= for the
+    first connection; `reset` means events were missed and lists should be refetched.
+    """
+    after = cursor
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return StreamingResponse(
+        events.hub.stream(me.id, after),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx would otherwise hold events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 # --- ELO RANKING SYSTEM ---
-def get_user_store_score(db: Session, user_id: int, store_id: int) -> models.UserStoreScore:
-    """Helper: fetch existing score row or create default (1200)"""
-    score_entry = db.query(models.UserStoreScore).filter_by(user_id=user_id, store_id=store_id).first()
-    if not score_entry:
-        score_entry = models.UserStoreScore(user_id=user_id, store_id=store_id, score=1200.0)
-        db.add(score_entry)
-        db.commit() # Commit so it has an ID/Persists for the calc
-        db.refresh(score_entry)
-    return score_entry
-
-@app.post("/compare_store")
+@router.post("/compare_store")
+@async_endpoint
 def compare_stores(req: schemas.CompareRequest, db: Session = Depends(get_db)):
-    # 1. Get current scores (or init defaults)
-    winner_entry = get_user_store_score(db, req.user_id, req.winner_store_id)
-    loser_entry = get_user_store_score(db, req.user_id, req.loser_store_id)
-
-    # 2. Calculate new Elo
-    new_win_score, new_lose_score = elo.calculate_elo(winner_entry.score, loser_entry.score)
+    if req.winner_store_id == req.loser_store_id:
+        raise HTTPException(status_code=400, detail="A store cannot be compared with itself")
 
-    # 3. Update DB
-    winner_entry.score = new_win_score
-    loser_entry.score = new_lose_score
-    db.commit()
+    pair = schemas.ComparePair(winner_store_id=req.winner_store_id, loser_store_id=req.loser_store_id)
+    try:
+        new_scores = scores.commit_comparisons(db, req.user_id, [pair])
+    except StaleDataError:
+        raise HTTPException(status_code=409, detail="Scores changed concurrently, please retry")
+    cache.bump(f"scores:{req.user_id}")
 
     return {
-        "winner_new_score": new_win_score,
-        "loser_new_score": new_lose_score
+        "winner_new_score": new_scores[req.winner_store_id],
+        "loser_new_score": new_scores[req.loser_store_id]
     }
 
-@app.get("/store_rankings", response_model=List[schemas.StoreRankingOut])
-def get_user_rankings(user_id: int, db: Session = Depends(get_db)):
+@router.post("/compare_store/batch", response_model=schemas.CompareBatchOut)
+@async_endpoint
+def compare_stores_batch(req: schemas.CompareBatchRequest, db: Session = Depends(get_db)):
+    """Apply many comparisons, in order, in a single transaction."""
+    if any(c.winner_store_id == c.loser_store_id for c in req.comparisons):
+        raise HTTPException(status_code=400, detail="A store cannot be compared with itself")
+
+    try:
+        new_scores = scores.commit_comparisons(db, req.user_id, req.comparisons)
+    except StaleDataError:
+        raise HTTPException(status_code=409, detail="Scores changed concurrently, please retry")
+    cache.bump(f"scores:{req.user_id}")
+
+    return schemas.CompareBatchOut(
+        scores=[schemas.StoreScoreOut(store_id=k, score=v) for k, v in new_scores.items()]
+    )
+
+@router.get("/store_rankings", response_model=List[schemas.StoreRankingOut])
+@async_endpoint
+def get_user_rankings(user_id: int, request: Request, db: Session = Depends(get_read_db)):
     """
     Returns stores sorted by the specific user's Elo score.
     If the user hasn't ranked a store, it won't appear here (or we could join and show 1200).
     Here we show only ranked stores for clarity.
     """
+    def render():
+        results = (
+            db.query(models.Store, models.UserStoreScore.score)
+            .join(models.UserStoreScore, models.Store.id == models.UserStoreScore.store_id)
+            .filter(models.UserStoreScore.user_id == user_id)
+            .order_by(models.UserStoreScore.score.desc())
+            .all()
+        )
+
+        # Format for response
+        output = []
+        for store, score in results:
+            output.append(schemas.StoreRankingOut(
+                id=store.id,
+                name=store.name,
+                store_type=store.store_type,
+                current_elo=float(score),
+            ))
+        return http_cache.render_json(List[schemas.StoreRankingOut], output), {}
+
+    return http_cache.respond(request, [f"scores:{user_id}"], render)
+
+@router.get("/store_rankings/global", response_model=List[schemas.ConsensusRankingOut])
+@async_endpoint
+def get_global_rankings(
+    min_raters: int = Query(1, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Stores by mean Elo across all users, read from the materialized StoreConsensus table."""
     results = (
-        db.query(models.Store, models.UserStoreScore.score)
-        .join(models.UserStoreScore, models.Store.id == models.UserStoreScore.store_id)
-        .filter(models.UserStoreScore.user_id == user_id)
-        .order_by(models.UserStoreScore.score.desc())
+        db.query(models.Store, models.StoreConsensus)
+        .join(models.StoreConsensus, models.StoreConsensus.store_id == models.Store.id)
+        .filter(models.StoreConsensus.rated_by >= min_raters)
+        .order_by(models.StoreConsensus.mean_score.desc())
+        .limit(limit)
         .all()
     )
+    return [
+        schemas.ConsensusRankingOut(
+            id=store.id,
+            name=store.name,
+            store_type=store.store_type,
+            mean_elo=round(consensus.mean_score, 2),
+            rated_by=consensus.rated_by,
+        )
+        for store, consensus in results
+    ]
 
-    # Format for response
-    output = []
-    for store, score in results:
-        output.append(schemas.StoreRankingOut(
+@router.get("/store_rankings/friends", response_model=List[schemas.ConsensusRankingOut])
+@async_endpoint
+def get_friends_rankings(
+    user_id: int,
+    min_raters: int = Query(1, ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Stores by mean Elo across the user and everyone they follow."""
+    circle = [user_id, *cache.following_ids(db, user_id)]
+    mean_score = func.avg(models.UserStoreScore.score)
+    rated_by = func.count(models.UserStoreScore.user_id)
+    results = (
+        db.query(models.Store, mean_score, rated_by)
+        .join(models.UserStoreScore, models.Store.id == models.UserStoreScore.store_id)
+        .filter(models.UserStoreScore.user_id.in_(circle))
+        .group_by(models.Store.id)
+        .having(rated_by >= min_raters)
+        .order_by(mean_score.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        schemas.ConsensusRankingOut(
             id=store.id,
             name=store.name,
             store_type=store.store_type,
-            current_elo=float(score),
-        ))
-    return output
+            mean_elo=round(float(mean), 2),
+            rated_by=count,
+        )
+        for store, mean, count in results
+    ]
+
+
+# --- APP ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if migrate.auto_migrate_enabled():
+        await run_in_threadpool(migrate.upgrade)
+    if isinstance(uploader, images.CloudinaryUploader) and not uploader.is_configured():
+        logging.warning("Cloudinary is not configured; image uploads will fail")
+    events.hub.start()
+    # Items left pending by a previous run are retried now, not on the next post
+    await run_in_threadpool(image_pipeline.resume)
+    geocode_worker.wake()
+    yield
+    events.hub.close()
+    image_pipeline.shutdown()
+    geocode_worker.shutdown()
+    passwords.hasher.shutdown()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Wardrobe API", lifespan=lifespan)
+
+    if isinstance(uploader, images.LocalUploader):
+        app.mount(
+            "/" + uploader.directory, StaticFiles(directory=uploader.directory, check_dir=False), name="uploads"
+        )
+
+    # Setup CORS for localhost frontend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=False,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Query-Count", "ETag", "Last-Modified"],
+    )
+    if os.environ.get("QUERY_COUNT_DEBUG"):
+        app.middleware("http")(add_query_count_header)
+    # Outermost, so it times everything including the other middleware
+    app.add_middleware(metrics.MetricsMiddleware, count_queries=count_queries)
+
+    app.include_router(router)
+    return app
+
+app = create_app()
@@ -0,0 +1,196 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics rendered in the Prometheus text format on GET /metrics:
+# request latency per route, SQL statement counts/time (from the engine
+# events in db.py) and spans around image work and password hashing.
+# Stats that other modules already keep (pools, caches, hasher) are
+# exported through collectors instead of being counted twice.
+
+# Seconds; suits both sub-millisecond SQL and multi-second uploads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Statements slower than this many milliseconds are printed with their
+# parameters. Off unless set.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0))
+
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                yield f"{self.name}{_label_text(self.labels, values)} {total}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    labels = _label_text(self.labels + ("le",), values + (bound,))
+                    yield f"{self.name}_bucket{labels} {cumulative}"
+                labels = _label_text(self.labels, values)
+                yield f"{self.name}_sum{labels} {series[-1]}"
+                yield f"{self.name}_count{labels} {cumulative}"
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name: str, help: str, labels=()) -> Counter:
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collect):
+    """
+    Add a callable run at scrape time, returning
+    [(name, type, help, label_names, [(label_values, value), ...]), ...].
+    """
+    _collectors.append(collect)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print("Metrics collector failed:", e)
+            continue
+        for name, kind, help, label_names, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label_values, value in samples:
+                lines.append(f"{name}{_label_text(label_names, label_values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics ---
+http_requests = counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_latency = histogram(
+    "http_request_duration_seconds", "Time to the end of the response body.", ("method", "route")
+)
+http_statements = histogram(
+    "http_request_db_statements", "SQL statements issued per request.", ("method", "route"), COUNT_BUCKETS
+)
+http_db_time = histogram("http_request_db_seconds", "Time spent in SQL per request.", ("method", "route"))
+
+db_statements = counter("db_statements_total", "SQL statements executed.", ("engine", "operation"))
+db_latency = histogram("db_statement_duration_seconds", "SQL statement execution time.", ("engine", "operation"))
+
+span_latency = histogram("span_duration_seconds", "Timed sections of request and background work.", ("span",))
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into span_duration_seconds{span=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_latency.observe(time.perf_counter() - start, name)
+
+
+def record_span(name: str, seconds: float):
+    """For sections timed elsewhere (e.g. in a worker process)."""
+    span_latency.observe(seconds, name)
+
+
+def record_statement(engine_name: str, statement: str, parameters, seconds: float):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    db_statements.inc(engine_name, operation)
+    db_latency.observe(seconds, engine_name, operation)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        shown = repr(parameters)
+        if len(shown) > 1000:
+            shown = shown[:1000] + "..."
+        print(f"SLOW QUERY {seconds * 1000:.1f} ms [{engine_name}]: {' '.join(statement.split())} -- params: {shown}")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and SQL usage per route template
+    (e.g. /follow_requests/{request_id}/accept). Streaming responses are
+    timed until their last chunk is sent.
+    """
+
+    def __init__(self, app, count_queries):
+        self.app = app
+        self.count_queries = count_queries
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        with self.count_queries() as queries:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                method = scope["method"]
+                http_requests.inc(method, path, str(status[0]))
+                http_latency.observe(time.perf_counter() - start, method, path)
+                http_statements.observe(queries[0], method, path)
+                http_db_time.observe(queries[1], method, path)
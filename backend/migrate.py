@@ -0,0 +1,299 @@
+import os
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, MetaData, String, Table, case, inspect, insert, select, text, update
+from db import Base, engine
+import models
+import stores
+import geo
+import images
+import scores
+import timeline
+
+# Schema management, run as its own step (`python migrate.py`) before the app
+# starts, instead of on every import of main.py. Local SQLite databases are
+# still upgraded on startup unless DB_AUTO_MIGRATE=0.
+#
+# New databases get the whole schema from create_all(). Databases created by
+# an older version are brought forward by MIGRATIONS: numbered steps, each
+# applied once and recorded in schema_migrations. create_all() adds missing
+# tables but never touches existing ones, so steps add columns and indexes to
+# those and backfill them; they check before adding, so re-running is safe.
+
+_history = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: str):
+    """Register a step, run as fn(connection) inside its own transaction."""
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+
+def _columns(conn, table: str):
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, table: str, name: str, extra: str = ""):
+    """ALTER TABLE ADD COLUMN with the type declared on the model, if the column is missing."""
+    if name in _columns(conn, table):
+        return False
+    column_type = Base.metadata.tables[table].c[name].type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type} {extra}".rstrip()))
+    return True
+
+
+def _create_indexes(conn, table: str, *names: str):
+    """Create the model's indexes `names` on `table` if they don't exist yet."""
+    declared = {index.name: index for index in Base.metadata.tables[table].indexes}
+    for name in names:
+        declared[name].create(conn, checkfirst=True)
+
+
+# --- Steps ---
+@migration("0001_item_image_pipeline")
+def _item_image_pipeline(conn):
+    _add_column(conn, "items", "image_variants")
+    if _add_column(conn, "items", "image_status"):
+        # Items from before the background pipeline were uploaded inline
+        items = models.Item.__table__
+        conn.execute(update(items).values(
+            image_status=case((items.c.image_path.is_(None), images.FAILED), else_=images.READY)
+        ))
+
+
+@migration("0002_store_name_key")
+def _store_name_key(conn):
+    _add_column(conn, "stores", "name_key")
+    table = models.Store.__table__
+    rows = conn.execute(select(table.c.id, table.c.name).where(table.c.name_key.is_(None))).all()
+    keys = dict(conn.execute(select(table.c.name_key, table.c.id).where(table.c.name_key.isnot(None))).all())
+    clashes = []
+    for store_id, name in rows:
+        key = models.normalize_store_name(name or "")
+        if key in keys:
+            clashes.append((keys[key], store_id))
+        keys[key] = store_id
+        conn.execute(update(table).where(table.c.id == store_id).values(name_key=key))
+    if clashes:
+        raise RuntimeError(
+            f"Stores differing only in case/whitespace must be merged first (store id pairs: {clashes})"
+        )
+    _create_indexes(conn, "stores", "ix_stores_name_key")
+
+
+@migration("0003_user_store_score_version")
+def _score_version(conn):
+    _add_column(conn, "user_store_scores", "version", "NOT NULL DEFAULT 1")
+
+
+@migration("0004_item_geohash")
+def _item_geohash(conn):
+    _add_column(conn, "items", "geohash")
+    _add_column(conn, "items", "geocode_status")
+    _create_indexes(conn, "items", "ix_items_geohash", "ix_items_geocode_status_id")
+    geo.backfill(conn)
+
+
+@migration("0005_feeds_and_leaderboard")
+def _feeds_and_leaderboard(conn):
+    # The tables are new (created by create_all); fill them from existing data
+    _create_indexes(conn, "items", "ix_items_created_at_id")
+    if conn.execute(select(models.TimelineEntry.user_id).limit(1)).first() is None:
+        timeline.rebuild(conn)
+    if conn.execute(select(models.StoreConsensus.store_id).limit(1)).first() is None:
+        scores.rebuild_consensus(conn)
+
+
+@migration("0006_hot_query_indexes")
+def _hot_query_indexes(conn):
+    _create_indexes(conn, "items", "ix_items_user_created_at_id", "ix_items_store_id")
+    _create_indexes(conn, "user_store_scores", "ix_user_store_scores_user_score")
+    _create_indexes(conn, "follows", "ix_follows_followed_follower")
+    _create_indexes(
+        conn, "follow_requests",
+        "ix_follow_requests_target_status_created", "ix_follow_requests_requester_status_created",
+    )
+
+
+@migration("0007_one_pending_follow_request")
+def _one_pending_follow_request(conn):
+    # Duplicates from before the constraint: keep the oldest pending request per pair
+    requests = models.FollowRequest.__table__
+    pending = conn.execute(
+        select(requests.c.id, requests.c.requester_id, requests.c.target_id)
+        .where(requests.c.status == "pending")
+        .order_by(requests.c.id)
+    ).all()
+    seen, duplicates = set(), []
+    for request_id, requester_id, target_id in pending:
+        if (requester_id, target_id) in seen:
+            duplicates.append(request_id)
+        seen.add((requester_id, target_id))
+    if duplicates:
+        conn.execute(update(requests).where(requests.c.id.in_(duplicates)).values(status="cancelled"))
+    _create_indexes(conn, "follow_requests", "uq_follow_requests_pending_pair")
+
+    if conn.dialect.name == "postgresql":
+        # SQLite can't add a CHECK to an existing table; there only new databases get it
+        exists = conn.execute(
+            text("SELECT 1 FROM pg_constraint WHERE conname = 'ck_follow_requests_status'")
+        ).first()
+        if not exists:
+            statuses = ", ".join(f"'{s}'" for s in models.FOLLOW_REQUEST_STATUSES)
+            conn.execute(text(
+                f"ALTER TABLE follow_requests ADD CONSTRAINT ck_follow_requests_status CHECK (status IN ({statuses}))"
+            ))
+
+
+# --- Runner ---
+def applied_versions(bind=engine):
+    with bind.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return set()
+        return set(conn.execute(select(_history.c.version)).scalars())
+
+
+def upgrade(bind=engine):
+    """Create missing tables, apply pending migrations and create the store search index."""
+    with bind.connect() as conn:
+        fresh = not inspect(conn).has_table("users")
+    Base.metadata.create_all(bind=bind)
+    _history.create(bind, checkfirst=True)
+
+    done = applied_versions(bind)
+    for version, step in MIGRATIONS:
+        if version in done:
+            continue
+        with bind.begin() as conn:
+            # create_all just built a new database at the latest schema
+            if not fresh:
+                step(conn)
+                # stderr: command-line tools (e.g. bulk.py export) write data to stdout
+                print(f"Applied migration {version}", file=sys.stderr)
+            conn.execute(insert(_history).values(version=version, applied_at=datetime.now(timezone.utc)))
+    stores.ensure_search_index(bind)
+
+
+def auto_migrate_enabled() -> bool:
+    default = "1" if engine.dialect.name == "sqlite" else "0"
+    return os.environ.get("DB_AUTO_MIGRATE", default) == "1"
+
+
+# --- Query plan checks ---
+# The statements behind the hot endpoints, with sample values. check_plans()
+# EXPLAINs each one and reports any that read a whole table or sort rows
+# instead of reading them in index order.
+def _hot_queries():
+    item, score, store = models.Item, models.UserStoreScore, models.Store
+    request, entry, follows = models.FollowRequest, models.TimelineEntry, models.follows
+    return {
+        "global feed": select(item.id).order_by(item.created_at.desc(), item.id.desc()).limit(50),
+        "friends feed": select(entry.item_id)
+        .where(entry.user_id == 1)
+        .order_by(entry.created_at.desc(), entry.item_id.desc())
+        .limit(50),
+        "user's items": select(item.id).where(item.user_id == 1).order_by(item.created_at.desc(), item.id.desc()),
+        "items of a store": select(item.id).where(item.store_id == 1),
+        "nearby cell": select(item.id).where(item.geohash >= "gcpvj", item.geohash < "gcpvj~"),
+        "pending geocodes": select(item.id).where(item.geocode_status == "pending", item.id > 0).order_by(item.id),
+        "user rankings": select(store.id, score.score)
+        .join(score, store.id == score.store_id)
+        .where(score.user_id == 1)
+        .order_by(score.score.desc()),
+        "following": select(follows.c.followed_id).where(follows.c.follower_id == 1),
+        "followers": select(follows.c.follower_id).where(follows.c.followed_id == 1),
+        "pending inbox": select(request.id)
+        .where(request.target_id == 1, request.status == "pending")
+        .order_by(request.created_at.desc()),
+        "sent requests": select(request.id)
+        .where(request.requester_id == 1, request.status == "pending")
+        .order_by(request.created_at.desc()),
+        "pending pair": select(request.id).where(
+            request.requester_id == 1, request.target_id == 2, request.status == "pending"
+        ),
+        "store by name": select(store.id).where(store.name_key == "zara"),
+    }
+
+
+def _plan_problems(conn, sql: str):
+    """(plan lines, problems) for one statement on this connection's dialect."""
+    if conn.dialect.name == "sqlite":
+        lines = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+        problems = [
+            line for line in lines
+            if (line.startswith("SCAN ") and " USING " not in line) or "TEMP B-TREE" in line
+        ]
+        return lines, problems
+
+    # PostgreSQL picks sequential scans for small tables whatever the indexes;
+    # with them disabled, a Seq Scan in the plan means no index can serve the query
+    transaction = conn.begin()
+    try:
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        conn.exec_driver_sql("SET LOCAL enable_sort = off")
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    finally:
+        transaction.rollback()
+    lines, problems = [], []
+
+    def walk(node, depth=0):
+        label = node["Node Type"] + (f" on {node['Relation Name']}" if "Relation Name" in node else "")
+        if "Index Name" in node:
+            label += f" using {node['Index Name']}"
+        lines.append("  " * depth + label)
+        if node["Node Type"] in ("Seq Scan", "Sort"):
+            problems.append(label)
+        for child in node.get("Plans", []):
+            walk(child, depth + 1)
+
+    walk(plan[0]["Plan"])
+    return lines, problems
+
+
+def check_plans(bind=engine):
+    """{query name: (plan lines, problems)} for every hot query."""
+    results = {}
+    with bind.connect() as conn:
+        for name, stmt in _hot_queries().items():
+            sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            results[name] = _plan_problems(conn, sql)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument(
+        "command", nargs="?", default="upgrade", choices=["upgrade", "status", "check-plans"],
+        help="upgrade (default); status lists applied/pending steps; "
+             "check-plans EXPLAINs the hot queries and exits 1 if one scans a table or sorts",
+    )
+    args = parser.parse_args()
+
+    url = engine.url.render_as_string(hide_password=True)
+    if args.command == "upgrade":
+        upgrade()
+        print(f"Schema up to date ({url})")
+    elif args.command == "status":
+        done = applied_versions()
+        for version, _ in MIGRATIONS:
+            print(f"{'applied' if version in done else 'pending'}  {version}")
+    else:
+        failed = 0
+        for name, (lines, problems) in check_plans().items():
+            print(f"{'FAIL' if problems else 'ok  '}  {name}")
+            for line in lines:
+                print(f"        {line}")
+            failed += bool(problems)
+        print(f"{failed} of {len(_hot_queries())} queries not served by an index ({url})")
+        sys.exit(1 if failed else 0)
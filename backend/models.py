@@ -1,14 +1,30 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Text, DateTime, Table, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, Integer, String, ForeignKey, Float, Text, DateTime, Table, Enum, Index, JSON, CheckConstraint, text
+)
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 import enum
 from db import Base
+import geo
+
+# SQLite compares DATETIME columns as text. Store whole seconds (the same shape
+# CURRENT_TIMESTAMP produces) so keyset cursors compare correctly against rows
+# written by the server default.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
 
 # Association table for followers (Many-to-Many self-referential)
 follows = Table(
     'follows', Base.metadata,
     Column('follower_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('followed_id', Integer, ForeignKey('users.id'), primary_key=True)
+    Column('followed_id', Integer, ForeignKey('users.id'), primary_key=True),
+    # The primary key serves "who do I follow"; this serves "who follows me"
+    Index('ix_follows_followed_follower', 'followed_id', 'follower_id'),
 )
 
 class StoreType(str, enum.Enum):
@@ -51,46 +67,90 @@ class User(Base):
         cascade="all, delete-orphan"
     )
 
+def normalize_store_name(name: str) -> str:
+    """Case- and whitespace-insensitive form of a store name ("  H&M " -> "h&m")."""
+    return " ".join(name.split()).casefold()
+
 class Store(Base):
     __tablename__ = "stores"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
+    # normalize_store_name(name); equality and prefix lookups use its unique index
+    name_key = Column(String, unique=True, index=True, nullable=False)
     store_type = Column(Enum(StoreType))
 
     items = relationship("Item", back_populates="store")
     user_scores = relationship("UserStoreScore", back_populates="store")
 
+    @validates("name")
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_store_name(value)
+        return value
+
 class UserStoreScore(Base):
     """Per-user Elo rating for a specific store."""
     __tablename__ = "user_store_scores"
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
     score = Column(Float, default=1200.0) # Standard starting Elo
+    version = Column(Integer, nullable=False, default=1)  # optimistic concurrency check
 
     user = relationship("User", back_populates="scores")
     store = relationship("Store", back_populates="user_scores")
 
+    __table_args__ = (
+        # A user's rankings, highest score first
+        Index("ix_user_store_scores_user_score", "user_id", "score"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class Item(Base):
     __tablename__ = "items"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     store_id = Column(Integer, ForeignKey("stores.id"))
 
-    image_path = Column(String)
+    image_path = Column(String, nullable=True)  # set once the background upload finishes
+    image_status = Column(String, default="pending")  # pending | ready | failed
+    image_variants = Column(JSON, nullable=True)  # {"full": url, "card": url, "thumb": url, ...}
     location_text = Column(String, nullable=True)
 
     # NEW COLUMNS
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    # geo.encode(latitude, longitude), for the indexed nearby search
+    geohash = Column(String(geo.GEOHASH_PRECISION), nullable=True)
+    # "pending" while only location_text is known; see geocoding.GeocodeWorker
+    geocode_status = Column(String, nullable=True)
 
     materials_text = Column(String, nullable=True)
     rating = Column(Integer)
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
 
     owner = relationship("User", back_populates="items")
     store = relationship("Store", back_populates="items")
 
+    __table_args__ = (
+        # Serves the newest-first keyset pagination of the feeds
+        Index("ix_items_created_at_id", "created_at", "id"),
+        # One user's items (timeline backfill, exports), newest first
+        Index("ix_items_user_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_items_store_id", "store_id"),
+        Index("ix_items_geohash", "geohash"),
+        Index("ix_items_geocode_status_id", "geocode_status", "id"),
+    )
+
+    @validates("latitude", "longitude")
+    def _set_geohash(self, key, value):
+        lat = value if key == "latitude" else self.latitude
+        lon = value if key == "longitude" else self.longitude
+        self.geohash = geo.encode(lat, lon) if lat is not None and lon is not None else None
+        return value
+
+# A request starts pending and moves, once, to one of the other states
+FOLLOW_REQUEST_STATUSES = ("pending", "accepted", "rejected", "cancelled")
+
 class FollowRequest(Base):
     __tablename__ = "follow_requests"
     id = Column(Integer, primary_key=True, index=True)
@@ -101,3 +161,70 @@ class FollowRequest(Base):
 
     requester = relationship("User", foreign_keys=[requester_id], back_populates="outgoing_requests")
     target = relationship("User", foreign_keys=[target_id], back_populates="incoming_requests")
+
+    __table_args__ = (
+        # Pending inbox and sent list, newest first
+        Index("ix_follow_requests_target_status_created", "target_id", "status", "created_at"),
+        Index("ix_follow_requests_requester_status_created", "requester_id", "status", "created_at"),
+        # At most one pending request per (requester, target)
+        Index(
+            "uq_follow_requests_pending_pair", "requester_id", "target_id", unique=True,
+            sqlite_where=text("status = 'pending'"), postgresql_where=text("status = 'pending'"),
+        ),
+        CheckConstraint(
+            "status IN (" + ", ".join(f"'{s}'" for s in FOLLOW_REQUEST_STATUSES) + ")",
+            name="ck_follow_requests_status",
+        ),
+    )
+
+class TimelineEntry(Base):
+    """Fan-out-on-write copy of an item into one follower's friends feed."""
+    __tablename__ = "timeline_entries"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # feed owner
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(Timestamp)  # copied from the item so the feed never joins to sort
+
+    __table_args__ = (
+        Index("ix_timeline_user_created_item", "user_id", "created_at", "item_id"),
+        Index("ix_timeline_user_author", "user_id", "author_id"),
+    )
+
+class ImageAsset(Base):
+    """Renditions of an already-uploaded image, keyed by the SHA-256 of its raw bytes."""
+    __tablename__ = "image_assets"
+    content_hash = Column(String(64), primary_key=True)
+    image_path = Column(String)
+    image_variants = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Comparison(Base):
+    """Append-only log of Elo comparisons, so rankings can be replayed/recomputed."""
+    __tablename__ = "comparisons"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    winner_store_id = Column(Integer, ForeignKey("stores.id"))
+    loser_store_id = Column(Integer, ForeignKey("stores.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_comparisons_user_id_id", "user_id", "id"),
+    )
+
+class StoreConsensus(Base):
+    """Cross-user leaderboard: UserStoreScore aggregated per store, kept up to date on each comparison."""
+    __tablename__ = "store_consensus"
+    store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    rated_by = Column(Integer, nullable=False, default=0)
+    mean_score = Column(Float, nullable=False, default=0.0, index=True)
+
+    store = relationship("Store")
+
+class GeocodeCache(Base):
+    """Geocoder results keyed on the normalized (store name, location text). Null coordinates: not found."""
+    __tablename__ = "geocode_cache"
+    query_key = Column(String, primary_key=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
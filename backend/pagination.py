@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past (created_at, id)."""
+    raw = json.dumps({"t": created_at.isoformat(), "id": row_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor. Raises ValueError on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["t"]), int(data["id"])
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_page(query, created_col, id_col, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Newest-first keyset pagination on (created_at, id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Rows must expose created_at and id attributes.
+    """
+    if cursor:
+        last_created, last_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                created_col < last_created,
+                and_(created_col == last_created, id_col < last_id),
+            )
+        )
+
+    # Fetch one extra row so we know whether another page exists
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,118 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+
+@functools.lru_cache(maxsize=None)
+def pwd_context():
+    """The passlib context, built on first use (passlib/argon2 are slow to import)."""
+    from passlib.context import CryptContext
+
+    # Changing ARGON2_* makes existing hashes "need update"; they are rehashed on next login
+    argon2_settings = {
+        f"argon2__{key}": int(os.environ[env])
+        for key, env in [
+            ("time_cost", "ARGON2_TIME_COST"),
+            ("memory_cost", "ARGON2_MEMORY_COST"),
+            ("parallelism", "ARGON2_PARALLELISM"),
+        ]
+        if os.environ.get(env)
+    }
+    return CryptContext(schemes=["argon2"], deprecated="auto", **argon2_settings)
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+class PasswordHasher:
+    """
+    Runs argon2 hash/verify on a small dedicated thread pool (argon2-cffi
+    releases the GIL, so threads hash in parallel) instead of the request
+    threadpool. At most `workers` hashes run at once and at most `max_queue`
+    wait behind them; beyond that, HasherBusy is raised straight away.
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self.workers = workers or int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get("PASSWORD_MAX_QUEUE", 32))
+        self._pool = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        # Jobs that left the pool any way, including cancelled while queued
+        self.finished = 0
+        self.completed = 0
+        self.rejected = 0
+        self.running = 0
+        self.busy_seconds = 0.0
+
+    def _executor(self):
+        # Created on first use so importing the app starts no threads
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._pool
+
+    def _timed(self, span: str, fn, *args):
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.record_span(span, elapsed)
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.busy_seconds += elapsed
+
+    def _release(self, _future):
+        with self._lock:
+            self.finished += 1
+
+    async def _run(self, span: str, fn, *args):
+        with self._lock:
+            if self.submitted - self.finished >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HasherBusy()
+            self.submitted += 1
+        future = self._executor().submit(self._timed, span, fn, *args)
+        # Frees the slot however the job ends: a request cancelled while its
+        # hash is queued cancels the pool future, so _timed never runs
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("password_hash", pwd_context().hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str):
+        """(valid, new_hash). new_hash is set when the stored hash uses outdated parameters."""
+        return await self._run("password_verify", pwd_context().verify_and_update, password, password_hash)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_pool = self.submitted - self.finished
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": in_pool - self.running,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "busy_seconds_total": round(self.busy_seconds, 6),
+            }
+
+    def shutdown(self):
+        # Waits outside the lock: hashes still running take it when they finish
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+hasher = PasswordHasher()
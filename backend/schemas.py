@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional, Any
+import json
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional, Any, Dict
 from datetime import datetime
 from models import StoreType
 
@@ -19,6 +20,9 @@ class UserOut(UserBase):
     created_at: datetime
     model_config = {"from_attributes": True}
 
+class AuthOut(UserOut):
+    token: str  # send back as `Authorization: Bearer <token>`
+
 # --- Store Schemas ---
 class StoreBase(BaseModel):
     name: str
@@ -34,12 +38,18 @@ class StoreOut(StoreBase):
 class StoreRankingOut(StoreOut):
     current_elo: float
 
+class ConsensusRankingOut(StoreOut):
+    mean_elo: float
+    rated_by: int
+
 # --- Item Schemas ---
 class ItemOut(BaseModel):
     id: int
     user_id: int
     store_id: int
-    image_path: str
+    image_path: Optional[str]
+    image_status: str
+    image_variants: Optional[Dict[str, str]] = None
     location_text: Optional[str]
 
     # NEW FIELDS
@@ -51,13 +61,39 @@ class ItemOut(BaseModel):
     notes: Optional[str]
     created_at: datetime
     store: StoreOut
+    model_config = {"from_attributes": True}
 
-    class Config:
-        orm_mode = True
+class NearbyItemOut(ItemOut):
+    distance_km: float
+
+class ItemImport(BaseModel):
+    """One record of a bulk item import (NDJSON line or CSV row)."""
+    user_id: Optional[int] = None
+    store_name: str = Field(..., min_length=1)
+    store_type: StoreType
+    image_path: Optional[str] = None  # an already hosted image URL, stored as-is
+    image_variants: Optional[Dict[str, str]] = None
+    location_text: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    materials_text: Optional[str] = None
+    rating: int
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    @field_validator("image_variants", mode="before")
+    @classmethod
+    def _parse_variants(cls, value):
+        # CSV exports carry the variants as a JSON string
+        return json.loads(value) if isinstance(value, str) else value
+
+class ImportResult(BaseModel):
+    imported: int
+    stores_created: int
+    errors: List[Dict[str, Any]]
 
 # --- Action Schemas ---
-class FollowRequest(BaseModel):
-    follower_username: str
+class FollowTarget(BaseModel):
     target_username: str
 
 class FollowRequestOut(BaseModel):
@@ -71,3 +107,21 @@ class CompareRequest(BaseModel):
     user_id: int
     winner_store_id: int
     loser_store_id: int
+
+class ComparePair(BaseModel):
+    winner_store_id: int
+    loser_store_id: int
+
+# One transaction holds the user's score rows for the whole batch; keep it short
+MAX_COMPARE_BATCH = 100
+
+class CompareBatchRequest(BaseModel):
+    user_id: int
+    comparisons: List[ComparePair] = Field(..., min_length=1, max_length=MAX_COMPARE_BATCH)
+
+class StoreScoreOut(BaseModel):
+    store_id: int
+    score: float
+
+class CompareBatchOut(BaseModel):
+    scores: List[StoreScoreOut]
@@ -0,0 +1,216 @@
+from sqlalchemy import select, insert, update, delete, bindparam, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from db import insert_ignore
+import models
+import elo
+
+DEFAULT_SCORE = 1200.0
+MAX_ATTEMPTS = 5
+
+
+def insert_default_scores(db: Session, user_id: int, store_ids):
+    """Create missing score rows at the default rating. Returns the store ids that were new."""
+    inserted = insert_default_rows(db, [(user_id, store_id) for store_id in store_ids])
+    return {store_id for _, store_id in inserted}
+
+
+def insert_default_rows(db: Session, pairs):
+    """insert_default_scores for arbitrary (user_id, store_id) pairs."""
+    return insert_ignore(
+        db,
+        models.UserStoreScore.__table__,
+        [
+            {"user_id": user_id, "store_id": store_id, "score": DEFAULT_SCORE, "version": 1}
+            for user_id, store_id in pairs
+        ],
+        ["user_id", "store_id"],
+    )
+
+
+def apply_comparisons(db: Session, user_id: int, comparisons) -> dict:
+    """
+    Apply an ordered list of comparisons for one user in memory.
+    Loads every affected score row in one query and does not commit.
+    Returns {store_id: new_score} for the stores involved.
+    """
+    store_ids = {c.winner_store_id for c in comparisons} | {c.loser_store_id for c in comparisons}
+    new_store_ids = insert_default_scores(db, user_id, sorted(store_ids))
+
+    # Row locks where the dialect has them (SQLite renders no FOR UPDATE and
+    # relies on the version check instead). Ordered to avoid lock cycles.
+    entries = {
+        s.store_id: s
+        for s in db.query(models.UserStoreScore)
+        .filter(
+            models.UserStoreScore.user_id == user_id,
+            models.UserStoreScore.store_id.in_(store_ids),
+        )
+        .order_by(models.UserStoreScore.store_id)
+        .with_for_update()
+    }
+
+    before = {store_id: entry.score for store_id, entry in entries.items()}
+    for c in comparisons:
+        winner, loser = entries[c.winner_store_id], entries[c.loser_store_id]
+        winner.score, loser.score = elo.calculate_elo(winner.score, loser.score)
+
+    # Newly rated stores add a rater and their whole score; the rest add the change
+    update_consensus(db, {
+        store_id: (entry.score, 1) if store_id in new_store_ids else (entry.score - before[store_id], 0)
+        for store_id, entry in entries.items()
+    })
+
+    # Keep the event log in the same transaction so a replay sees exactly what was applied
+    db.add_all([
+        models.Comparison(
+            user_id=user_id, winner_store_id=c.winner_store_id, loser_store_id=c.loser_store_id
+        )
+        for c in comparisons
+    ])
+
+    return {store_id: entry.score for store_id, entry in entries.items()}
+
+
+def commit_comparisons(db: Session, user_id: int, comparisons) -> dict:
+    """
+    apply_comparisons + commit, retried when a concurrent writer bumped one
+    of the rows' versions first. Raises StaleDataError if every attempt loses.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            scores = apply_comparisons(db, user_id, comparisons)
+            db.commit()
+            return scores
+        except StaleDataError:
+            db.rollback()
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def update_consensus(db: Session, deltas: dict):
+    """
+    Incrementally maintain StoreConsensus. `deltas` maps store_id to
+    (change in summed score, change in number of raters). Does not commit.
+    """
+    table = models.StoreConsensus.__table__
+    insert_ignore(
+        db,
+        table,
+        [{"store_id": s, "score_sum": 0.0, "rated_by": 0, "mean_score": 0.0} for s in sorted(deltas)],
+        ["store_id"],
+    )
+    # Relative updates, so concurrent writers never overwrite each other
+    db.execute(
+        update(table)
+        .where(table.c.store_id == bindparam("sid"))
+        .values(
+            score_sum=table.c.score_sum + bindparam("d_sum"),
+            rated_by=table.c.rated_by + bindparam("d_count"),
+            mean_score=(table.c.score_sum + bindparam("d_sum")) / (table.c.rated_by + bindparam("d_count")),
+        ),
+        [{"sid": s, "d_sum": d_sum, "d_count": d_count} for s, (d_sum, d_count) in sorted(deltas.items())],
+    )
+
+
+def rebuild_consensus(db: Session):
+    """Recompute StoreConsensus from scratch (after bulk changes or on existing databases)."""
+    score = models.UserStoreScore.score
+    db.execute(delete(models.StoreConsensus))
+    db.execute(
+        insert(models.StoreConsensus).from_select(
+            ["store_id", "score_sum", "rated_by", "mean_score"],
+            select(models.UserStoreScore.store_id, func.sum(score), func.count(), func.avg(score))
+            .group_by(models.UserStoreScore.store_id),
+        )
+    )
+
+
+def recompute(db: Session, user_id: int = None, k_schedule=None, force: bool = False) -> int:
+    """
+    Rebuild UserStoreScore from the comparison log (one user, or everyone)
+    with elo.replay, then write the results back in bulk. Does not commit.
+    Returns the number of score rows written.
+
+    Scores start again from the default rating, so anything that happened
+    before the log (or outside it, e.g. imported scores) is dropped. Raises
+    RuntimeError when a score row has no comparison in the log at all,
+    unless `force`; such rows are then left as they are.
+    """
+    import numpy as np
+
+    query = select(
+        models.Comparison.user_id, models.Comparison.winner_store_id, models.Comparison.loser_store_id
+    ).order_by(models.Comparison.id)
+    scored = select(models.UserStoreScore.user_id, models.UserStoreScore.store_id)
+    if user_id is not None:
+        query = query.where(models.Comparison.user_id == user_id)
+        scored = scored.where(models.UserStoreScore.user_id == user_id)
+
+    events = np.array(db.execute(query).all(), dtype=np.int64).reshape(-1, 3)
+    if not force:
+        logged = {(u, s) for u, w, l in events.tolist() for s in (w, l)}
+        unlogged = [tuple(pair) for pair in db.execute(scored) if tuple(pair) not in logged]
+        if unlogged:
+            raise RuntimeError(
+                f"{len(unlogged)} scores have no comparisons in the log and would not be rebuilt "
+                f"(e.g. user/store {unlogged[:5]}); use force to recompute the rest anyway"
+            )
+    if len(events) == 0:
+        return 0
+    users, winners, losers = events[:, 0], events[:, 1], events[:, 2]
+
+    # One rating slot per (user, store) pair
+    stride = int(max(winners.max(), losers.max())) + 1
+    keys, slots = np.unique(np.r_[users * stride + winners, users * stride + losers], return_inverse=True)
+    n = len(events)
+    ratings, _ = elo.replay(users, slots[:n], slots[n:], len(keys), k_schedule=k_schedule)
+
+    insert_default_rows(db, [(int(k // stride), int(k % stride)) for k in keys])
+    table = models.UserStoreScore.__table__
+    db.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("uid"), table.c.store_id == bindparam("sid"))
+        # Bump the version so in-flight optimistic writers retry against the new score
+        .values(score=bindparam("new_score"), version=table.c.version + 1),
+        [
+            {"uid": int(k // stride), "sid": int(k % stride), "new_score": round(float(r), 2)}
+            for k, r in zip(keys, ratings)
+        ],
+    )
+    rebuild_consensus(db)
+    return len(keys)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import SessionLocal
+    import migrate
+
+    parser = argparse.ArgumentParser(description="Recompute Elo scores from the comparison log")
+    parser.add_argument("--user-id", type=int, help="only this user (default: everyone)")
+    parser.add_argument("--k", type=float, default=32, help="constant K factor")
+    parser.add_argument("--decaying", action="store_true", help="use elo.decaying_k instead of a constant K")
+    parser.add_argument("--consensus-only", action="store_true", help="only rebuild the global leaderboard")
+    parser.add_argument(
+        "--force", action="store_true", help="recompute even if some scores have no comparisons in the log"
+    )
+    args = parser.parse_args()
+
+    migrate.upgrade()
+    session = SessionLocal()
+    try:
+        if args.consensus_only:
+            rebuild_consensus(session)
+            session.commit()
+            print("Rebuilt store consensus")
+        else:
+            schedule = elo.decaying_k() if args.decaying else elo.constant_k(args.k)
+            try:
+                written = recompute(session, args.user_id, schedule, force=args.force)
+            except RuntimeError as e:
+                parser.exit(1, f"{e}\n")
+            session.commit()
+            print(f"Recomputed {written} scores")
+    finally:
+        session.close()
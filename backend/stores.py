@@ -0,0 +1,149 @@
+import re
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from db import insert_ignore
+import models
+
+# Store search indexes beyond the B-tree on stores.name_key:
+# - SQLite: an FTS5 table over name_key (kept in sync by triggers) for word-prefix matches
+# - PostgreSQL: a pg_trgm GIN index so ILIKE '%q%' is served by an index
+_SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS stores_fts USING fts5(name_key, content='stores', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS stores_fts_insert AFTER INSERT ON stores BEGIN
+        INSERT INTO stores_fts(rowid, name_key) VALUES (new.id, new.name_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stores_fts_delete AFTER DELETE ON stores BEGIN
+        INSERT INTO stores_fts(stores_fts, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stores_fts_update AFTER UPDATE OF name_key ON stores BEGIN
+        INSERT INTO stores_fts(stores_fts, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+        INSERT INTO stores_fts(rowid, name_key) VALUES (new.id, new.name_key);
+    END""",
+]
+_POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_stores_name_key_trgm ON stores USING gin (name_key gin_trgm_ops)",
+]
+
+_fts_ready = None
+
+
+def ensure_search_index(engine):
+    """Create the dialect's store search index if missing. Safe to run repeatedly."""
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'stores_fts'")
+                ).first()
+                for statement in _SQLITE_FTS:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Index the stores that were there before the table
+                    conn.execute(text("INSERT INTO stores_fts(stores_fts) VALUES ('rebuild')"))
+            elif dialect == "postgresql":
+                for statement in _POSTGRES_TRGM:
+                    conn.execute(text(statement))
+    except Exception as e:
+        # Search still works without it, through a slower ILIKE scan
+        print("Could not create the store search index:", e)
+
+
+def get_or_create(db: Session, name: str, store_type: str):
+    """(store_id, created) for the store matching `name` case-insensitively. Does not commit."""
+    clean_name = name.strip()
+    key = models.normalize_store_name(clean_name)
+    inserted = insert_ignore(
+        db,
+        models.Store.__table__,
+        [{"name": clean_name, "name_key": key, "store_type": store_type}],
+        ["id"],
+    )
+    if inserted:
+        return inserted[0][0], True
+    return db.execute(select(models.Store.id).where(models.Store.name_key == key)).scalar_one(), False
+
+
+def get_or_create_many(db: Session, stores):
+    """
+    get_or_create for many (name, store_type) pairs in two statements.
+    Returns ({name_key: store_id}, number of stores created). Does not commit.
+    """
+    rows = {}
+    for name, store_type in stores:
+        clean_name = name.strip()
+        rows.setdefault(
+            models.normalize_store_name(clean_name),
+            {"name": clean_name, "name_key": models.normalize_store_name(clean_name), "store_type": store_type},
+        )
+    if not rows:
+        return {}, 0
+    created = insert_ignore(db, models.Store.__table__, list(rows.values()), ["id"])
+    ids = dict(db.execute(
+        select(models.Store.name_key, models.Store.id).where(models.Store.name_key.in_(list(rows)))
+    ).all())
+    return ids, len(created)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _has_fts(db: Session) -> bool:
+    # The index is created by migrate.py, possibly in another process; check once
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'stores_fts'")
+        ).first() is not None
+    return _fts_ready
+
+
+def _contains(db: Session, key: str, limit: int):
+    """Stores whose name contains `key` (SQLite: any word starting with its words)."""
+    if db.get_bind().dialect.name == "sqlite" and _has_fts(db):
+        words = re.findall(r"\w+", key)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"*' for word in words)
+        ids = db.execute(
+            text("SELECT rowid FROM stores_fts WHERE stores_fts MATCH :match ORDER BY rank LIMIT :limit"),
+            {"match": match, "limit": limit},
+        ).scalars().all()
+        by_id = {s.id: s for s in db.query(models.Store).filter(models.Store.id.in_(ids))}
+        return [by_id[i] for i in ids if i in by_id]
+
+    return (
+        db.query(models.Store)
+        .filter(models.Store.name_key.ilike(f"%{_escape_like(key)}%", escape="\\"))
+        .order_by(models.Store.name_key)
+        .limit(limit)
+        .all()
+    )
+
+
+def search(db: Session, query: str, limit: int = 10):
+    """
+    Autocomplete: stores whose name starts with `query` first (a range scan on
+    the name_key index), then other names containing it.
+    """
+    key = models.normalize_store_name(query)
+    if not key:
+        return []
+
+    matches = (
+        db.query(models.Store)
+        .filter(models.Store.name_key >= key, models.Store.name_key < key + "\U0010ffff")
+        .order_by(models.Store.name_key)
+        .limit(limit)
+        .all()
+    )
+    if len(matches) < limit:
+        seen = {s.id for s in matches}
+        for store in _contains(db, key, limit + len(seen)):
+            if len(matches) == limit:
+                break
+            if store.id not in seen:
+                matches.append(store)
+    return matches
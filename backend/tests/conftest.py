@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+
+# The backend reads its settings at import time: point it at a scratch
+# SQLite database and local uploads before anything imports db.py
+_tmp = tempfile.mkdtemp(prefix="wardrobe-tests-")
+DB_PATH = os.path.join(_tmp, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["IMAGE_UPLOADER"] = "local"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmp, "uploads")
+os.environ["IMAGE_SPOOL_DIR"] = os.path.join(_tmp, "image-spool")
+os.environ["GEOCODER"] = "static"
+os.environ["QUERY_COUNT_DEBUG"] = "1"
+os.environ.setdefault("AUTH_SECRET", "test-secret")
+# Cheap argon2 parameters; hashing cost is not what these tests measure
+os.environ.setdefault("ARGON2_TIME_COST", "1")
+os.environ.setdefault("ARGON2_MEMORY_COST", "1024")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def reset_database():
+    """Start from an empty database file and empty caches."""
+    import cache
+    import db
+
+    db.engine.dispose()
+    db.read_engine.dispose()
+    if db.async_engine is not None:
+        # Its connections belong to the app's event loop; drop them unclosed
+        db.async_engine.sync_engine.dispose(close=False)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    for c in cache.CACHES:
+        c.clear()
+
+
+@pytest.fixture
+def client():
+    """The app on a fresh database, with its lifespan (and migrations) run."""
+    import main
+
+    reset_database()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def signup(client, username: str) -> dict:
+    """Create a user; returns the /auth body plus ready-made auth headers."""
+    user = client.post("/auth", json={"username": username, "password": "pw"}).json()
+    user["headers"] = {"Authorization": f"Bearer {user['token']}"}
+    return user
+
+
+def follow(client, follower: dict, target: dict):
+    """follower asks to follow target, and target accepts."""
+    client.post("/follow", json={"target_username": target["username"]}, headers=follower["headers"])
+    request_id = client.get("/follow_requests", headers=target["headers"]).json()[0]["id"]
+    client.post(f"/follow_requests/{request_id}/accept", headers=target["headers"])
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+import pytest
+
+# DB_ASYNC is read when db.py is imported, so async mode needs its own process.
+# This reruns the endpoint tests there, through async_endpoint and run_sync.
+ENDPOINT_TESTS = ["test_query_counts.py", "test_scores.py", "test_http_cache.py"]
+
+
+@pytest.mark.skipif(os.environ.get("DB_ASYNC") == "1", reason="already running in async mode")
+def test_endpoints_in_async_mode():
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider",
+         *[os.path.join(tests_dir, name) for name in ENDPOINT_TESTS]],
+        cwd=os.path.dirname(tests_dir),
+        env={**os.environ, "DB_ASYNC": "1"},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stdout[-3000:] + result.stderr[-3000:]
@@ -0,0 +1,166 @@
+import json
+from datetime import datetime, timezone
+import pytest
+import bulk
+import models
+from db import SessionLocal
+from conftest import signup
+
+# Fields an export carries over to the importing user unchanged
+ROUND_TRIP = [
+    "store_name", "store_type", "image_path", "image_variants", "location_text",
+    "latitude", "longitude", "materials_text", "rating", "notes", "created_at",
+]
+ITEMS = [
+    {
+        "store_name": "Zara", "store_type": "high_street_chain", "rating": 4,
+        "image_path": "https://img.example/a_full.jpg",
+        "image_variants": {"full": "https://img.example/a_full.jpg", "thumb": "https://img.example/a_thumb.jpg"},
+        "latitude": 51.5074, "longitude": -0.1278, "location_text": "London",
+        "created_at": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    },
+    {
+        "store_name": "Oxfam", "store_type": "thrift", "rating": 5,
+        # Everything CSV has to quote
+        "notes": 'Wool, "vintage"\nsecond line', "materials_text": "wool; silk, ünïcode",
+        "created_at": datetime(2024, 1, 3, tzinfo=timezone.utc),
+    },
+    {"store_name": "Oxfam", "store_type": "thrift", "rating": 1, "created_at": datetime(2024, 1, 4, tzinfo=timezone.utc)},
+]
+
+
+def add_items(user_id: int):
+    with SessionLocal() as db:
+        for fields in ITEMS:
+            fields = dict(fields)
+            name, store_type = fields.pop("store_name"), fields.pop("store_type")
+            store = db.query(models.Store).filter_by(name=name).first()
+            if store is None:
+                store = models.Store(name=name, store_type=store_type)
+                db.add(store)
+                db.flush()
+            db.add(models.Item(store_id=store.id, user_id=user_id, image_status="ready", **fields))
+        db.commit()
+
+
+def export(client, kind: str, fmt: str, user_id: int = None) -> str:
+    params = {"format": fmt, **({"user_id": user_id} if user_id is not None else {})}
+    response = client.get(f"/export/{kind}", params=params)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return response.text
+
+
+def import_body(client, user: dict, body, fmt: str) -> dict:
+    response = client.post(
+        "/import/items", params={"format": fmt}, content=body.encode() if isinstance(body, str) else body,
+        headers=user["headers"],
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def exported_items(client, user_id: int):
+    """The user's items as NDJSON export records, without the ids that differ after an import."""
+    records = [json.loads(line) for line in export(client, "items", "ndjson", user_id).splitlines()]
+    return [{k: record[k] for k in ROUND_TRIP} for record in records]
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_export_import_round_trip(client, fmt):
+    source, target = signup(client, "source"), signup(client, "target")
+    add_items(source["id"])
+    original = exported_items(client, source["id"])
+    assert len(original) == len(ITEMS)
+
+    result = import_body(client, target, export(client, "items", fmt, source["id"]), fmt)
+    assert result == {"imported": len(ITEMS), "stores_created": 0, "errors": []}
+    assert exported_items(client, target["id"]) == original
+    # The existing stores were reused
+    assert len(client.get("/stores").json()) == 2
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_empty_export_round_trip(client, fmt):
+    user = signup(client, "user")
+    body = export(client, "items", fmt)
+    assert body == ("" if fmt == "ndjson" else ",".join(bulk.columns("items")) + "\r\n")
+    assert import_body(client, user, body, fmt) == {"imported": 0, "stores_created": 0, "errors": []}
+
+
+def test_stores_and_scores_export(client):
+    user = signup(client, "user")
+    add_items(user["id"])
+    stores = {s["name"]: s["id"] for s in client.get("/stores").json()}
+    client.post("/compare_store", json={
+        "user_id": user["id"], "winner_store_id": stores["Zara"], "loser_store_id": stores["Oxfam"],
+    })
+
+    exported = [json.loads(line) for line in export(client, "stores", "ndjson").splitlines()]
+    assert exported == [
+        {"id": stores["Zara"], "name": "Zara", "store_type": "high_street_chain"},
+        {"id": stores["Oxfam"], "name": "Oxfam", "store_type": "thrift"},
+    ]
+    lines = export(client, "scores", "csv").splitlines()
+    assert lines[0] == "user_id,store_id,score"
+    assert sorted(float(line.split(",")[2]) for line in lines[1:]) == [1184.0, 1216.0]
+
+
+def test_ndjson_bad_lines_are_reported(client):
+    user = signup(client, "user")
+    lines = [
+        json.dumps({"store_name": "Zara", "store_type": "high_street_chain", "rating": 4}),
+        "{not json",
+        "",
+        json.dumps({"store_name": "Zara", "store_type": "castle", "rating": 4}),
+        json.dumps({"store_name": "Zara", "store_type": "high_street_chain"}),
+        json.dumps({"store_name": "  cos ", "store_type": "boutique", "rating": 2, "image_variants": "{oops"}),
+        json.dumps({"store_name": "COS", "store_type": "boutique", "rating": 3}),
+    ]
+    result = import_body(client, user, "\n".join(lines) + "\n", "ndjson")
+    assert result["imported"] == 2
+    assert result["stores_created"] == 2
+    # Blank lines are skipped, not errors, but still counted
+    assert [error["line"] for error in result["errors"]] == [2, 4, 5, 6]
+    assert "store_type" in result["errors"][1]["error"]
+    assert "rating" in result["errors"][2]["error"]
+    assert len(client.get("/items", params={"user_id": user["id"]}).json()) == 2
+
+
+def test_csv_bad_rows_are_reported(client):
+    user = signup(client, "user")
+    body = (
+        "store_name,store_type,rating,notes\r\n"
+        "Zara,high_street_chain,4,fine\r\n"
+        ",thrift,3,no store name\r\n"
+        'Oxfam,thrift,many,"quoted, with\nnewline"\r\n'
+        "Oxfam,thrift,2,\r\n"
+    )
+    result = import_body(client, user, body, "csv")
+    assert result["imported"] == 2
+    # CSV line numbers are where the record ends
+    assert [error["line"] for error in result["errors"]] == [3, 5]
+
+
+def test_error_report_is_capped(client, monkeypatch):
+    monkeypatch.setattr(bulk, "MAX_IMPORT_ERRORS", 3)
+    user = signup(client, "user")
+    result = import_body(client, user, "nope\n" * 10, "ndjson")
+    assert result["imported"] == 0
+    assert len(result["errors"]) == 3
+
+
+def test_unknown_users_are_skipped(client):
+    user = signup(client, "user")
+    records = [
+        (1, {"user_id": user["id"], "store_name": "Zara", "store_type": "high_street_chain", "rating": 4}),
+        (2, {"user_id": 999, "store_name": "Zara", "store_type": "high_street_chain", "rating": 4}),
+        (3, {"store_name": "Zara", "store_type": "high_street_chain", "rating": 4}),
+    ]
+    with SessionLocal() as db:
+        result = bulk.import_items(db, records)
+    assert result.imported == 1
+    assert result.errors == [
+        {"line": 3, "error": "user_id is required"},
+        {"user_id": 999, "error": "Unknown user; their records were skipped"},
+    ]
@@ -0,0 +1,90 @@
+import cache
+from conftest import signup, follow
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_none_not_cached():
+    c = cache.Cache("test", ttl=60, maxsize=10)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls) if len(calls) > 1 else None
+
+    assert c.get_or_load("k", loader) is None
+    # None was not cached: loaded again, then served from the cache
+    assert c.get_or_load("k", loader) == 2
+    assert c.get_or_load("k", loader) == 2
+    assert len(calls) == 2
+    assert (c.stats()["hits"], c.stats()["misses"]) == (1, 2)
+
+
+def test_invalidate_reloads():
+    c = cache.Cache("test", ttl=60, maxsize=10)
+    value = ["old"]
+    assert c.get_or_load("k", lambda: value[0]) == "old"
+    value[0] = "new"
+    assert c.get_or_load("k", lambda: value[0]) == "old"
+    c.invalidate("k")
+    assert c.get_or_load("k", lambda: value[0]) == "new"
+    assert c.stats()["invalidations"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    c = cache.Cache("test", ttl=5, maxsize=10)
+    assert c.get_or_load("k", lambda: "first") == "first"
+    clock.now += 4.9
+    assert c.get_or_load("k", lambda: "second") == "first"
+    clock.now += 0.2
+    assert c.get_or_load("k", lambda: "second") == "second"
+
+
+def test_lru_eviction():
+    c = cache.Cache("test", ttl=60, maxsize=2)
+    for key in ("a", "b"):
+        c.set(key, key)
+    c.get_or_load("a", lambda: None)
+    c.set("c", "c")
+    assert c.get_or_load("b", lambda: "reloaded") == "reloaded"
+    assert c.stats()["evictions"] >= 1
+
+
+def test_follow_cache_is_short_lived_without_redis():
+    assert isinstance(cache.following.store, cache.MemoryStore)
+    assert cache.following.ttl <= 5
+    assert cache.followers.ttl <= 5
+
+
+def test_follow_ignores_stale_cache(client):
+    reader, poster = signup(client, "reader"), signup(client, "poster")
+    follow(client, reader, poster)
+    # What another worker may still hold from before the follow
+    cache.following.set(reader["id"], [])
+
+    response = client.post("/follow", json={"target_username": "poster"}, headers=reader["headers"])
+    assert response.json()["message"] == "Already following poster"
+    assert client.get("/follow_requests", headers=poster["headers"]).json() == []
+
+
+def test_follow_changes_invalidate_follow_lists(client):
+    reader, poster = signup(client, "reader"), signup(client, "poster")
+
+    def names(path):
+        return [u["username"] for u in client.get(path).json()]
+
+    # Cached empty on both sides first
+    assert names("/users/reader/following") == names("/users/poster/followers") == []
+    follow(client, reader, poster)
+    assert names("/users/reader/following") == ["poster"]
+    assert names("/users/poster/followers") == ["reader"]
+    client.post("/unfollow", json={"target_username": "poster"}, headers=reader["headers"])
+    assert names("/users/reader/following") == names("/users/poster/followers") == []
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import elo
+
+EVENTS = 2000
+USERS = 40
+STORES = 12
+
+
+def _events(seed: int):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, USERS, EVENTS)
+    winners = rng.integers(0, STORES, EVENTS)
+    losers = (winners + rng.integers(1, STORES, EVENTS)) % STORES
+    # One slot per (user, store) pair, as scores.recompute lays them out
+    return users, users * STORES + winners, users * STORES + losers
+
+
+@pytest.mark.parametrize("k_schedule", [elo.constant_k(), elo.decaying_k()], ids=["constant_k", "decaying_k"])
+def test_vectorized_replay_matches_loop(monkeypatch, k_schedule):
+    users, winners, losers = _events(7)
+    n_slots = USERS * STORES
+
+    monkeypatch.setattr(elo, "VECTOR_MIN_BATCH", 0)
+    vector_ratings, vector_games = elo.replay(users, winners, losers, n_slots, k_schedule)
+    monkeypatch.setattr(elo, "VECTOR_MIN_BATCH", EVENTS + 1)
+    loop_ratings, loop_games = elo.replay(users, winners, losers, n_slots, k_schedule)
+
+    np.testing.assert_array_equal(vector_games, loop_games)
+    np.testing.assert_allclose(vector_ratings, loop_ratings, rtol=0, atol=1e-9)
+
+
+def test_replay_matches_calculate_elo():
+    r = {0: elo.DEFAULT_RATING, 1: elo.DEFAULT_RATING}
+    for w, l in [(0, 1), (0, 1), (1, 0)]:
+        r[w], r[l] = elo.calculate_elo(r[w], r[l])
+    ratings, games = elo.replay([5, 5, 5], [0, 0, 1], [1, 1, 0], 2)
+    assert ratings.tolist() == pytest.approx([r[0], r[1]], abs=0.02)
+    assert games.tolist() == [3, 3]
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import events
+
+PUBLISHERS = 8
+EVENTS_EACH = 50
+
+
+def publish_concurrently(hub, user_id: int):
+    def publish(n):
+        for i in range(EVENTS_EACH):
+            hub.publish([user_id], "item", {"publisher": n, "i": i})
+
+    threads = [threading.Thread(target=publish, args=(n,)) for n in range(PUBLISHERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_publishers_deliver_in_id_order(monkeypatch):
+    monkeypatch.setattr(events, "QUEUE_SIZE", PUBLISHERS * EVENTS_EACH)
+    hub = events.Hub(events.MemoryBroker())
+    hub.start()
+
+    async def run():
+        sub, replay = hub.subscribe(1)
+        assert replay == []
+        await asyncio.get_running_loop().run_in_executor(None, publish_concurrently, hub, 1)
+        await asyncio.sleep(0)
+        received = []
+        while not sub.queue.empty():
+            received.append(sub.queue.get_nowait()["id"])
+        hub.unsubscribe(sub)
+        return received
+
+    received = asyncio.run(run())
+    assert len(received) == PUBLISHERS * EVENTS_EACH
+    assert received == sorted(set(received))
+
+    async def resume(after):
+        sub, replay = hub.subscribe(1, after)
+        hub.unsubscribe(sub)
+        return [e["id"] for e in replay]
+
+    # A client that saw the first half gets exactly the second half
+    half = len(received) // 2
+    assert asyncio.run(resume(received[half - 1])) == received[half:]
+    hub.close()
+
+
+def test_resume_before_the_backlog_asks_for_reset():
+    hub = events.Hub(events.MemoryBroker())
+    hub.start()
+
+    async def resume(after):
+        sub, replay = hub.subscribe(1, after)
+        hub.unsubscribe(sub)
+        return replay
+
+    assert asyncio.run(resume(0)) is None
+    hub.close()
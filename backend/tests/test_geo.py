@@ -0,0 +1,125 @@
+import math
+import random
+import pytest
+import geo
+import models
+from db import SessionLocal
+from conftest import signup
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def offset(lat, lon, north_km, east_km):
+    return (
+        lat + math.degrees(north_km / geo.EARTH_RADIUS_KM),
+        lon + math.degrees(east_km / (geo.EARTH_RADIUS_KM * math.cos(math.radians(lat)))),
+    )
+
+
+def covered(cells, lat, lon) -> bool:
+    return any(geo.encode(lat, lon).startswith(cell) for cell in cells)
+
+
+def test_encode_known_value():
+    assert geo.encode(57.64911, 10.40744) == "u4pruydqq"
+    assert geo.encode(57.64911, 10.40744, 5) == "u4pru"
+
+
+@pytest.mark.parametrize("precision", [3, 5, 7, 9])
+def test_cells_cover_points_just_across_a_boundary(precision):
+    # A point a hair's breadth from each edge of its cell, and its neighbours across them
+    rng = random.Random(precision)
+    height, width = geo.cell_size(precision)
+    for _ in range(50):
+        row, col = rng.randrange(1, int(180 / height) - 1), rng.randrange(1, int(360 / width) - 1)
+        edge_lat, edge_lon = -90 + row * height, -180 + col * width
+        eps = min(height, width) * 1e-3
+        lat, lon = edge_lat + eps, edge_lon + eps
+        radius = haversine(lat, lon, lat + 2 * eps, lon + 2 * eps) * 2
+        cells = geo.covering_cells(*geo.bounding_box(lat, lon, radius))
+        for neighbour in [(edge_lat - eps, edge_lon - eps), (edge_lat - eps, lon), (lat, edge_lon - eps)]:
+            assert haversine(lat, lon, *neighbour) <= radius
+            assert geo.encode(*neighbour, precision)[:precision] != geo.encode(lat, lon, precision)
+            assert covered(cells, *neighbour), (lat, lon, neighbour, cells)
+
+
+def test_cells_cover_every_point_in_radius():
+    rng = random.Random(1)
+    for _ in range(200):
+        lat, lon = rng.uniform(-80, 80), rng.uniform(-170, 170)
+        radius = 10 ** rng.uniform(-2, 2)
+        cells = geo.covering_cells(*geo.bounding_box(lat, lon, radius))
+        assert len(cells) <= 9
+        for _ in range(20):
+            bearing, distance = rng.uniform(0, 2 * math.pi), radius * math.sqrt(rng.random())
+            point = offset(lat, lon, distance * math.cos(bearing), distance * math.sin(bearing))
+            if haversine(lat, lon, *point) <= radius:
+                assert covered(cells, *point), (lat, lon, radius, point)
+
+
+def test_covering_cells_for_huge_box():
+    assert geo.covering_cells(-90, 90, -180, 180) == [""]
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(2)
+    lat, lon = 48.8566, 2.3522
+    points = [offset(lat, lon, rng.uniform(-20, 20), rng.uniform(-20, 20)) for _ in range(500)]
+    ids = list(range(100, 600))
+    result = geo.nearest(ids, [p[0] for p in points], [p[1] for p in points], lat, lon, 10, 25)
+
+    expected = sorted(
+        (haversine(lat, lon, *p), i) for i, p in zip(ids, points) if haversine(lat, lon, *p) <= 10
+    )[:25]
+    assert [i for i, _ in result] == [i for _, i in expected]
+    assert [d for _, d in result] == pytest.approx([d for d, _ in expected])
+    assert geo.nearest([], [], [], lat, lon, 10, 25) == []
+
+
+def add_item(user_id: int, store_id: int, lat: float, lon: float) -> int:
+    with SessionLocal() as db:
+        item = models.Item(user_id=user_id, store_id=store_id, rating=4, image_status="ready", latitude=lat, longitude=lon)
+        db.add(item)
+        db.commit()
+        return item.id
+
+
+@pytest.fixture
+def poster(client):
+    user_id = signup(client, "poster")["id"]
+    store_id = client.post("/stores", json={"name": "Zara", "store_type": "high_street_chain"}).json()["id"]
+    return lambda lat, lon: add_item(user_id, store_id, lat, lon)
+
+
+def nearby(client, lat, lon, **params):
+    response = client.get("/items/nearby", params={"lat": lat, "lon": lon, **params})
+    assert response.status_code == 200, response.text
+    return [(item["id"], item["distance_km"]) for item in response.json()]
+
+
+def test_nearby_across_the_top_level_cells(client, poster):
+    # (0, 0) is where the four top-level geohash cells meet
+    ids = {poster(lat, lon): (lat, lon) for lat, lon in [(0.00002, 0.00002), (-0.00002, 0.00002), (0.00002, -0.00002), (-0.00002, -0.00002)]}
+    assert len({geo.encode(*p)[0] for p in ids.values()}) == 4
+    found = nearby(client, 0.00001, 0.00001, radius=0.01)
+    assert {i for i, _ in found} == set(ids)
+
+
+def test_nearby_orders_by_haversine_distance(client, poster):
+    lat, lon = 51.5074, -0.1278
+    # Inserted out of order; (6, 0) is outside the radius, (3.5, 3.5) diagonally just inside it
+    spots = [(3, 0), (0, 1), (-2, 0), (0, -0.5), (6, 0), (3.5, 3.5)]
+    ids = [poster(*offset(lat, lon, north, east)) for north, east in spots]
+    found = nearby(client, lat, lon, radius=5)
+    expected = sorted(
+        (round(haversine(lat, lon, *offset(lat, lon, n, e)), 3), i) for i, (n, e) in zip(ids, spots)
+    )
+    expected = [(i, d) for d, i in expected if d <= 5]
+    assert [i for i, _ in found] == [i for i, _ in expected]
+    assert [d for _, d in found] == pytest.approx([d for _, d in expected], abs=1e-3)
+    assert ids[4] not in {i for i, _ in found}
+    assert nearby(client, lat, lon, radius=5, limit=2) == found[:2]
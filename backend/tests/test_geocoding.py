@@ -0,0 +1,37 @@
+import time
+from fastapi.testclient import TestClient
+import geocoding
+import main
+import migrate
+import models
+from db import SessionLocal, engine
+from conftest import reset_database
+
+
+def test_pending_items_are_geocoded_on_startup():
+    # An item a previous run left pending, before the app starts
+    reset_database()
+    migrate.upgrade(engine)
+    with SessionLocal() as db:
+        user = models.User(username="poster", password_hash="x")
+        store = models.Store(name="Zara", store_type="high_street_chain")
+        db.add_all([user, store])
+        db.flush()
+        item = models.Item(
+            user_id=user.id, store_id=store.id, rating=4, image_status="ready",
+            location_text="Nowhere", geocode_status=geocoding.PENDING,
+        )
+        db.add(item)
+        db.commit()
+        item_id = item.id
+
+    with TestClient(main.app):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with SessionLocal() as db:
+                status = db.get(models.Item, item_id).geocode_status
+            if status != geocoding.PENDING:
+                break
+            time.sleep(0.05)
+    # The static geocoder (see conftest) knows no places
+    assert status == geocoding.NOT_FOUND
@@ -0,0 +1,40 @@
+import pytest
+import http_cache
+from conftest import signup
+
+
+@pytest.fixture
+def conditional_get(monkeypatch):
+    monkeypatch.setattr(http_cache, "ENABLED", True)
+
+
+def test_etag_revalidation(client, conditional_get):
+    etag = client.get("/stores").headers["ETag"]
+    assert client.get("/stores", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/stores", json={"name": "Zara", "store_type": "high_street_chain"})
+    response = client.get("/stores", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()] == ["Zara"]
+    assert response.headers["ETag"] != etag
+
+
+def test_following_list_changes_with_follows(client, conditional_get):
+    alice, bob = signup(client, "alice"), signup(client, "bob")
+    etag = client.get("/me/following", headers=bob["headers"]).headers["ETag"]
+
+    client.post("/follow", json={"target_username": "alice"}, headers=bob["headers"])
+    request_id = client.get("/follow_requests", headers=alice["headers"]).json()[0]["id"]
+    client.post(f"/follow_requests/{request_id}/accept", headers=alice["headers"])
+
+    response = client.get("/me/following", headers={**bob["headers"], "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [u["username"] for u in response.json()] == ["alice"]
+
+
+def test_disabled_without_shared_versions(client):
+    # conftest runs the memory cache backend: no ETags, always a full response
+    assert not http_cache.ENABLED
+    response = client.get("/stores", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
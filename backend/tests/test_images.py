@@ -0,0 +1,211 @@
+import io
+import time
+import pytest
+import images
+import models
+from db import SessionLocal
+from conftest import signup
+
+
+def make_image(size=(1200, 900), fmt: str = "JPEG", mode: str = "RGB") -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new(mode, size, "teal").save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def open_image(data: bytes):
+    from PIL import Image
+
+    return Image.open(io.BytesIO(data))
+
+
+def photo_with_orientation(size, orientation: int) -> bytes:
+    """A JPEG as phones write them: pixels stored sideways, EXIF says how to turn them."""
+    from PIL import Image
+
+    img = Image.new("RGB", size, "teal")
+    # Mark the stored top-left corner, to see where it ends up
+    img.paste((255, 0, 0), (0, 0, size[0] // 4, size[1] // 4))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def post_item(client, user_id: int, data: bytes):
+    response = client.post(
+        "/items",
+        data={"user_id": user_id, "store_name": "Zara", "store_type": "high_street_chain", "rating": 4},
+        files={"image": ("photo.jpg", data, "image/jpeg")},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def wait_for_status(item_id: int, timeout: float = 30) -> models.Item:
+    deadline = time.monotonic() + timeout
+    while True:
+        with SessionLocal() as db:
+            item = db.get(models.Item, item_id)
+            if item.image_status != images.PENDING or time.monotonic() > deadline:
+                return item
+        time.sleep(0.05)
+
+
+class FailingUploader:
+    def __init__(self):
+        self.calls = 0
+
+    def upload(self, data: bytes, public_id: str, ext: str = "jpg") -> str:
+        self.calls += 1
+        raise ConnectionError("upload refused")
+
+
+def test_posted_item_becomes_ready(client):
+    import main
+
+    user = signup(client, "poster")
+    posted = post_item(client, user["id"], make_image())
+    assert posted["image_status"] == images.PENDING
+
+    item = wait_for_status(posted["id"])
+    assert item.image_status == images.READY
+    assert isinstance(main.image_pipeline.uploader, images.LocalUploader)
+    assert set(item.image_variants) >= {name for name, _ in images.VARIANTS}
+    assert item.image_path == item.image_variants["full"]
+    with open(item.image_path, "rb") as f:
+        assert f.read(2) == b"\xff\xd8"
+
+    # The same bytes again reuse the stored renditions, ready at once
+    again = post_item(client, user["id"], make_image())
+    assert again["image_status"] == images.READY
+    assert again["image_path"] == item.image_path
+
+
+def test_failed_upload_marks_item_failed(client, monkeypatch):
+    import main
+
+    uploader = FailingUploader()
+    monkeypatch.setattr(main.image_pipeline, "uploader", uploader)
+    monkeypatch.setattr(main.image_pipeline, "retries", 1)
+    monkeypatch.setattr(main.image_pipeline, "retry_backoff", 0)
+
+    posted = post_item(client, signup(client, "poster")["id"], make_image())
+    item = wait_for_status(posted["id"])
+    assert item.image_status == images.FAILED
+    assert item.image_path is None
+    # The first variant was tried, then retried once
+    assert uploader.calls == 2
+    with SessionLocal() as db:
+        assert db.query(models.ImageAsset).count() == 0
+
+
+def test_submit_failure_frees_its_slot(tmp_path):
+    pipeline = images.ImagePipeline(images.LocalUploader(), SessionLocal, max_pending=1, spool_dir=str(tmp_path))
+    _, upload_pool = pipeline._pools()
+    upload_pool.shutdown()
+    try:
+        with pytest.raises(RuntimeError):
+            pipeline.submit(1, b"", "0" * 64)
+        # Its only slot is free again; a leak would block every later submit
+        assert pipeline._slots.acquire(timeout=0)
+    finally:
+        pipeline.shutdown()
+
+
+def test_resume_after_restart(client, tmp_path):
+    user_id = signup(client, "poster")["id"]
+    with SessionLocal() as db:
+        store = models.Store(name="Zara", store_type="high_street_chain")
+        db.add(store)
+        db.flush()
+        spooled, lost, done = (
+            models.Item(user_id=user_id, store_id=store.id, rating=4, image_status=status)
+            for status in (images.PENDING, images.PENDING, images.READY)
+        )
+        db.add_all([spooled, lost, done])
+        db.commit()
+        spooled_id, lost_id, done_id = spooled.id, lost.id, done.id
+
+    # What a previous process left behind: one upload spooled, one not, one finished but not cleaned up
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / str(spooled_id)).write_bytes(make_image())
+    (spool / str(done_id)).write_bytes(b"stale")
+
+    pipeline = images.ImagePipeline(images.LocalUploader(str(tmp_path / "uploads")), SessionLocal, spool_dir=str(spool))
+    try:
+        pipeline.resume()
+        assert wait_for_status(spooled_id).image_status == images.READY
+    finally:
+        pipeline.shutdown()
+    assert wait_for_status(lost_id).image_status == images.FAILED
+    assert list(spool.iterdir()) == []
+
+
+def test_process_image_variants():
+    timings = {}
+    rendered = images.process_image(make_image((3200, 2400)), timings=timings)
+    assert [name for name, _, _ in rendered] == [name for name, _ in images.VARIANTS]
+    for (name, data, ext), (_, edge) in zip(rendered, images.VARIANTS):
+        img = open_image(data)
+        assert (ext, img.format, img.mode) == ("jpg", "JPEG", "RGB")
+        # The draft decode must not undershoot the largest variant
+        assert img.size == (edge, edge * 3 // 4), name
+    assert set(timings) == {"image_decode", "image_encode"}
+
+
+def test_process_image_webp():
+    rendered = images.process_image(make_image((1000, 1000)), webp=True)
+    names = [name for name, _, _ in rendered]
+    assert names == [n for name, _ in images.VARIANTS for n in (name, f"{name}_webp")]
+    for name, data, ext in rendered:
+        img = open_image(data)
+        if name.endswith("_webp"):
+            assert (ext, img.format) == ("webp", "WEBP")
+        else:
+            assert (ext, img.format) == ("jpg", "JPEG")
+    sizes = [open_image(data).size for _, data, _ in rendered]
+    assert sizes[0::2] == sizes[1::2]
+
+
+def test_process_image_applies_exif_orientation():
+    # Orientation 6: stored landscape, displayed rotated 90 degrees clockwise
+    rendered = dict((name, data) for name, data, _ in images.process_image(photo_with_orientation((1600, 1200), 6)))
+    full = open_image(rendered["full"])
+    assert full.size == (600, 800)
+    # The stored top-left corner is now top-right
+    red, green, blue = full.getpixel((full.width - 10, 10))
+    assert red > 200 and green < 60 and blue < 60
+    assert 0x0112 not in full.getexif()
+
+
+def test_process_image_decodes_jpeg_at_reduced_size(monkeypatch):
+    from PIL import JpegImagePlugin
+
+    decoded = []
+    original = JpegImagePlugin.JpegImageFile.draft
+
+    def draft(img, mode, size):
+        result = original(img, mode, size)
+        decoded.append(img.size)
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", draft)
+    images.process_image(make_image((3200, 2400)))
+    # Decoded at half scale, still larger than the full variant
+    assert decoded == [(1600, 1200)]
+
+
+@pytest.mark.parametrize("mode, expected", [("RGBA", "RGB"), ("P", "RGB"), ("L", "L")])
+def test_process_image_converts_palette_and_alpha(mode, expected):
+    for _, data, _ in images.process_image(make_image((300, 200), "PNG", mode)):
+        assert open_image(data).mode == expected
+
+
+def test_process_image_never_upscales():
+    rendered = images.process_image(make_image((120, 90)))
+    assert [open_image(data).size for _, data, _ in rendered] == [(120, 90)] * len(images.VARIANTS)
@@ -0,0 +1,81 @@
+import re
+import pytest
+import metrics
+from conftest import signup
+
+SAMPLE = re.compile(r'^(\w+)(\{.*\})? (\S+)$')
+ROUTE = "/users/{username}/following"
+
+
+def scrape(client) -> dict:
+    """{(name, labels): value} from GET /metrics, checking the exposition format on the way."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples, typed = {}, set()
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            name = line.split()[2]
+            assert name not in typed, f"{name} declared twice"
+            typed.add(name)
+        elif not line.startswith("#"):
+            match = SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            assert re.sub(r"_(bucket|sum|count)$", "", name) in typed, f"{name} has no TYPE"
+            samples[(name, labels or "")] = float(value)
+    return samples
+
+
+def labels(**values) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in values.items()) + "}"
+
+
+def test_request_metrics_after_requests(client):
+    signup(client, "reader")
+    before = scrape(client)
+    for _ in range(2):
+        assert client.get("/users/reader/following").status_code == 200
+    assert client.get("/users/nobody/following").status_code == 404
+    after = scrape(client)
+
+    def delta(name, **label_values):
+        key = (name, labels(**label_values))
+        return after[key] - before.get(key, 0)
+
+    # Counted by route template, not by path
+    assert delta("http_requests_total", method="GET", route=ROUTE, status="200") == 2
+    assert delta("http_requests_total", method="GET", route=ROUTE, status="404") == 1
+    assert delta("http_request_duration_seconds_count", method="GET", route=ROUTE) == 3
+    assert delta("http_request_duration_seconds_sum", method="GET", route=ROUTE) > 0
+    assert delta("http_request_db_statements_count", method="GET", route=ROUTE) == 3
+    assert delta("db_statements_total", engine="primary", operation="SELECT") >= 1
+
+    # Histogram buckets are cumulative and end in +Inf == count
+    buckets = [
+        after[("http_request_duration_seconds_bucket", labels(method="GET", route=ROUTE, le=bound))]
+        for bound in metrics.DEFAULT_BUCKETS + ("+Inf",)
+    ]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == after[("http_request_duration_seconds_count", labels(method="GET", route=ROUTE))]
+
+
+def test_unmatched_routes_share_one_series(client):
+    before = scrape(client)
+    for path in ("/no/such/page", "/another/one"):
+        assert client.get(path).status_code == 404
+    after = scrape(client)
+    key = ("http_requests_total", labels(method="GET", route="unmatched", status="404"))
+    assert after[key] - before.get(key, 0) == 2
+    assert not any("/no/such/page" in series for _, series in after)
+
+
+def test_spans_and_collectors(client):
+    signup(client, "user")
+    samples = scrape(client)
+    assert samples[("span_duration_seconds_count", labels(span="password_hash"))] >= 1
+    # Stats other modules keep, exported at scrape time
+    assert ("db_pool_size", labels(engine="primary")) in samples
+    assert ("cache_hits_total", labels(cache="user_ids")) in samples
+    assert ("password_hasher_running", "") in samples
+    assert ("events_connections", "") in samples
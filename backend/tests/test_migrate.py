@@ -0,0 +1,13 @@
+from sqlalchemy import create_engine
+import migrate
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    """Every hot query's plan on a migrated database reads through an index, without scans or sorts."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    migrate.upgrade(engine)
+    assert migrate.applied_versions(engine) == {version for version, _ in migrate.MIGRATIONS}
+
+    problems = {name: found for name, (_, found) in migrate.check_plans(engine).items() if found}
+    assert problems == {}
+    engine.dispose()
@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+import models
+from db import SessionLocal
+from pagination import encode_cursor, decode_cursor
+from conftest import signup
+
+# Several items share each timestamp, as when posted within the same second
+TIMESTAMPS = 3
+PER_TIMESTAMP = 4
+TOTAL = TIMESTAMPS * PER_TIMESTAMP
+
+
+def add_items(user_id: int) -> list:
+    """Posts TOTAL items; returns their ids newest first, as the feed orders them."""
+    start = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+    with SessionLocal() as db:
+        store = models.Store(name="Zara", store_type="high_street_chain")
+        db.add(store)
+        db.flush()
+        items = [
+            models.Item(
+                user_id=user_id, store_id=store.id, rating=4, image_status="ready",
+                created_at=start + timedelta(seconds=i // PER_TIMESTAMP),
+            )
+            for i in range(TOTAL)
+        ]
+        db.add_all(items)
+        db.commit()
+        return [item.id for item in sorted(items, key=lambda i: (i.created_at, i.id), reverse=True)]
+
+
+def walk(client, path: str, limit: int):
+    ids, cursor, pages = [], None, 0
+    while True:
+        response = client.get(path, params={"limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        page = [item["id"] for item in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids + page, pages
+        assert len(page) == limit
+        assert pages <= TOTAL, "cursor never ran out"
+        ids += page
+
+
+@pytest.mark.parametrize("limit", [1, 3, 5, TOTAL])
+def test_pages_cover_ties_once_in_order(client, limit):
+    expected = add_items(signup(client, "poster")["id"])
+    ids, pages = walk(client, "/items", limit)
+    assert ids == expected
+    # No empty trailing page, even when TOTAL is a multiple of limit
+    assert pages == -(-TOTAL // limit)
+
+
+def test_last_page_has_no_cursor(client):
+    add_items(signup(client, "poster")["id"])
+    response = client.get("/items", params={"limit": TOTAL})
+    assert len(response.json()) == TOTAL
+    assert "X-Next-Cursor" not in response.headers
+    response = client.get("/items", params={"limit": TOTAL - 1})
+    cursor = response.headers["X-Next-Cursor"]
+    last = client.get("/items", params={"limit": TOTAL, "cursor": cursor})
+    assert len(last.json()) == 1
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_cursor_inside_a_tie(client):
+    expected = add_items(signup(client, "poster")["id"])
+    # Split a group of equal timestamps between two pages
+    first = client.get("/items", params={"limit": PER_TIMESTAMP // 2})
+    created_at, last_id = decode_cursor(first.headers["X-Next-Cursor"])
+    assert last_id == expected[PER_TIMESTAMP // 2 - 1]
+    rest = client.get("/items", params={"limit": TOTAL, "cursor": first.headers["X-Next-Cursor"]})
+    assert [i["id"] for i in rest.json()] == expected[PER_TIMESTAMP // 2:]
+
+
+def test_stream_returns_everything_after_cursor(client):
+    expected = add_items(signup(client, "poster")["id"])
+    response = client.get("/items", params={"stream": "true", "limit": 5})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == expected
+
+    cursor = client.get("/items", params={"limit": 2}).headers["X-Next-Cursor"]
+    response = client.get("/items", params={"stream": "true", "limit": 5, "cursor": cursor})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == expected[2:]
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "e30", encode_cursor(datetime.now(), 1)[:-3] + "!!!"])
+def test_malformed_cursor_is_rejected(client, cursor):
+    reader = signup(client, "reader")
+    assert client.get("/items", params={"cursor": cursor}).status_code == 400
+    assert client.get("/items", params={"cursor": cursor, "stream": "true"}).status_code == 400
+    response = client.get("/items/friends", params={"cursor": cursor}, headers=reader["headers"])
+    assert response.status_code == 400
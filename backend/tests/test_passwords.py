@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+import pytest
+import passwords
+
+
+def run_in_flight(hasher, jobs):
+    """Start `jobs` hashes (1 running, the rest queued) and return once they are submitted."""
+    async def main():
+        tasks = [asyncio.ensure_future(hasher._run("test", time.sleep, 0.3)) for _ in range(jobs)]
+        await asyncio.sleep(0.05)
+        return tasks
+    loop = asyncio.new_event_loop()
+    tasks = loop.run_until_complete(main())
+    return loop, tasks
+
+
+def test_shutdown_with_hashes_in_flight():
+    hasher = passwords.PasswordHasher(workers=1, max_queue=2)
+    loop, tasks = run_in_flight(hasher, 2)
+
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (hasher.shutdown(), done.set()), daemon=True)
+    thread.start()
+    assert done.wait(5), "shutdown hung with a hash in flight"
+    assert loop.run_until_complete(asyncio.gather(*tasks)) == [None, None]
+    stats = hasher.stats()
+    assert (stats["running"], stats["queued"], stats["completed"]) == (0, 0, 2)
+    loop.close()
+
+
+def test_cancelled_queued_hashes_free_their_slots():
+    hasher = passwords.PasswordHasher(workers=1, max_queue=2)
+
+    async def main():
+        running = asyncio.ensure_future(hasher._run("test", time.sleep, 0.3))
+        await asyncio.sleep(0.05)
+        queued = [asyncio.ensure_future(hasher._run("test", time.sleep, 0.3)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(passwords.HasherBusy):
+            await hasher._run("test", time.sleep, 0)
+        for task in queued:
+            task.cancel()
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["queued"] == 0
+        await running
+        return await hasher._run("test", lambda: "ok")
+
+    assert asyncio.run(main()) == "ok"
+    hasher.shutdown()
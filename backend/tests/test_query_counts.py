@@ -0,0 +1,83 @@
+import models
+import timeline
+from db import SessionLocal
+from conftest import signup, follow
+
+# Every list endpoint must issue the same number of SQL statements whatever
+# the number of rows it returns; a count that grows with the rows is an N+1.
+# The counts come from the X-Query-Count header (QUERY_COUNT_DEBUG, set in conftest).
+MANY = 5
+
+
+def query_count(client, path: str, headers=None) -> int:
+    # The first call warms the lookup caches; count the second
+    client.get(path, headers=headers)
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-Query-Count"])
+
+
+def add_items(user_id: int, count: int):
+    with SessionLocal() as db:
+        store = db.query(models.Store).first()
+        if store is None:
+            store = models.Store(name="Zara", store_type="high_street_chain")
+            db.add(store)
+            db.flush()
+        for _ in range(count):
+            item = models.Item(user_id=user_id, store_id=store.id, rating=4, image_status="ready")
+            db.add(item)
+            db.flush()
+            timeline.fan_out(db, item.id)
+        db.commit()
+
+
+def assert_constant(counts):
+    one, many = counts
+    assert one > 0, "no statements counted"
+    assert one == many, f"{one} statements for 1 row, {many} for {MANY}"
+
+
+def test_feed_query_count_is_constant(client):
+    poster = signup(client, "poster")
+    counts = []
+    for total in (1, MANY):
+        add_items(poster["id"], total - len(client.get("/items").json()))
+        assert len(client.get("/items").json()) == total
+        counts.append(query_count(client, "/items"))
+    assert_constant(counts)
+
+
+def test_friends_feed_query_count_is_constant(client):
+    poster, reader = signup(client, "poster"), signup(client, "reader")
+    follow(client, reader, poster)
+    counts = []
+    for total in (1, MANY):
+        add_items(poster["id"], total - len(client.get("/items/friends", headers=reader["headers"]).json()))
+        assert len(client.get("/items/friends", headers=reader["headers"]).json()) == total
+        counts.append(query_count(client, "/items/friends", reader["headers"]))
+    assert_constant(counts)
+
+
+def test_follow_requests_query_count_is_constant(client):
+    target = signup(client, "target")
+    requesters = [signup(client, f"requester{i}") for i in range(MANY)]
+    counts = []
+    for batch in (requesters[:1], requesters[1:]):
+        for requester in batch:
+            client.post("/follow", json={"target_username": "target"}, headers=requester["headers"])
+        counts.append(query_count(client, "/follow_requests", target["headers"]))
+    assert len(client.get("/follow_requests", headers=target["headers"]).json()) == MANY
+    assert_constant(counts)
+
+
+def test_sent_follow_requests_query_count_is_constant(client):
+    requester = signup(client, "requester")
+    targets = [signup(client, f"target{i}") for i in range(MANY)]
+    counts = []
+    for batch in (targets[:1], targets[1:]):
+        for target in batch:
+            client.post("/follow", json={"target_username": target["username"]}, headers=requester["headers"])
+        counts.append(query_count(client, "/follow_requests/sent", requester["headers"]))
+    assert len(client.get("/follow_requests/sent", headers=requester["headers"]).json()) == MANY
+    assert_constant(counts)
@@ -0,0 +1,111 @@
+import pytest
+import models
+import stores
+from db import SessionLocal
+
+NAMES = ["Zara", "Big Mart", "Walmart", "Mart & Co", "100% Cotton", "A_B Store", "AxB Store"]
+
+
+@pytest.fixture
+def catalogue(client):
+    for name in NAMES:
+        assert client.post("/stores", json={"name": name, "store_type": "boutique"}).status_code == 200
+    return client
+
+
+@pytest.fixture(params=["fts", "like"])
+def search(request, catalogue, monkeypatch):
+    """/stores/search through SQLite FTS5, or through the ILIKE fallback."""
+    monkeypatch.setattr(stores, "_fts_ready", request.param == "fts")
+
+    def run(q, **params):
+        response = catalogue.get("/stores/search", params={"q": q, **params})
+        assert response.status_code == 200, response.text
+        return [s["name"] for s in response.json()]
+
+    run.mode = request.param
+    return run
+
+
+def test_fts_index_exists(client):
+    with SessionLocal() as db:
+        assert stores._has_fts(db)
+
+
+def test_prefix_matches_come_first(search):
+    assert search("za") == ["Zara"]
+    # "Mart & Co" by prefix, then names with a word starting "mart"
+    names = search("mart")
+    assert names[:2] == ["Mart & Co", "Big Mart"]
+    # FTS matches word prefixes; the fallback any substring
+    assert names[2:] == ([] if search.mode == "fts" else ["Walmart"])
+
+
+def test_query_whitespace_and_case_are_normalized(search):
+    assert search("  BIG   mart ") == ["Big Mart"]
+
+
+@pytest.mark.parametrize("q, fts, like", [
+    # LIKE wildcards match only themselves
+    ("%", [], ["100% Cotton"]),
+    ("_", [], ["A_B Store"]),
+    ("a_b", ["A_B Store"], ["A_B Store"]),
+    ("100%", ["100% Cotton"], ["100% Cotton"]),
+    # FTS query syntax is never passed through
+    ('"', [], []),
+    ("co*", ["100% Cotton", "Mart & Co"], []),
+    ("&", [], ["Mart & Co"]),
+])
+def test_special_characters_are_literal(search, q, fts, like):
+    # Ordered by relevance, which ties here
+    assert sorted(search(q)) == sorted(fts if search.mode == "fts" else like)
+
+
+def test_limit(search):
+    assert len(search("a", limit=2)) == 2
+
+
+def test_blank_query_finds_nothing(catalogue):
+    assert catalogue.get("/stores/search", params={"q": "   "}).json() == []
+    assert catalogue.get("/stores/search", params={"q": ""}).status_code == 422
+
+
+def test_renamed_store_is_reindexed(catalogue, monkeypatch):
+    monkeypatch.setattr(stores, "_fts_ready", True)
+    with SessionLocal() as db:
+        store = db.query(models.Store).filter_by(name="Big Mart").one()
+        store.name, store.name_key = "Big Bazaar", models.normalize_store_name("Big Bazaar")
+        db.commit()
+    assert [s["name"] for s in catalogue.get("/stores/search", params={"q": "bazaar"}).json()] == ["Big Bazaar"]
+    assert "Big Bazaar" not in [s["name"] for s in catalogue.get("/stores/search", params={"q": "mart"}).json()]
+
+
+@pytest.mark.parametrize("name", ["zara", "ZARA", "  Zara ", "Za ra", "za\tra"])
+def test_get_or_create_matches_case_and_whitespace(catalogue, name):
+    with SessionLocal() as db:
+        zara = db.query(models.Store).filter_by(name="Zara").one().id
+        store_id, created = stores.get_or_create(db, name, "boutique")
+        db.commit()
+        if models.normalize_store_name(name) == "zara":
+            assert (store_id, created) == (zara, False)
+        else:
+            # Inner whitespace splits words: a different store
+            assert created and store_id != zara
+        assert db.query(models.Store).filter(models.Store.name_key == "zara").count() == 1
+
+
+def test_get_or_create_many_dedupes(client):
+    with SessionLocal() as db:
+        ids, created = stores.get_or_create_many(db, [("Uniqlo", "boutique"), (" uniqlo", "boutique"), ("COS", "boutique")])
+        db.commit()
+        assert created == 2
+        assert set(ids) == {"uniqlo", "cos"}
+        again, created = stores.get_or_create_many(db, [("UNIQLO", "boutique")])
+        assert (again, created) == ({"uniqlo": ids["uniqlo"]}, 0)
+
+
+@pytest.mark.parametrize("name", ["zara", " ZARA  "])
+def test_create_store_rejects_same_name(catalogue, name):
+    response = catalogue.post("/stores", json={"name": name, "store_type": "boutique"})
+    assert response.status_code == 400
+    assert [s["name"] for s in catalogue.get("/stores").json()].count("Zara") == 1
@@ -0,0 +1,105 @@
+import models
+import timeline
+from db import SessionLocal
+from conftest import signup, follow
+
+
+def add_items(user_id: int, count: int) -> list:
+    """Posts `count` items the way create_item does; returns their ids."""
+    with SessionLocal() as db:
+        store = db.query(models.Store).first()
+        if store is None:
+            store = models.Store(name="Zara", store_type="high_street_chain")
+            db.add(store)
+            db.flush()
+        ids = []
+        for _ in range(count):
+            item = models.Item(user_id=user_id, store_id=store.id, rating=4, image_status="ready")
+            db.add(item)
+            db.flush()
+            timeline.fan_out(db, item.id)
+            ids.append(item.id)
+        db.commit()
+        return ids
+
+
+def friends_feed(client, user: dict, **params) -> list:
+    response = client.get("/items/friends", params=params, headers=user["headers"])
+    assert response.status_code == 200, response.text
+    return [item["id"] for item in response.json()]
+
+
+def unfollow(client, follower: dict, target: dict):
+    response = client.post("/unfollow", json={"target_username": target["username"]}, headers=follower["headers"])
+    assert response.status_code == 200, response.text
+
+
+def test_follow_backfills_and_new_items_fan_out(client):
+    poster, other, reader = signup(client, "poster"), signup(client, "other"), signup(client, "reader")
+    earlier = add_items(poster["id"], 3)
+    add_items(other["id"], 2)
+    assert friends_feed(client, reader) == []
+
+    follow(client, reader, poster)
+    assert sorted(friends_feed(client, reader)) == earlier
+
+    later = add_items(poster["id"], 2)
+    add_items(other["id"], 1)
+    assert friends_feed(client, reader)[:2] == later[::-1]
+    assert sorted(friends_feed(client, reader)) == earlier + later
+
+
+def test_unfollow_prunes_only_that_author(client):
+    first, second, reader = signup(client, "first"), signup(client, "second"), signup(client, "reader")
+    follow(client, reader, first)
+    follow(client, reader, second)
+    add_items(first["id"], 2)
+    kept = add_items(second["id"], 2)
+
+    unfollow(client, reader, first)
+    assert sorted(friends_feed(client, reader)) == kept
+    # Posts after the unfollow don't come back either
+    add_items(first["id"], 1)
+    assert sorted(friends_feed(client, reader)) == kept
+    with SessionLocal() as db:
+        assert db.query(models.TimelineEntry).filter_by(user_id=reader["id"], author_id=first["id"]).count() == 0
+
+    # Following again backfills everything, including what was posted meanwhile
+    follow(client, reader, first)
+    assert len(friends_feed(client, reader)) == 5
+
+
+def test_friends_feed_pages(client):
+    poster, reader = signup(client, "poster"), signup(client, "reader")
+    follow(client, reader, poster)
+    expected = add_items(poster["id"], 7)[::-1]
+
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/items/friends", params=params, headers=reader["headers"])
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert len(ids) < len(expected), "cursor never ran out"
+    assert ids == expected
+
+
+def test_rebuild_matches_incremental_timelines(client):
+    poster, other, reader = signup(client, "poster"), signup(client, "other"), signup(client, "reader")
+    add_items(poster["id"], 2)
+    follow(client, reader, poster)
+    follow(client, other, poster)
+    follow(client, reader, other)
+    add_items(other["id"], 2)
+    add_items(poster["id"], 1)
+
+    def entries(db):
+        return sorted(db.query(models.TimelineEntry.user_id, models.TimelineEntry.item_id).all())
+
+    with SessionLocal() as db:
+        incremental = entries(db)
+        timeline.rebuild(db)
+        db.commit()
+        assert entries(db) == incremental
@@ -0,0 +1,18 @@
+import pytest
+import tokens
+
+
+def test_round_trip():
+    user = tokens.decode_token(tokens.issue_token(7, "alice"))
+    assert user == tokens.TokenUser(id=7, username="alice")
+
+
+@pytest.mark.parametrize("token", ["x.é", "é.é", "nodot", "a.b.c"])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(ValueError):
+        tokens.decode_token(token)
+
+
+def test_non_ascii_tokens_get_401(client):
+    assert client.get("/events", params={"token": "x.é"}).status_code == 401
+    assert client.get("/follow_requests", headers={"Authorization": "Bearer x.é".encode()}).status_code == 401
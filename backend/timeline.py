@@ -0,0 +1,68 @@
+from sqlalchemy import select, insert, delete, literal
+from sqlalchemy.orm import Session
+import models
+
+# Friends feeds are materialized per follower: every write fans an item out
+# to each follower's timeline, so reading a feed is a range scan on
+# (user_id, created_at, item_id). None of these helpers commit.
+
+_TIMELINE_COLUMNS = ["user_id", "item_id", "author_id", "created_at"]
+
+
+def fan_out(db: Session, item_id: int):
+    """Append a freshly flushed item to the timeline of everyone following its owner."""
+    fan_out_many(db, [item_id])
+
+
+def fan_out_many(db: Session, item_ids):
+    """fan_out for a batch of items in one statement (bulk imports)."""
+    Item = models.Item
+    rows = (
+        select(models.follows.c.follower_id, Item.id, Item.user_id, Item.created_at)
+        .select_from(models.follows.join(Item, Item.user_id == models.follows.c.followed_id))
+        .where(Item.id.in_(item_ids))
+    )
+    db.execute(insert(models.TimelineEntry).from_select(_TIMELINE_COLUMNS, rows))
+
+
+def backfill(db: Session, follower_id: int, followed_id: int):
+    """Copy all of followed_id's existing items into follower_id's timeline."""
+    Item = models.Item
+    rows = select(literal(follower_id), Item.id, Item.user_id, Item.created_at).where(
+        Item.user_id == followed_id
+    )
+    db.execute(insert(models.TimelineEntry).from_select(_TIMELINE_COLUMNS, rows))
+
+
+def prune(db: Session, follower_id: int, followed_id: int):
+    """Drop followed_id's items from follower_id's timeline."""
+    db.execute(
+        delete(models.TimelineEntry).where(
+            models.TimelineEntry.user_id == follower_id,
+            models.TimelineEntry.author_id == followed_id,
+        )
+    )
+
+
+def rebuild(db: Session):
+    """Recompute every timeline from the follow graph (for existing databases)."""
+    Item = models.Item
+    db.execute(delete(models.TimelineEntry))
+    rows = select(
+        models.follows.c.follower_id, Item.id, Item.user_id, Item.created_at
+    ).select_from(models.follows.join(Item, Item.user_id == models.follows.c.followed_id))
+    db.execute(insert(models.TimelineEntry).from_select(_TIMELINE_COLUMNS, rows))
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+    import migrate
+
+    migrate.upgrade()
+    session = SessionLocal()
+    try:
+        rebuild(session)
+        session.commit()
+        print("Timelines rebuilt")
+    finally:
+        session.close()
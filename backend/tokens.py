@@ -0,0 +1,93 @@
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+# Stateless session tokens: base64url(payload).base64url(HMAC-SHA256(payload)).
+# Verifying one needs only the secret, never the database.
+TOKEN_TTL_SECONDS = int(os.environ.get("AUTH_TOKEN_TTL_SECONDS", 30 * 24 * 3600))
+
+
+class TokenUser(NamedTuple):
+    id: int
+    username: str
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@functools.lru_cache(maxsize=None)
+def _secret() -> bytes:
+    """AUTH_SECRET, read on first use so importing the app logs nothing."""
+    secret = os.environ.get("AUTH_SECRET")
+    if not secret:
+        # Tokens won't survive restarts or work across workers; fine for local dev only
+        logging.warning("AUTH_SECRET is not set, using a random per-process secret")
+        secret = secrets.token_urlsafe(32)
+    return secret.encode()
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, username: str) -> str:
+    payload = _b64encode(json.dumps(
+        {"uid": user_id, "usr": username, "exp": int(time.time()) + TOKEN_TTL_SECONDS}
+    ).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str) -> TokenUser:
+    """Checks signature and expiry. Raises ValueError if either fails."""
+    try:
+        payload, signature = token.split(".")
+    except ValueError:
+        raise ValueError("Malformed token")
+
+    # As bytes: compare_digest raises TypeError on non-ASCII str
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        raise ValueError("Bad signature")
+
+    data = json.loads(_b64decode(payload))
+    if data["exp"] < time.time():
+        raise ValueError("Token expired")
+    return TokenUser(id=data["uid"], username=data["usr"])
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> TokenUser:
+    """Dependency: the caller identified by their `Authorization: Bearer <token>` header."""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return decode_token(credentials.credentials)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+
+def stream_user(
+    token: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)
+) -> TokenUser:
+    """
+    Like current_user, but also takes the token as ?token=, since the browser's
+    EventSource can't set headers. Only for streams: URLs end up in access logs.
+    """
+    if credentials is None and token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return current_user(credentials)
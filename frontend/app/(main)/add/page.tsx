@@ -1,7 +1,8 @@
 "use client";
-import { useState } from "react";
+import { useState, useEffect } from "react";
 import { useAuth } from "@/context/AuthContext";
-import { createItem } from "@/lib/api";
+import { createItem, searchStores } from "@/lib/api";
+import { Store } from "@/lib/types";
 import { useRouter } from "next/navigation";
 import { Loader2, Camera } from "lucide-react"; // MapPin removed, inside component now
 import LocationSearch from "@/components/LocationSearch"; // Import new component
@@ -15,6 +16,20 @@ export default function AddPage() {
   // Form State
   const [storeName, setStoreName] = useState("");
   const [storeType, setStoreType] = useState("department_store");
+  const [storeSuggestions, setStoreSuggestions] = useState<Store[]>([]);
+
+  // Autocomplete existing stores as the name is typed
+  useEffect(() => {
+    const query = storeName.trim();
+    if (!query) {
+      setStoreSuggestions([]);
+      return;
+    }
+    const timer = setTimeout(() => {
+      searchStores(query).then(setStoreSuggestions);
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [storeName]);
 
   // NEW LOCATION STATE
   const [locationName, setLocationName] = useState("");
@@ -150,9 +165,19 @@ export default function AddPage() {
                 className="w-full rounded-2xl bg-stone-50 px-4 py-3 text-stone-900 placeholder:text-stone-400
                            border border-stone-200 outline-none focus:bg-white focus:ring-4 focus:ring-stone-200/60"
                 value={storeName}
-                onChange={(e) => setStoreName(e.target.value)}
+                onChange={(e) => {
+                  setStoreName(e.target.value);
+                  const match = storeSuggestions.find((s) => s.name === e.target.value);
+                  if (match) setStoreType(match.store_type);
+                }}
+                list="store-suggestions"
                 required
               />
+              <datalist id="store-suggestions">
+                {storeSuggestions.map((s) => (
+                  <option key={s.id} value={s.name} />
+                ))}
+              </datalist>
             </div>
 
             <div className="space-y-2">
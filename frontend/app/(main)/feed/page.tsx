@@ -1,6 +1,6 @@
 "use client";
 import { useEffect, useState } from "react";
-import { getFriendsFeed, getImageUrl } from "@/lib/api";
+import { getFriendsFeed, getImageUrl, subscribeEvents } from "@/lib/api";
 import { Item } from "@/lib/types";
 import Image from "next/image";
 import { MapPin } from "lucide-react";
@@ -10,20 +10,57 @@ export default function FeedPage() {
   const { user } = useAuth();
   const [items, setItems] = useState<Item[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  const showFirstPage = (page: { items: Item[]; nextCursor: string | null }) => {
+    setItems(page.items);
+    setNextCursor(page.nextCursor);
+  };
+
+  const loadMore = async () => {
+    if (!user?.token || !nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await getFriendsFeed(user.token, nextCursor);
+      // Skip items already shown (pushed live while paging)
+      setItems((prev) => [...prev, ...page.items.filter((i) => !prev.some((p) => p.id === i.id))]);
+      setNextCursor(page.nextCursor);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
-    if (!user) {
+    if (!user?.token) {
       setItems([]);
       setLoading(false);
       return;
     }
 
     setLoading(true);
-    getFriendsFeed(user.username)
-      .then(setItems)
+    getFriendsFeed(user.token)
+      .then(showFirstPage)
       .finally(() => setLoading(false));
   }, [user]);
 
+  useEffect(() => {
+    if (!user?.token) return;
+    const token = user.token;
+    return subscribeEvents(token, {
+      // New posts go on top; an item sent again (its image is ready) is replaced in place
+      onItem: (item) =>
+        setItems((prev) =>
+          prev.some((i) => i.id === item.id)
+            ? prev.map((i) => (i.id === item.id ? item : i))
+            : [item, ...prev]
+        ),
+      onReset: () => {
+        getFriendsFeed(token).then(showFirstPage);
+      },
+    });
+  }, [user]);
+
   // Helper to pick pastel colors based on store type
   const getTagColor = (type: string) => {
     if (type.includes("luxury")) return "bg-pastel-purple text-purple-700";
@@ -49,7 +86,7 @@ export default function FeedPage() {
 
             <div className="relative aspect-square w-full bg-pastel-gray">
               <Image
-                src={getImageUrl(item.image_path)}
+                src={getImageUrl(item.image_variants?.card ?? item.image_path)}
                 alt="Clothing item"
                 fill
                 className="object-cover transition-transform duration-500 group-hover:scale-105"
@@ -81,6 +118,19 @@ export default function FeedPage() {
         ))}
       </div>
 
+      {nextCursor && (
+        <div className="text-center">
+          <button
+            type="button"
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="bg-white border border-stone-200 text-primary px-4 py-2 rounded-xl text-sm font-semibold"
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        </div>
+      )}
+
       {items.length === 0 && (
         <div className="text-center py-20 opacity-50">
           <p>No friends’ items yet.</p>
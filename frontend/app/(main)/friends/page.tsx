@@ -1,7 +1,7 @@
 "use client";
 import { useState, useEffect } from "react";
 import { useAuth } from "@/context/AuthContext";
-import { acceptFollowRequest, cancelFollowRequest, followUser, getFollowRequests, getFollowers, getFollowing, getSentFollowRequests, rejectFollowRequest, unfollowUser } from "@/lib/api";
+import { acceptFollowRequest, cancelFollowRequest, followUser, getFollowRequests, getFollowers, getFollowing, getSentFollowRequests, rejectFollowRequest, subscribeEvents, unfollowUser } from "@/lib/api";
 import { FollowRequest, User } from "@/lib/types";
 import Link from "next/link";
 
@@ -27,33 +27,58 @@ export default function FriendsPage() {
     }
   }, [user]);
 
+  // Requests sent to or by us change as the other side acts on them
+  useEffect(() => {
+    if (!user?.token) return;
+    return subscribeEvents(user.token, {
+      onFollowRequest: (req) => {
+        const incoming = req.target_username === user.username;
+        const setList = incoming ? setRequests : setSentRequests;
+        setList((prev) => {
+          const rest = prev.filter((r) => r.id !== req.id);
+          return req.status === "pending" ? [req, ...rest] : rest;
+        });
+        if (req.status === "accepted") {
+          if (incoming) loadFollowers();
+          else loadFollowing();
+        }
+      },
+      onReset: () => {
+        loadFollowing();
+        loadFollowers();
+        loadRequests();
+        loadSentRequests();
+      },
+    });
+  }, [user]);
+
   const loadFollowing = async () => {
-    if (!user) return;
-    const data = await getFollowing(user.username);
+    if (!user?.token) return;
+    const data = await getFollowing(user.token);
     setFollowing(data);
   };
 
   const loadFollowers = async () => {
-    if (!user) return;
-    const data = await getFollowers(user.username);
+    if (!user?.token) return;
+    const data = await getFollowers(user.token);
     setFollowers(data);
   };
 
   const loadRequests = async () => {
-    if (!user) return;
-    const data = await getFollowRequests(user.username);
+    if (!user?.token) return;
+    const data = await getFollowRequests(user.token);
     setRequests(data);
   };
 
   const loadSentRequests = async () => {
-    if (!user) return;
-    const data = await getSentFollowRequests(user.username);
+    if (!user?.token) return;
+    const data = await getSentFollowRequests(user.token);
     setSentRequests(data);
   };
 
   const handleFollow = async (e: React.FormEvent) => {
     e.preventDefault();
-    if (!user || !targetUsername) return;
+    if (!user?.token || !targetUsername) return;
 
     if (targetUsername.trim().toLowerCase() === user.username.toLowerCase()) {
       setMessage("You cannot follow yourself.");
@@ -64,7 +89,7 @@ export default function FriendsPage() {
     setMessage("");
 
     try {
-      await followUser(user.username, targetUsername);
+      await followUser(user.token, targetUsername);
       setMessage(`Follow request sent to ${targetUsername}`);
       setTargetUsername("");
       loadSentRequests();
@@ -76,15 +101,15 @@ export default function FriendsPage() {
   };
 
   const handleUnfollow = async (username: string) => {
-    if (!user) return;
-    await unfollowUser(user.username, username);
+    if (!user?.token) return;
+    await unfollowUser(user.token, username);
     setFollowing((prev) => prev.filter((f) => f.username !== username));
   };
 
   const handleAccept = async (requestId: number) => {
-    if (!user) return;
+    if (!user?.token) return;
     const accepted = requests.find((req) => req.id === requestId);
-    await acceptFollowRequest(requestId, user.username);
+    await acceptFollowRequest(requestId, user.token);
     setRequests((prev) => prev.filter((req) => req.id !== requestId));
     if (accepted) {
       setFollowers((prev) => {
@@ -98,14 +123,14 @@ export default function FriendsPage() {
   };
 
   const handleReject = async (requestId: number) => {
-    if (!user) return;
-    await rejectFollowRequest(requestId, user.username);
+    if (!user?.token) return;
+    await rejectFollowRequest(requestId, user.token);
     setRequests((prev) => prev.filter((req) => req.id !== requestId));
   };
 
   const handleCancel = async (requestId: number) => {
-    if (!user) return;
-    await cancelFollowRequest(requestId, user.username);
+    if (!user?.token) return;
+    await cancelFollowRequest(requestId, user.token);
     setSentRequests((prev) => prev.filter((req) => req.id !== requestId));
   };
 
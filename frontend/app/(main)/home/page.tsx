@@ -1,7 +1,7 @@
 "use client";
 import { useEffect, useState } from "react";
 import { useAuth } from "@/context/AuthContext";
-import { getFeed } from "@/lib/api";
+import { getUserItems } from "@/lib/api";
 import { Item } from "@/lib/types";
 import Link from "next/link";
 
@@ -21,9 +21,7 @@ export default function HomePage() {
 
   useEffect(() => {
     if (user) {
-      getFeed().then((feedData) => {
-        setItems(feedData.filter((i) => i.user_id === user.id));
-      });
+      getUserItems(user.id).then(setItems);
     }
   }, [user]);
 
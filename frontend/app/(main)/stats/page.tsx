@@ -1,7 +1,7 @@
 "use client";
 import { useEffect, useMemo, useState } from "react";
 import { useAuth } from "@/context/AuthContext";
-import { compareStores, getFeed, getImageUrl, getRankings } from "@/lib/api";
+import { compareStores, getUserItems, getImageUrl, getRankings } from "@/lib/api";
 import { Item, StoreRanking } from "@/lib/types";
 import Link from "next/link";
 import Image from "next/image";
@@ -24,9 +24,7 @@ export default function StatsPage() {
   useEffect(() => {
     if (user) {
       getRankings(user.id).then(setRankings);
-      getFeed().then((feedData) => {
-        setItems(feedData.filter((i) => i.user_id === user.id));
-      });
+      getUserItems(user.id).then(setItems);
     }
   }, [user]);
 
@@ -177,7 +175,7 @@ export default function StatsPage() {
               <div key={item.id} className="group relative bg-white rounded-3xl overflow-hidden shadow-sm hover:shadow-xl transition-all duration-300 border border-stone-50">
                 <div className="relative aspect-square w-full bg-pastel-gray">
                   <Image
-                    src={getImageUrl(item.image_path)}
+                    src={getImageUrl(item.image_variants?.card ?? item.image_path)}
                     alt="Clothing item"
                     fill
                     className="object-cover transition-transform duration-500 group-hover:scale-105"
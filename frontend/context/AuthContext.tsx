@@ -18,7 +18,10 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     const stored = localStorage.getItem("fc_user");
     if (stored) {
       try {
-        setUser(JSON.parse(stored));
+        const parsed: User = JSON.parse(stored);
+        // Sessions saved before tokens existed have to log in again
+        if (parsed.token) setUser(parsed);
+        else localStorage.removeItem("fc_user");
       } catch {
         localStorage.removeItem("fc_user");
       }
@@ -1,7 +1,12 @@
-import { User, Item, StoreRanking, FollowRequest } from "./types";
+import { User, Item, Store, StoreRanking, FollowRequest } from "./types";
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
 
+// Endpoints that act as the logged-in user identify them by the token from /auth
+function authHeaders(token: string): Record<string, string> {
+  return { Authorization: `Bearer ${token}` };
+}
+
 // --- AUTH ---
 export async function loginOrCreate(username: string): Promise<User> {
   const res = await fetch(`${API_URL}/auth`, {
@@ -33,9 +38,36 @@ export async function getFeed(): Promise<Item[]> {
   return res.json();
 }
 
-export async function getFriendsFeed(username: string): Promise<Item[]> {
-  const res = await fetch(`${API_URL}/items/friends?username=${encodeURIComponent(username)}`);
+// All of a user's items, following X-Next-Cursor page by page
+export async function getUserItems(userId: number): Promise<Item[]> {
+  const items: Item[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ user_id: String(userId), limit: "200" });
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`${API_URL}/items?${params}`);
+    if (!res.ok) throw new Error("Failed to fetch items");
+    items.push(...(await res.json()));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return items;
+}
+
+// One page of the friends feed; pass nextCursor back to get the next one
+export async function getFriendsFeed(
+  token: string,
+  cursor?: string | null
+): Promise<{ items: Item[]; nextCursor: string | null }> {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+  const res = await fetch(`${API_URL}/items/friends${query}`, { headers: authHeaders(token) });
   if (!res.ok) throw new Error("Failed to fetch friends feed");
+  return { items: await res.json(), nextCursor: res.headers.get("X-Next-Cursor") };
+}
+
+// --- STORES ---
+export async function searchStores(query: string): Promise<Store[]> {
+  const res = await fetch(`${API_URL}/stores/search?q=${encodeURIComponent(query)}`);
+  if (!res.ok) return [];
   return res.json();
 }
 
@@ -55,74 +87,99 @@ export async function createItem(formData: FormData): Promise<Item> {
 }
 
 // --- FRIENDS ---
-export async function followUser(follower: string, target: string) {
+export async function followUser(token: string, target: string) {
   const res = await fetch(`${API_URL}/follow`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ follower_username: follower, target_username: target }),
+    headers: { "Content-Type": "application/json", ...authHeaders(token) },
+    body: JSON.stringify({ target_username: target }),
   });
   if (!res.ok) throw new Error("Failed to follow");
   return res.json();
 }
 
-export async function unfollowUser(follower: string, target: string) {
+export async function unfollowUser(token: string, target: string) {
   const res = await fetch(`${API_URL}/unfollow`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ follower_username: follower, target_username: target }),
+    headers: { "Content-Type": "application/json", ...authHeaders(token) },
+    body: JSON.stringify({ target_username: target }),
   });
   if (!res.ok) throw new Error("Failed to unfollow");
   return res.json();
 }
 
-export async function getFollowRequests(username: string): Promise<FollowRequest[]> {
-  const res = await fetch(`${API_URL}/follow_requests?username=${encodeURIComponent(username)}`);
+export async function getFollowRequests(token: string): Promise<FollowRequest[]> {
+  const res = await fetch(`${API_URL}/follow_requests`, { headers: authHeaders(token) });
   if (!res.ok) return [];
   return res.json();
 }
 
-export async function getSentFollowRequests(username: string): Promise<FollowRequest[]> {
-  const res = await fetch(`${API_URL}/follow_requests/sent?username=${encodeURIComponent(username)}`);
+export async function getSentFollowRequests(token: string): Promise<FollowRequest[]> {
+  const res = await fetch(`${API_URL}/follow_requests/sent`, { headers: authHeaders(token) });
   if (!res.ok) return [];
   return res.json();
 }
 
-export async function acceptFollowRequest(requestId: number, username: string) {
-  const res = await fetch(`${API_URL}/follow_requests/${requestId}/accept?username=${encodeURIComponent(username)}`, {
+export async function acceptFollowRequest(requestId: number, token: string) {
+  const res = await fetch(`${API_URL}/follow_requests/${requestId}/accept`, {
     method: "POST",
+    headers: authHeaders(token),
   });
   if (!res.ok) throw new Error("Failed to accept request");
   return res.json();
 }
 
-export async function rejectFollowRequest(requestId: number, username: string) {
-  const res = await fetch(`${API_URL}/follow_requests/${requestId}/reject?username=${encodeURIComponent(username)}`, {
+export async function rejectFollowRequest(requestId: number, token: string) {
+  const res = await fetch(`${API_URL}/follow_requests/${requestId}/reject`, {
     method: "POST",
+    headers: authHeaders(token),
   });
   if (!res.ok) throw new Error("Failed to reject request");
   return res.json();
 }
 
-export async function cancelFollowRequest(requestId: number, username: string) {
-  const res = await fetch(`${API_URL}/follow_requests/${requestId}/cancel?username=${encodeURIComponent(username)}`, {
+export async function cancelFollowRequest(requestId: number, token: string) {
+  const res = await fetch(`${API_URL}/follow_requests/${requestId}/cancel`, {
     method: "POST",
+    headers: authHeaders(token),
   });
   if (!res.ok) throw new Error("Failed to cancel request");
   return res.json();
 }
 
-export async function getFollowing(username: string): Promise<User[]> {
-  const res = await fetch(`${API_URL}/users/${username}/following`);
+export async function getFollowing(token: string): Promise<User[]> {
+  const res = await fetch(`${API_URL}/me/following`, { headers: authHeaders(token) });
   if (!res.ok) return [];
   return res.json();
 }
 
-export async function getFollowers(username: string): Promise<User[]> {
-  const res = await fetch(`${API_URL}/users/${username}/followers`);
+export async function getFollowers(token: string): Promise<User[]> {
+  const res = await fetch(`${API_URL}/me/followers`, { headers: authHeaders(token) });
   if (!res.ok) return [];
   return res.json();
 }
 
+// --- REAL-TIME ---
+// Pushes for the logged-in user instead of polling. EventSource reconnects by
+// itself and the server resumes after the last event it got; "reset" means
+// events were missed and the lists should be refetched.
+export function subscribeEvents(
+  token: string,
+  handlers: {
+    onItem?: (item: Item) => void;
+    onFollowRequest?: (request: FollowRequest) => void;
+    onReset?: () => void;
+  }
+): () => void {
+  // EventSource can't set headers, so the token goes in the URL
+  const source = new EventSource(`${API_URL}/events?token=${encodeURIComponent(token)}`);
+  source.addEventListener("item", (e) => handlers.onItem?.(JSON.parse((e as MessageEvent).data)));
+  source.addEventListener("follow_request", (e) =>
+    handlers.onFollowRequest?.(JSON.parse((e as MessageEvent).data))
+  );
+  source.addEventListener("reset", () => handlers.onReset?.());
+  return () => source.close();
+}
+
 // --- STATS ---
 export async function getRankings(userId: number): Promise<StoreRanking[]> {
   const res = await fetch(`${API_URL}/store_rankings?user_id=${userId}`);
@@ -144,8 +201,23 @@ export async function compareStores(userId: number, winnerStoreId: number, loser
   return res.json();
 }
 
+export async function compareStoresBatch(
+  userId: number,
+  comparisons: { winner_store_id: number; loser_store_id: number }[]
+) {
+  const res = await fetch(`${API_URL}/compare_store/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ user_id: userId, comparisons }),
+  });
+  if (!res.ok) throw new Error("Failed to compare stores");
+  return res.json();
+}
+
 // Helper to construct full image URL
-export const getImageUrl = (path: string) => {
+export const getImageUrl = (path: string | null) => {
+  // Images upload in the background; show the app icon until one is ready
+  if (!path) return "/icons/icon-192x192.png";
   // If backend returns "uploads/file.jpg", prepend host
   if (path.startsWith("http")) return path;
   return `${API_URL}/${path}`;
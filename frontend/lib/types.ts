@@ -1,6 +1,7 @@
 export interface User {
   id: number;
   username: string;
+  token?: string; // signed session token from /auth
 }
 
 export interface Store {
@@ -26,7 +27,9 @@ export interface Item {
   id: number;
   user_id: number;
   store_id: number;
-  image_path: string;
+  image_path: string | null;
+  image_status: "pending" | "ready" | "failed";
+  image_variants?: { full: string; card: string; thumb: string; [name: string]: string } | null;
   location_text?: string;
 
   // NEW